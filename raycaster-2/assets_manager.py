@@ -1,23 +1,61 @@
 # assets_manager.py
 import pyray as pr
+import numpy as np
 import os
 import config
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 class AssetsManager:
-    def __init__(self):
+    def __init__(self, use_gpu: bool = True, keep_pixels: bool = False):
+        # use_gpu=False skips every GPU upload (no window/GL context needed);
+        # keep_pixels keeps an RGBA NumPy copy of each image for the software renderer
+        self.use_gpu = use_gpu
+        self.keep_pixels = keep_pixels or not use_gpu
         self.wall_textures: Dict[int, pr.Texture2D] = {}
         self.sprite_textures: Dict[str, List[pr.Texture2D]] = {} # e.g., {"WinterGuard": [tex1, tex2...]}
         self.error_texture: Optional[pr.Texture2D] = None
+        # CPU-side pixels, HxWx4 uint8 (only filled when keep_pixels is set)
+        self.wall_pixels: Dict[int, np.ndarray] = {}
+        self.sprite_pixels: Dict[str, List[np.ndarray]] = {}
+        self.error_pixels: Optional[np.ndarray] = None
         self._create_error_texture()
 
     def _create_error_texture(self):
         """Creates a fallback texture for missing assets."""
         img = pr.gen_image_checked(config.TEXTURE_SIZE, config.TEXTURE_SIZE, 16, 16, pr.PINK, pr.BLACK)
-        self.error_texture = pr.load_texture_from_image(img)
+        if self.keep_pixels:
+            self.error_pixels = self._image_to_pixels(img)
+        if self.use_gpu:
+            self.error_texture = pr.load_texture_from_image(img)
         pr.unload_image(img)
         print("Generated error texture.")
 
+    @staticmethod
+    def _image_to_pixels(image) -> np.ndarray:
+        """Copies an image into an HxWx4 uint8 RGBA array."""
+        pr.image_format(image, pr.PixelFormat.PIXELFORMAT_UNCOMPRESSED_R8G8B8A8)
+        data = pr.ffi.buffer(image.data, image.width * image.height * 4)
+        return np.frombuffer(data, dtype=np.uint8).reshape(image.height, image.width, 4).copy()
+
+    def _load_image_file(self, filepath: str) -> Tuple[Optional[pr.Texture2D], Optional[np.ndarray]]:
+        """Loads an image file as a GPU texture and/or pixel array. Either is None on failure or if not wanted."""
+        image = pr.load_image(filepath)
+        if image.data == pr.ffi.NULL:
+            return None, None
+        pixels = self._image_to_pixels(image) if self.keep_pixels else None
+        texture = None
+        if self.use_gpu:
+            texture = pr.load_texture_from_image(image)
+            if texture.id == 0: # Check if uploading failed
+                texture = None
+        pr.unload_image(image)
+        return texture, pixels
+
+    def _loaded_ok(self, texture: Optional[pr.Texture2D], pixels: Optional[np.ndarray]) -> bool:
+        if self.use_gpu and texture is None:
+            return False
+        return not (self.keep_pixels and pixels is None)
+
     def load_assets(self, assets_dir: str = "assets"):
         """Loads all wall and sprite textures."""
         print("Loading assets...")
@@ -37,14 +75,19 @@ class AssetsManager:
                     wall_id_str = filename.split('_')[1].split('.')[0]
                     wall_id = int(wall_id_str)
                     filepath = os.path.join(textures_path, filename)
-                    texture = pr.load_texture(filepath)
-                    if texture.id == 0: # Check if loading failed
+                    texture, pixels = self._load_image_file(filepath)
+                    if not self._loaded_ok(texture, pixels): # Check if loading failed
                          print(f" Warning: Failed to load texture: {filepath}. Using error texture.")
                          self.wall_textures[wall_id] = self.error_texture
+                         if self.keep_pixels:
+                             self.wall_pixels[wall_id] = self.error_pixels
                     else:
-                         self.wall_textures[wall_id] = texture
-                         pr.gen_texture_mipmaps(self.wall_textures[wall_id])
-                         pr.set_texture_filter(self.wall_textures[wall_id], pr.TextureFilter.TEXTURE_FILTER_TRILINEAR)
+                         if self.use_gpu:
+                             self.wall_textures[wall_id] = texture
+                             pr.gen_texture_mipmaps(self.wall_textures[wall_id])
+                             pr.set_texture_filter(self.wall_textures[wall_id], pr.TextureFilter.TEXTURE_FILTER_TRILINEAR)
+                         if self.keep_pixels:
+                             self.wall_pixels[wall_id] = pixels
                          print(f"  Loaded wall texture ID {wall_id}: {filename}")
                 except (IndexError, ValueError) as e:
                     print(f" Warning: Could not parse wall ID from filename: {filename} ({e})")
@@ -53,8 +96,10 @@ class AssetsManager:
                      # Assign error texture if ID was parsed but loading failed later
                      if 'wall_id' in locals():
                          self.wall_textures[wall_id] = self.error_texture
+                         if self.keep_pixels:
+                             self.wall_pixels[wall_id] = self.error_pixels
 
-        if not self.wall_textures:
+        if not self.wall_textures and not self.wall_pixels:
             print(" Warning: No wall textures were loaded.")
 
     def _load_sprites(self, sprites_path: str):
@@ -88,17 +133,22 @@ class AssetsManager:
             max_index = files[-1][0] if files else 0
             # Ensure list is large enough, fill potentially missing ones with error texture
             self.sprite_textures[sprite_name] = [self.error_texture] * (max_index + 1)
+            if self.keep_pixels:
+                self.sprite_pixels[sprite_name] = [self.error_pixels] * (max_index + 1)
 
             print(f"  Loading sprite '{sprite_name}'...")
             for index, filepath in files:
-                texture = pr.load_texture(filepath)
-                if texture.id == 0:
+                texture, pixels = self._load_image_file(filepath)
+                if not self._loaded_ok(texture, pixels):
                     print(f"   Warning: Failed to load sprite index {index}: {filepath}. Using error texture.")
                     # Already pre-filled with error texture
                 else:
-                    self.sprite_textures[sprite_name][index] = texture
-                    pr.gen_texture_mipmaps(self.sprite_textures[sprite_name][index])
-                    pr.set_texture_filter(self.sprite_textures[sprite_name][index], pr.TextureFilter.TEXTURE_FILTER_TRILINEAR)
+                    if self.use_gpu:
+                        self.sprite_textures[sprite_name][index] = texture
+                        pr.gen_texture_mipmaps(self.sprite_textures[sprite_name][index])
+                        pr.set_texture_filter(self.sprite_textures[sprite_name][index], pr.TextureFilter.TEXTURE_FILTER_TRILINEAR)
+                    if self.keep_pixels:
+                        self.sprite_pixels[sprite_name][index] = pixels
                     print(f"   Loaded sprite index {index}: {os.path.basename(filepath)}")
 
         if not self.sprite_textures:
@@ -122,9 +172,28 @@ class AssetsManager:
         print(f"Warning: Sprite name '{sprite_name}' not found.")
         return self.error_texture # Sprite name not found
 
+    def get_wall_pixels(self, wall_id: int) -> np.ndarray:
+        """Gets the RGBA pixels of a wall texture, error pixels if not found (requires keep_pixels)."""
+        return self.wall_pixels.get(wall_id, self.error_pixels)
+
+    def get_sprite_pixels(self, sprite_name: str, index: int) -> np.ndarray:
+        """Gets the RGBA pixels of a sprite frame, error pixels if not found (requires keep_pixels)."""
+        images = self.sprite_pixels.get(sprite_name)
+        if images is not None and 0 <= index < len(images):
+            return images[index]
+        return self.error_pixels
+
     def unload_assets(self):
         """Unloads all loaded textures."""
         print("Unloading assets...")
+        if not self.use_gpu:
+            self.wall_textures.clear()
+            self.sprite_textures.clear()
+            self.wall_pixels.clear()
+            self.sprite_pixels.clear()
+            print("Assets unloaded.")
+            return
+
         for texture in self.wall_textures.values():
             if texture and texture.id != self.error_texture.id: # Avoid unloading the error texture multiple times
                 pr.unload_texture(texture)
@@ -138,4 +207,6 @@ class AssetsManager:
 
         self.wall_textures.clear()
         self.sprite_textures.clear()
+        self.wall_pixels.clear()
+        self.sprite_pixels.clear()
         print("Assets unloaded.")
\ No newline at end of file
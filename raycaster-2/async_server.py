@@ -0,0 +1,146 @@
+# async_server.py
+# asyncio variant of the game server: one event loop serves every client.
+# Run with: python server.py --mode asyncio
+# Game state, the handshake, message handling and the tick (snapshot building
+# and fan-out) are shared with server.py; only the transport differs. Each
+# client has its own outbound queue (outbound.py) drained by a writer task,
+# so a slow client never blocks the tick or the other clients.
+import asyncio
+from typing import Any, Dict, Optional
+
+import config
+import server
+from outbound import OutboundQueue
+from protocol import JsonCodec, MessageReader, ProtocolError
+
+WRITE_BUFFER_LIMIT = getattr(config, "SERVER_WRITE_BUFFER_LIMIT", 256 * 1024)
+
+
+class AsyncClientConnection(server.ClientSession):
+    """
+    A client served by the event loop.
+    send_message() never blocks: it queues the encoded message and wakes the
+    writer task. When the client falls behind (the socket buffer is full),
+    state updates coalesce in the queue; other messages queue up, and a client
+    with more than server.MAX_QUEUED_MESSAGES of them is disconnected.
+    """
+    def __init__(self, stream_reader: asyncio.StreamReader, stream_writer: asyncio.StreamWriter):
+        self.stream_reader = stream_reader
+        self.stream_writer = stream_writer
+        self.client_address = stream_writer.get_extra_info("peername")
+        # Connections start in JSON; the client may switch to a binary codec after the handshake
+        self.reader = MessageReader(JsonCodec())
+        self.codec = JsonCodec()
+        self.queue = OutboundQueue()
+        self.wakeup = asyncio.Event()
+        self.closing = False
+        stream_writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_LIMIT)
+
+    def send_message(self, message: Dict[str, Any], encoded: Optional[Dict[str, bytes]] = None):
+        """Queues a message for this client (see OutboundQueue.put for `encoded`)."""
+        if self.closing:
+            return
+        try:
+            self.queue.put(message, self.codec, encoded)
+        except Exception as e:
+            print(f"Error encoding message for {self.client_id}: {e}")
+            return
+        if len(self.queue) > server.MAX_QUEUED_MESSAGES:
+            print(f"Client {self.client_id} is not reading ({len(self.queue)} messages queued), disconnecting.")
+            self.close()
+            return
+        self.wakeup.set()
+
+    def switch_send_codec(self, codec, ack: Dict[str, Any]):
+        # Single-threaded: nothing can be queued between the ack and the switch
+        self.send_message(ack)
+        self.codec = codec
+
+    def close(self):
+        self.closing = True
+        self.queue.clear()
+        self.wakeup.set()
+        self.stream_writer.close()
+
+    async def write_loop(self):
+        """Drains the queue; while drain() waits on a slow client, new state updates coalesce in the queue."""
+        try:
+            while not self.closing:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while self.queue and not self.closing:
+                    self.stream_writer.write(self.queue.pop())
+                await self.stream_writer.drain()
+        except (ConnectionError, OSError) as e:
+            if not self.closing:
+                print(f"Error sending to {self.client_id}: {e}")
+            self.close()
+
+    async def read_loop(self):
+        """Receives data from the client until it disconnects."""
+        try:
+            while not self.closing:
+                data = await self.stream_reader.read(65536)
+                if not data:
+                    print(f"Client {self.client_id} disconnected (no data).")
+                    break
+                self.reader.feed(data)
+                for message in self.reader.messages():
+                    try:
+                        self.process_message(message)
+                    except Exception as e:
+                        print(f"Error processing message from {self.client_id}: {e}")
+        except ConnectionResetError:
+            print(f"Client {self.client_id} connection reset.")
+        except ProtocolError as e:
+            print(f"Dropping client {self.client_id}: {e}")
+        except Exception as e:
+            print(f"Error in connection for {self.client_id}: {e}")
+
+
+async def handle_connection(stream_reader: asyncio.StreamReader, stream_writer: asyncio.StreamWriter):
+    connection = AsyncClientConnection(stream_reader, stream_writer)
+    connection.open_session()
+    writer_task = asyncio.create_task(connection.write_loop())
+    try:
+        await connection.read_loop()
+    finally:
+        connection.close_session()
+        connection.close()
+        await writer_task
+
+
+async def tick_loop(tick_rate: float = server.SERVER_TICK_RATE):
+    """Runs server.run_tick on a fixed schedule; sending only queues, so a tick never waits on a client."""
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    while True:
+        try:
+            server.run_tick()
+        except Exception as e:
+            print(f"Error in server tick: {e}")
+        next_tick += tick_rate
+        delay = next_tick - loop.time()
+        if delay < -tick_rate:
+            next_tick = loop.time() # Fell more than a tick behind: skip the missed ticks instead of bursting
+            delay = 0.0
+        await asyncio.sleep(max(0.0, delay))
+
+
+async def serve(host: str, port: int, tick_rate: float = server.SERVER_TICK_RATE):
+    game_server = await asyncio.start_server(handle_connection, host, port)
+    tick_task = asyncio.create_task(tick_loop(tick_rate))
+    print(f"Server listening on {host}:{port} (asyncio, {1 / tick_rate:.0f} ticks/s)")
+    try:
+        async with game_server:
+            await game_server.serve_forever()
+    finally:
+        tick_task.cancel()
+
+
+def main(host: str = server.SERVER_HOST, port: int = server.SERVER_PORT):
+    try:
+        asyncio.run(serve(host, port))
+    except KeyboardInterrupt:
+        print("\nServer shutting down by request...")
+    print("Server shutdown complete.")
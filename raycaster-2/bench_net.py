@@ -0,0 +1,220 @@
+# bench_net.py
+# Networking benchmarks (no server or sockets needed). Usage:
+#   python bench_net.py wire [--players 2 16 64] [--ticks N] [--json]
+#       Simulates players wandering the default map and reports, per server
+#       tick, the bytes on the wire and the encode/decode time of the JSON and
+#       binary codecs (binary with full and with delta-compressed states).
+#   python bench_net.py framing [--bursts 1 16 128] [--rounds N] [--json]
+#       Sends bursts of messages over a local socket pair and times receiving
+#       and decoding them: the original str-concatenation reader, recv() +
+#       MessageReader.feed, and MessageReader.recv_into (framing.py).
+import argparse
+import json
+import math
+import random
+import socket
+import time
+import uuid
+import config
+from map import GameMap
+from protocol import BinaryCodec, JsonCodec, MessageReader, delta_state
+from typing import Any, Dict, List
+
+WIRE_TICK_DT = config.NETWORK_UPDATE_RATE # Simulated time per tick (the client send rate)
+WIRE_IDLE_CHANCE = 0.3    # Fraction of players standing still on a given tick
+WIRE_COMMANDS_PER_SEND = max(1, round(config.TARGET_FPS * config.NETWORK_UPDATE_RATE)) # Input commands (frames) per player_input
+
+def simulate_players(game_map: GameMap, count: int, ticks: int, seed: int = 1) -> List[Dict[str, Dict[str, Any]]]:
+    """Per tick, the state dict (as Player.get_state_dict) of every player, walking randomly between walls."""
+    rng = random.Random(seed)
+    empty = [(x + 0.5, y + 0.5) for y in range(game_map.height) for x in range(game_map.width) if not game_map.is_wall(x, y)]
+    players = {}
+    for _ in range(count):
+        x, y = rng.choice(empty)
+        players[str(uuid.UUID(int=rng.getrandbits(128)))] = {"x": x, "y": y, "angle": rng.uniform(0, 2 * math.pi),
+                                                             "health": config.PLAYER_HEALTH_START, "running": False}
+    history = []
+    for _ in range(ticks):
+        snapshot = {}
+        for pid, p in players.items():
+            if rng.random() >= WIRE_IDLE_CHANCE:
+                p["angle"] = (p["angle"] + rng.uniform(-0.3, 0.3)) % (2 * math.pi)
+                p["running"] = rng.random() < 0.2
+                step = config.PLAYER_MOVE_SPEED * WIRE_TICK_DT * (config.PLAYER_RUN_MULTIPLIER if p["running"] else 1.0)
+                new_x = p["x"] + math.cos(p["angle"]) * step
+                new_y = p["y"] + math.sin(p["angle"]) * step
+                if game_map.is_wall(new_x, new_y):
+                    p["angle"] = (p["angle"] + math.pi) % (2 * math.pi) # Bounce off walls
+                else:
+                    p["x"], p["y"] = new_x, new_y
+            snapshot[pid] = {
+                "x": round(p["x"], 4), "y": round(p["y"], 4), "angle": round(p["angle"], 4), "floor": 0,
+                "health": p["health"], "is_shooting": False, "is_dead": False, "is_running": p["running"],
+            }
+        history.append(snapshot)
+    return history
+
+
+def tick_messages(previous: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]], delta: bool,
+                  tick_time: float) -> List[Dict[str, Any]]:
+    """
+    Messages on the wire for one tick: every client's player_input and the
+    player_state_correction it gets back, then the game_state_update with
+    every player that each client receives (listed once; its size is
+    counted once per client).
+    """
+    inputs = []
+    corrections = []
+    players = {}
+    seq = int(round(tick_time / WIRE_TICK_DT)) * WIRE_COMMANDS_PER_SEND
+    dt = round(WIRE_TICK_DT / WIRE_COMMANDS_PER_SEND, 4)
+    for pid, state in current.items():
+        keys = (1 | 16) if state["is_running"] else 1 # Forward, maybe running (see movement.py)
+        inputs.append({"type": "player_input", "payload": {"seq": seq, "commands": [[dt, keys]] * WIRE_COMMANDS_PER_SEND}})
+        corrections.append({"type": "player_state_correction", "payload": {
+            "ack": seq + WIRE_COMMANDS_PER_SEND - 1, "x": state["x"], "y": state["y"], "angle": state["angle"], "floor": 0}})
+        payload = delta_state(previous.get(pid), state) if delta else dict(state)
+        if payload:
+            payload["t"] = round(tick_time, 3) # Simulated time, as the server adds to every relayed update
+            players[pid] = payload
+    return inputs + corrections + [{"type": "game_state_update", "payload": {"players": players}}]
+
+
+def benchmark_wire(player_counts: List[int], ticks: int, as_json: bool):
+    game_map = GameMap()
+    variants = [("json", JsonCodec, False), ("binary", BinaryCodec, False), ("binary+delta", BinaryCodec, True)]
+    report = []
+    for count in player_counts:
+        history = simulate_players(game_map, count, ticks + 1)
+        row = {"players": count}
+        for name, codec_class, delta in variants:
+            encoder, reader = codec_class(), MessageReader(codec_class())
+            total_bytes = 0
+            encode_time = decode_time = 0.0
+            for tick in range(1, ticks + 1):
+                messages = tick_messages(history[tick - 1] if delta else {}, history[tick], delta, tick * WIRE_TICK_DT)
+                start = time.perf_counter()
+                frames = [encoder.encode(message) for message in messages]
+                encode_time += time.perf_counter() - start
+
+                # Per client: its input and correction; the state update goes to every client
+                total_bytes += sum(len(frame) for frame in frames[:-1]) + len(frames[-1]) * count
+
+                start = time.perf_counter()
+                reader.feed(b"".join(frames))
+                decoded = sum(1 for _ in reader.messages())
+                decode_time += time.perf_counter() - start
+                assert decoded == len(messages), f"{name}: decoded {decoded} of {len(messages)} messages"
+            row[name] = {
+                "bytes_per_tick": total_bytes / ticks,
+                "encode_us_per_tick": encode_time / ticks * 1e6,
+                "decode_us_per_tick": decode_time / ticks * 1e6,
+            }
+        report.append(row)
+
+    if as_json:
+        print(json.dumps({"ticks": ticks, "results": report}, indent=2))
+        return
+    print(f"Wire protocol: {ticks} ticks, {WIRE_IDLE_CHANCE:.0%} of players idle per tick")
+    for row in report:
+        print(f"  {row['players']} players:")
+        baseline = row["json"]["bytes_per_tick"]
+        for name, _, _ in variants:
+            stats = row[name]
+            print(f"    {name:>13}: {stats['bytes_per_tick']:>10.0f} B/tick ({stats['bytes_per_tick'] / baseline:6.1%})"
+                  f"  encode {stats['encode_us_per_tick']:>9.1f} us  decode {stats['decode_us_per_tick']:>9.1f} us")
+
+
+def _legacy_read(sock: socket.socket, pending: str, expected: int) -> str:
+    """The original NetworkClient.receive_data loop: recv(4096), decode, str concatenation, split('\\n', 1)."""
+    received = 0
+    while received < expected:
+        pending += sock.recv(4096).decode('utf-8')
+        while '\n' in pending:
+            line, pending = pending.split('\n', 1)
+            if line:
+                json.loads(line)
+                received += 1
+    return pending
+
+
+def _reader_read(sock: socket.socket, reader: MessageReader, expected: int, use_recv_into: bool):
+    received = 0
+    while received < expected:
+        if use_recv_into:
+            reader.recv_into(sock)
+        else:
+            reader.feed(sock.recv(65536))
+        received += sum(1 for _ in reader.messages())
+
+
+def benchmark_framing(burst_sizes: List[int], rounds: int, as_json: bool):
+    """
+    Times receiving bursts of what a client gets every tick (a state update
+    and its correction) through each reader. A burst is queued in the socket
+    before the clock starts, as after a frame hitch.
+    """
+    game_map = GameMap()
+    history = simulate_players(game_map, 16, 2)
+    messages = tick_messages(history[0], history[1], True, WIRE_TICK_DT)
+    sample = [messages[-1], next(m for m in messages if m["type"] == "player_state_correction")]
+    variants = [("legacy str", JsonCodec, "legacy"), ("json feed", JsonCodec, "feed"), ("json recv_into", JsonCodec, "recv_into"),
+                ("binary feed", BinaryCodec, "feed"), ("binary recv_into", BinaryCodec, "recv_into")]
+    report = []
+    for burst in burst_sizes:
+        row = {"burst": burst}
+        for name, codec_class, mode in variants:
+            codec = codec_class()
+            blob = b"".join(codec.encode(sample[i % len(sample)]) for i in range(burst))
+            sender, receiver = socket.socketpair()
+            for sock in (sender, receiver):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            reader, pending = MessageReader(codec_class()), ""
+            elapsed = 0.0
+            for _ in range(rounds):
+                sender.sendall(blob)
+                start = time.perf_counter()
+                if mode == "legacy":
+                    pending = _legacy_read(receiver, pending, burst)
+                else:
+                    _reader_read(receiver, reader, burst, mode == "recv_into")
+                elapsed += time.perf_counter() - start
+            sender.close()
+            receiver.close()
+            row[name] = {"us_per_burst": elapsed / rounds * 1e6, "us_per_message": elapsed / (rounds * burst) * 1e6,
+                         "mb_per_s": len(blob) * rounds / elapsed / 1e6}
+        report.append(row)
+
+    if as_json:
+        print(json.dumps({"rounds": rounds, "results": report}, indent=2))
+        return
+    print(f"Receive path: {rounds} bursts per size of state updates and corrections (16 players)")
+    for row in report:
+        print(f"  burst of {row['burst']} messages:")
+        baseline = row["legacy str"]["us_per_burst"]
+        for name, _, _ in variants:
+            stats = row[name]
+            print(f"    {name:>16}: {stats['us_per_burst']:>9.1f} us/burst ({baseline / stats['us_per_burst']:4.1f}x)"
+                  f"  {stats['us_per_message']:>6.2f} us/msg  {stats['mb_per_s']:>7.1f} MB/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Raycaster networking benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    wire_parser = subparsers.add_parser("wire", help="Compare bytes and codec time of the JSON and binary protocols")
+    wire_parser.add_argument("--players", type=int, nargs="+", default=[2, 16, 64], help="Player counts to simulate")
+    wire_parser.add_argument("--ticks", type=int, default=200, help="Number of ticks per player count")
+    wire_parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    framing_parser = subparsers.add_parser("framing", help="Time the receive path on bursts of messages")
+    framing_parser.add_argument("--bursts", type=int, nargs="+", default=[1, 16, 128], help="Messages per burst")
+    framing_parser.add_argument("--rounds", type=int, default=500, help="Bursts per size")
+    framing_parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    args = parser.parse_args()
+    if args.command == "wire":
+        benchmark_wire(args.players, args.ticks, args.json)
+    elif args.command == "framing":
+        benchmark_framing(args.bursts, args.rounds, args.json)
@@ -0,0 +1,261 @@
+# benchmark.py
+# Rendering benchmarks. Usage:
+#   python benchmark.py cast [--frames N]   Compare scalar vs vectorized ray casting (no window needed)
+#   python benchmark.py walls [--frames N]  Frame time of batched vs per-column wall drawing (opens a window)
+#   python benchmark.py frames [--path loop|spin] [--frames N] [--window]
+#                              [--save-hashes FILE | --check-hashes FILE] [--json]
+#       Replays a scripted camera path (headless by default), reports per-stage
+#       timings and optionally hashes every frame for pixel-regression checks.
+import argparse
+import hashlib
+import json
+import math
+import sys
+import time
+import numpy as np
+import pyray as pr
+import config
+from assets_manager import AssetsManager
+from map import GameMap
+from player import Player
+from renderer import Renderer
+from sprite import Sprite
+from typing import Dict, List, Optional, Tuple
+
+# Scripted camera paths through the default GameMap, as (x, y) waypoints in
+# tile units. The camera walks them in order (and loops) at FRAME_PATH_SPEED.
+CAMERA_PATHS: Dict[str, List[Tuple[float, float]]] = {
+    "loop": [(1.5, 1.5), (1.5, 8.5), (8.5, 8.5), (8.5, 1.5), (5.5, 1.5), (5.5, 4.5), (1.5, 4.5)],
+    "spin": [(config.PLAYER_START_X, config.PLAYER_START_Y)], # Single point: rotate in place
+}
+FRAME_DT = 1.0 / 60.0     # Fixed simulated frame time, so runs are deterministic
+FRAME_PATH_SPEED = 2.5    # Tiles per second along the path
+FRAME_SPIN_SPEED = 1.0    # Radians per second when the path is a single point
+
+# Static scene so the sprite stage has work to do
+BENCHMARK_SPRITES = [
+    {"x": 5.5, "y": 6.5, "texture_name": "WinterGuard", "texture_index": 1, "scale": 1},
+    {"x": 1.5, "y": 6.0, "texture_name": "WinterGuard", "texture_index": 3, "scale": 1},
+    {"x": 8.5, "y": 4.5, "texture_name": "WinterGuard", "texture_index": 5, "scale": 1},
+    {"x": 3.5, "y": 8.5, "texture_name": "WinterGuard", "texture_index": 10, "scale": 1},
+]
+
+def benchmark_cast(frames: int):
+    """Casts the same camera sweep with both casters, checks they agree and times them."""
+    game_map = GameMap()
+    player = Player(config.PLAYER_START_X, config.PLAYER_START_Y, config.PLAYER_START_ANGLE)
+    renderer = Renderer(None) # Ray casting does not touch the assets manager
+
+    timings = {"scalar": 0.0, "vectorized": 0.0}
+    mismatched_columns = 0
+    max_dist_error = 0.0
+
+    for frame in range(frames):
+        player.angle = (frame * 2 * math.pi / frames) % (2 * math.pi) # Full turn over the run
+        results = {}
+        for mode in timings:
+            renderer.raycast_mode = mode
+            start = time.perf_counter()
+            results[mode] = renderer.cast_walls(player, game_map)
+            timings[mode] += time.perf_counter() - start
+
+        scalar, vectorized = results["scalar"], results["vectorized"]
+        differs = ((scalar.wall_id != vectorized.wall_id) |
+                   (scalar.side != vectorized.side) |
+                   (np.abs(scalar.tex_x - vectorized.tex_x) > 1))
+        mismatched_columns += int(differs.sum())
+        both_hit = scalar.hit & vectorized.hit
+        if both_hit.any():
+            max_dist_error = max(max_dist_error, float(np.abs(scalar.dist - vectorized.dist)[both_hit].max()))
+
+    print(f"Ray casting: {frames} frames x {config.NUM_RAYS} rays")
+    for mode, total in timings.items():
+        print(f"  {mode:>10}: {total / frames * 1000:.3f} ms/frame")
+    if timings["vectorized"] > 0:
+        print(f"  speedup: {timings['scalar'] / timings['vectorized']:.1f}x")
+    print(f"  mismatched columns: {mismatched_columns} / {frames * config.NUM_RAYS}")
+    print(f"  max distance error: {max_dist_error:.2e}")
+
+
+def benchmark_walls(frames: int):
+    """Renders the default map with each wall draw mode and reports CPU time per frame."""
+    pr.init_window(config.SCREEN_WIDTH, config.SCREEN_HEIGHT, "Raycaster Benchmark - walls")
+    pr.set_target_fps(0) # Uncapped, so the frame loop doesn't sleep
+
+    assets_manager = AssetsManager()
+    assets_manager.load_assets()
+    game_map = GameMap()
+    player = Player(config.PLAYER_START_X, config.PLAYER_START_Y, config.PLAYER_START_ANGLE)
+    renderer = Renderer(assets_manager)
+
+    results = {}
+    for mode in ("per_column", "batched"):
+        renderer.wall_draw_mode = mode
+        wall_time = 0.0
+        frame_time = 0.0
+        for frame in range(frames):
+            player.angle = (frame * 2 * math.pi / frames) % (2 * math.pi) # Full turn over the run
+            frame_start = time.perf_counter()
+            pr.begin_drawing()
+            pr.clear_background(pr.BLACK)
+            renderer.draw_floor_ceiling()
+            wall_start = time.perf_counter()
+            renderer.draw_walls(player, game_map)
+            wall_time += time.perf_counter() - wall_start
+            pr.end_drawing() # Includes the GPU flush of whatever the walls queued
+            frame_time += time.perf_counter() - frame_start
+        results[mode] = (wall_time / frames, frame_time / frames)
+
+    renderer.unload()
+    assets_manager.unload_assets()
+    pr.close_window()
+
+    print(f"Wall drawing: {frames} frames on the default map at {config.SCREEN_WIDTH}x{config.SCREEN_HEIGHT}")
+    for mode, (wall_avg, frame_avg) in results.items():
+        print(f"  {mode:>10}: draw_walls {wall_avg * 1000:.3f} ms, frame {frame_avg * 1000:.3f} ms")
+    if results["batched"][1] > 0:
+        print(f"  frame speedup: {results['per_column'][1] / results['batched'][1]:.1f}x")
+
+
+def camera_pose(waypoints: List[Tuple[float, float]], frame: int) -> Tuple[float, float, float]:
+    """Returns (x, y, angle) of the camera at `frame` when walking `waypoints` in a loop."""
+    if len(waypoints) == 1:
+        x, y = waypoints[0]
+        return x, y, (frame * FRAME_DT * FRAME_SPIN_SPEED) % (2 * math.pi)
+
+    segments = list(zip(waypoints, waypoints[1:] + waypoints[:1]))
+    lengths = [math.hypot(b[0] - a[0], b[1] - a[1]) for a, b in segments]
+    distance = (frame * FRAME_DT * FRAME_PATH_SPEED) % sum(lengths)
+    for (a, b), length in zip(segments, lengths):
+        if distance <= length and length > 0:
+            t = distance / length
+            angle = math.atan2(b[1] - a[1], b[0] - a[0]) % (2 * math.pi)
+            return a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t, angle
+        distance -= length
+    x, y = waypoints[0]
+    return x, y, 0.0
+
+
+def frame_hash(game) -> str:
+    """SHA-1 of the pixels of the frame just rendered."""
+    if game.renderer.software:
+        return hashlib.sha1(game.renderer.software.framebuffer).hexdigest()
+    image = pr.load_image_from_screen() # Raylib backend: read back the window contents
+    digest = hashlib.sha1(pr.ffi.buffer(image.data, image.width * image.height * 4)).hexdigest()
+    pr.unload_image(image)
+    return digest
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def benchmark_frames(path_name: str, path_file: Optional[str], frames: int, window: bool,
+                     save_hashes: Optional[str], check_hashes: Optional[str], as_json: bool) -> int:
+    """Replays a camera path through the game renderer and reports per-stage timings."""
+    from main import Game # Imported here: main pulls in networking, which the other benchmarks don't need
+
+    if path_file:
+        with open(path_file) as f:
+            waypoints = [tuple(point) for point in json.load(f)]
+        path_name = path_file
+    else:
+        waypoints = CAMERA_PATHS[path_name]
+
+    game = Game(headless=not window, networked=False)
+    if window:
+        pr.set_target_fps(0) # Uncapped
+    game.load_content()
+    for x, y in waypoints:
+        if game.game_map.is_wall(x, y):
+            print(f"Warning: waypoint ({x}, {y}) is inside a wall.")
+    for i, data in enumerate(BENCHMARK_SPRITES):
+        sprite_id = f"benchmark_sprite_{i}"
+        game.sprites[sprite_id] = Sprite(sprite_id, data, game.spatial_index)
+
+    want_hashes = bool(save_hashes or check_hashes)
+    stage_samples: Dict[str, List[float]] = {}
+    frame_samples: List[float] = []
+    hashes: List[str] = []
+
+    for frame in range(frames):
+        game.player.x, game.player.y, game.player.angle = camera_pose(waypoints, frame)
+        start = time.perf_counter()
+        game.draw()
+        frame_samples.append(time.perf_counter() - start)
+        for stage, seconds in game.renderer.stage_timings.items():
+            stage_samples.setdefault(stage, []).append(seconds)
+        if want_hashes:
+            hashes.append(frame_hash(game))
+
+    game.shutdown()
+
+    report = {
+        "path": path_name,
+        "frames": frames,
+        "mode": "window" if window else "headless",
+        "backend": game.renderer.backend,
+        "resolution": [config.SCREEN_WIDTH, config.SCREEN_HEIGHT],
+        "stages_ms": {},
+    }
+    for stage, samples in list(stage_samples.items()) + [("frame", frame_samples)]:
+        report["stages_ms"][stage] = {
+            "mean": sum(samples) / len(samples) * 1000,
+            "p50": percentile(samples, 0.50) * 1000,
+            "p95": percentile(samples, 0.95) * 1000,
+            "max": max(samples) * 1000,
+        }
+
+    exit_code = 0
+    if save_hashes:
+        with open(save_hashes, "w") as f:
+            json.dump({"path": path_name, "frames": frames, "backend": report["backend"], "hashes": hashes}, f, indent=1)
+    if check_hashes:
+        with open(check_hashes) as f:
+            expected = json.load(f)["hashes"]
+        mismatches = [i for i, (got, want) in enumerate(zip(hashes, expected)) if got != want]
+        if len(expected) != len(hashes):
+            mismatches.append(min(len(expected), len(hashes)))
+        report["hash_mismatches"] = mismatches
+        exit_code = 1 if mismatches else 0
+
+    if as_json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Camera path '{path_name}': {frames} frames, {report['mode']}, {report['backend']} backend")
+        for stage, stats in report["stages_ms"].items():
+            print(f"  {stage:>8}: mean {stats['mean']:.3f} ms  p50 {stats['p50']:.3f}  p95 {stats['p95']:.3f}  max {stats['max']:.3f}")
+        if "hash_mismatches" in report:
+            mismatches = report["hash_mismatches"]
+            print(f"  pixel regression: {'OK' if not mismatches else f'{len(mismatches)} frame(s) differ, first at {mismatches[0]}'}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Raycaster rendering benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    cast_parser = subparsers.add_parser("cast", help="Compare scalar and vectorized ray casting")
+    cast_parser.add_argument("--frames", type=int, default=240, help="Number of frames to cast")
+
+    walls_parser = subparsers.add_parser("walls", help="Compare batched and per-column wall drawing")
+    walls_parser.add_argument("--frames", type=int, default=600, help="Number of frames per mode")
+
+    frames_parser = subparsers.add_parser("frames", help="Replay a camera path with per-stage timings")
+    frames_parser.add_argument("--path", choices=sorted(CAMERA_PATHS), default="loop", help="Built-in camera path")
+    frames_parser.add_argument("--path-file", help="JSON list of [x, y] waypoints (overrides --path)")
+    frames_parser.add_argument("--frames", type=int, default=600, help="Number of frames to render")
+    frames_parser.add_argument("--window", action="store_true", help="Render in a window with the configured backend instead of headless")
+    frames_parser.add_argument("--save-hashes", help="Write per-frame pixel hashes to this JSON file")
+    frames_parser.add_argument("--check-hashes", help="Compare per-frame pixel hashes against this JSON file")
+    frames_parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    args = parser.parse_args()
+    if args.command == "cast":
+        benchmark_cast(args.frames)
+    elif args.command == "walls":
+        benchmark_walls(args.frames)
+    elif args.command == "frames":
+        sys.exit(benchmark_frames(args.path, args.path_file, args.frames, args.window,
+                                  args.save_hashes, args.check_hashes, args.json))
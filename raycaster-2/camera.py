@@ -0,0 +1,35 @@
+# camera.py
+# Precomputed per-column camera rays, shared by every ray caster
+import numpy as np
+from typing import Tuple
+
+class CameraRayTable:
+    """
+    Camera-space ray directions for each screen column.
+    Built once for a given FOV/ray count/resolution; each frame the table is
+    rotated into world space with a single matrix product using the player's
+    direction and camera plane vectors (see Player.get_plane_vector), so wall
+    columns and sprites use the same projection.
+    """
+    def __init__(self, fov: float, num_rays: int, screen_width: int):
+        self.key = (fov, num_rays, screen_width)
+        self.num_rays = num_rays
+
+        # camera_x runs from -1 (left screen edge) to +1 (right screen edge),
+        # sampled at the centre of the screen columns each ray covers
+        column_width = screen_width / num_rays
+        column_centres = (np.arange(num_rays) + 0.5) * column_width
+        self.camera_x = 2.0 * column_centres / screen_width - 1.0
+
+        # Camera-space directions: 1 unit along the view direction plus camera_x along the plane
+        self.basis = np.column_stack((np.ones(num_rays), self.camera_x))
+
+    def matches(self, fov: float, num_rays: int, screen_width: int) -> bool:
+        """True if the table was built for these settings."""
+        return self.key == (fov, num_rays, screen_width)
+
+    def rotate(self, dir_vec: Tuple[float, float], plane_vec: Tuple[float, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns world-space (ray_dir_x, ray_dir_y) arrays for the given camera."""
+        camera = np.array([dir_vec, plane_vec], dtype=np.float64) # Rows: direction, plane
+        rays = self.basis @ camera # ray = dir + camera_x * plane, for every column at once
+        return rays[:, 0], rays[:, 1]
@@ -16,22 +16,78 @@ PLAYER_RUN_MULTIPLIER = 1.8
 PLAYER_ROTATION_SPEED = 2.0 # Radians per second
 PLAYER_FOV = math.radians(60) # Field of View in radians
 PLAYER_HEALTH_START = 100
+PLAYER_MANA_START = 100
 
 # Rendering Settings
 NUM_RAYS = SCREEN_WIDTH // 2 # Number of rays to cast (adjust for performance/quality)
 MAX_RENDER_DEPTH = 20.0    # Maximum distance to render walls/sprites
 TEXTURE_SIZE = 128         # Assuming square textures (width & height)
 RENDER_SCALE_FACTOR = 2   # For drawing wall slices wider than 1 pixel
+RAYCAST_MODE = "vectorized" # "vectorized" (NumPy batch, see raycast.py) or "scalar" (per-ray Python DDA)
+WALL_DRAW_MODE = "per_column" # "per_column" or "batched" (one mesh draw per wall texture, see wall_batch.py; compare with `benchmark.py walls`)
+RENDER_BACKEND = "raylib" # "raylib" (draw calls) or "software" (NumPy framebuffer, see software_renderer.py)
 
 # Map Settings
 MAP_TILE_SIZE = 1.0 # Size of one map tile in world units
 
+# Visibility (PVS) Settings, see pvs.py
+PVS_ENABLED = True        # Skip sprites/network updates for objects in tiles that can't be seen
+PVS_CACHE_DIR = ".pvs_cache" # Built tables are cached here, keyed by map hash
+PVS_SECTOR_SIZE = 4       # Tiles per side of a visibility sector
+PVS_RAYS_PER_ORIGIN = 1024 # Rays cast from each sample point of a tile while building
+
+# Area of Interest Settings (server), see interest.py
+AOI_ENABLED = True        # Send each client only the players/sprites/entities near it
+AOI_RADIUS = MAX_RENDER_DEPTH # Tiles; objects further away can't be drawn anyway
+AOI_HYSTERESIS = 2.0      # Extra tiles before a known object leaves, so it doesn't flicker at the edge
+
 # Network Settings
 # Replace with your actual server IP and Port
 SERVER_IP = "153.33.125.221" # Loopback for local testing
 SERVER_PORT = 5555
-NETWORK_UPDATE_RATE = 1 / 20 # Send updates to server 20 times per second
+NETWORK_UPDATE_RATE = 1 / 10 # Send updates to server 10 times per second (remote players are interpolated in between)
+SERVER_TICK_RATE = 1 / 20 # Server batches all changes into one snapshot per tick
+STATE_HISTORY_TICKS = 64 # Server: ticks of changes kept for per-client deltas; a client further behind is sent the full state again
+SERVER_MAX_QUEUED_MESSAGES = 256 # Server: a client with more unsent messages than this is dropped
+SERVER_WRITE_BUFFER_LIMIT = 256 * 1024 # asyncio server: bytes buffered per client before its queue starts coalescing
 SOCKET_TIMEOUT = 0.01 # Short timeout for non-blocking receive
+NETWORK_TRANSPORT = "tcp" # "tcp" or "udp" (unreliable state channel + reliable event channel; server: --mode udp), see udp_transport.py
+NETWORK_THREADED = True # Socket I/O and reconnects run on a background thread (ThreadedNetworkClient), never in the frame
+NETWORK_RECONNECT_DELAY = 1.0 # Seconds between connection attempts
+NETWORK_SHUTDOWN_TIMEOUT = 1.0 # Longest wait for queued messages to go out when disconnecting
+INTERPOLATION_DELAY = 0.2 # Remote players are drawn this far in the past: one update interval plus server-tick/frame jitter
+MAX_EXTRAPOLATION = 0.1 # Longest time to extrapolate past the newest snapshot when one is late
+SNAPSHOT_BUFFER_SIZE = 16 # Snapshots kept per remote player
+MAX_INPUT_DT = 0.1 # Longest input command (seconds); the server clamps to this too, see movement.py
+INPUT_HISTORY_SIZE = 256 # Unacknowledged input commands kept for replay (about 4 s at 60 FPS)
+INPUT_TIME_SLACK = 0.25 # Server: how far a client's input time may run ahead of real time before commands are dropped
+RECONCILE_EPSILON = 0.001 # Tiles; a correction closer than this to the prediction is ignored
+RECONCILE_SNAP_DISTANCE = 1.0 # Tiles; larger corrections snap, smaller ones are blended in
+RECONCILE_RATE = 10.0 # Fraction of the remaining correction blended in per second (capped at all of it)
+NETWORK_PROTOCOL = "binary/4" # Wire format to request after the handshake ("json" keeps newline-delimited JSON), see protocol.py
+UDP_RESEND_INTERVAL = 0.1 # Seconds before an unacknowledged reliable datagram is sent again
+UDP_KEEPALIVE_INTERVAL = 0.5 # An empty datagram goes out after this long without sending anything
+UDP_TIMEOUT = 5.0 # Seconds without any datagram from the other side before the connection counts as lost
+UDP_MAX_DATAGRAM = 60000 # Larger messages are dropped with a warning
+UDP_SIM_LOSS = 0.0 # Client-side network simulator for outgoing datagrams: fraction dropped,
+UDP_SIM_LATENCY = 0.0 # seconds of added delay,
+UDP_SIM_JITTER = 0.0 # and up to this many seconds of extra random delay (the server takes --loss/--latency/--jitter)
+
+# Server NPCs (npc.py)
+NPC_ENABLED = True # Server-controlled guards chase the nearest player
+NPC_MOVE_SPEED = 1.5 # Tiles per second
+NPC_CHASE_RANGE = 8.0 # Tiles (straight line); players further away are ignored
+NPC_STOP_DISTANCE = 1.0 # Tiles; NPCs stop this close to their target
+NPC_FLOW_FIELD_CACHE = 64 # Flow fields (one per target tile and floor) kept between ticks
+NPC_SPAWN_COUNT = 0 # Extra guards placed on random open tiles at server start
+
+# Server shot resolution (hitscan.py)
+HITSCAN_ENABLED = True
+HITSCAN_DAMAGE = 25 # Health taken by one hit
+HITSCAN_RANGE = 20.0 # Tiles
+HITSCAN_RADIUS = 0.35 # Tiles; players and sprites are hit within this distance of their position
+HITSCAN_COOLDOWN = 0.25 # Seconds of input time between shots that count
+LAG_COMPENSATION_WINDOW = 0.5 # Seconds of position history kept; the furthest back a shot is resolved
 
 # Sprite/Asset Settings
 SPRITE_SCALE = 0.7 # General scaling for sprites in the world
@@ -1,19 +1,22 @@
 # entity.py
 # Representation for static/collectible entities like keys, chests
-from typing import Tuple
+from typing import Optional, Tuple
 import config
+from spatial_index import SpatialIndex
 
 class Entity:
-    def __init__(self, entity_id: str, data: dict):
+    def __init__(self, entity_id: str, data: dict, spatial_index: Optional[SpatialIndex] = None):
         self.id = entity_id
         self.x: float = 0.0
         self.y: float = 0.0
+        self.floor: int = 0 # Map floor the object is on
         self.type: str = "Unknown" # e.g., "Key", "Chest", "HealthPack"
         self.texture_name: str = "DefaultEntity" # Asset name for this entity
         self.texture_index: int = 0 # Frame/variant if needed
         self.is_active: bool = True # e.g., set to False when picked up
         self.scale: float = config.SPRITE_SCALE * 0.8 # Slightly smaller maybe?
 
+        self.spatial_index = spatial_index # Kept up to date with our position, if given
         self.update_from_server(data)
 
     def update_from_server(self, data: dict):
@@ -21,11 +24,14 @@ class Entity:
         # Usually only position and active status change
         self.x = data.get("x", self.x)
         self.y = data.get("y", self.y)
+        self.floor = data.get("floor", self.floor)
         self.type = data.get("type", self.type)
         self.texture_name = data.get("texture_name", self.texture_name)
         self.texture_index = data.get("texture_index", self.texture_index)
         self.is_active = data.get("is_active", self.is_active)
         self.scale = data.get("scale", self.scale)
+        if self.spatial_index is not None:
+            self.spatial_index.update(self)
 
     def get_pos_tuple(self) -> Tuple[float, float]:
         return (self.x, self.y)
@@ -0,0 +1,59 @@
+# framing.py
+# Receive buffering shared by NetworkClient and the server handlers (through
+# protocol.MessageReader). Sockets read with recv_into straight into one
+# reusable bytearray and the codecs parse each complete frame from a
+# memoryview of it, so a burst of messages costs no per-chunk bytes objects,
+# no buffer concatenation and no per-message copies.
+import socket
+
+class ReceiveBuffer:
+    """
+    Reusable receive buffer; the unread bytes are data[start:end].
+    Consuming advances `start`. When the free space behind `end` runs low the
+    unread tail is moved to the front: frames have to stay contiguous to be
+    parsed from a single memoryview, so the ring compacts instead of
+    wrapping. It only grows when one frame is larger than the whole buffer.
+    Views into `data` are valid until the next recv_into() or feed().
+    """
+    def __init__(self, capacity: int = 65536, min_read: int = 4096):
+        self.data = bytearray(capacity)
+        self.start = 0
+        self.end = 0
+        self.min_read = min_read # Free space guaranteed to each recv_into
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def _reserve(self, size: int):
+        """Makes at least `size` bytes free behind `end`."""
+        if len(self.data) - self.end >= size:
+            return
+        unread = self.end - self.start
+        if unread + size > len(self.data):
+            # Grow into a new buffer: views of the old one stay valid, and a bytearray
+            # with exported views couldn't be resized in place anyway
+            grown = bytearray(max(2 * len(self.data), unread + size))
+            grown[:unread] = memoryview(self.data)[self.start:self.end]
+            self.data = grown
+        else:
+            self.data[:unread] = self.data[self.start:self.end] # Same-size move, no reallocation
+        self.start, self.end = 0, unread
+
+    def recv_into(self, sock: socket.socket) -> int:
+        """One recv_into from `sock` into the free space. Returns the byte count (0: peer closed)."""
+        self._reserve(self.min_read)
+        received = sock.recv_into(memoryview(self.data)[self.end:])
+        self.end += received
+        return received
+
+    def feed(self, data: bytes):
+        """Appends bytes that were received elsewhere (e.g. from an asyncio stream)."""
+        self._reserve(len(data))
+        self.data[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def consume_to(self, position: int):
+        """Marks everything before `position` (an index into `data`) as read."""
+        self.start = position
+        if self.start == self.end:
+            self.start = self.end = 0 # Empty: restart at the front, no compaction needed
@@ -0,0 +1,196 @@
+# hitscan.py
+# Server-side shot resolution. A shot is one ray, marched through the map
+# grid cell by cell (DDA) up to the first wall; only the players and sprites
+# registered in the cells it crosses are tested, so the cost follows the
+# length of the shot, not the number of objects.
+# Lag compensation: the shooter aimed at where others were drawn on their
+# screen, some time in the past. Every object's positions over the last
+# `window` seconds are kept, and a shot is tested against where each object
+# was at the time it was aimed. Objects are registered in every cell their
+# recent positions (plus the hit radius) touch, so a rewound position is
+# always found in the cells the ray crosses. Keep this free of pyray: the
+# server imports it.
+import math
+from collections import deque
+from typing import Deque, Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from map import GameMap
+from state_store import StateStore
+
+ObjectKey = Tuple[str, str] # (section, object id)
+Cell = Tuple[int, int, int] # (floor, x, y)
+Sample = Tuple[float, float, float, int] # (time, x, y, floor)
+
+SHOOTABLE_SECTIONS = ("players", "sprites")
+
+class HitscanSystem:
+    """
+    Position history, spatial hash and ray test for one map. record() must
+    be called after every change to positions (the server calls
+    record_changes once per tick); trace() resolves a shot.
+    `game_map` is re-bound to the shot's floor as needed.
+    """
+    def __init__(self, game_map: GameMap, radius: float = 0.35, max_range: float = 20.0, window: float = 0.5,
+                 tick_rate: float = 1 / 20):
+        self.game_map = game_map
+        self.radius = radius # Hit radius of players and sprites (tiles)
+        self.max_range = max_range
+        self.window = window # Seconds of history kept: the furthest a shot can be rewound
+        self.tick_rate = tick_rate # Samples further apart than this (plus a half) aren't interpolated between
+        self.history: Dict[ObjectKey, Deque[Sample]] = {}
+        self.cells: Dict[Cell, Set[ObjectKey]] = {}
+        self.registered: Dict[ObjectKey, FrozenSet[Cell]] = {}
+        self.bounds: Dict[ObjectKey, tuple] = {} # Cell bounds (per floor) `registered` was built from
+        self.tests = 0 # Objects tested against rays so far (for benchmarks)
+
+    # --- History and spatial hash ---
+    def record(self, section: str, object_id: str, x: float, y: float, floor: int, now: float):
+        """Records an object's position at time `now` (seconds, time.monotonic)."""
+        key = (section, object_id)
+        samples = self.history.get(key)
+        if samples is None:
+            samples = self.history[key] = deque()
+        samples.append((now, x, y, floor))
+        # Drop samples older than the window, but keep the one in effect at its start
+        while len(samples) > 1 and samples[1][0] <= now - self.window:
+            samples.popleft()
+        self._register(key, samples)
+
+    def record_changes(self, store: StateStore, version: int, now: float):
+        """Records every shootable object whose position changed in store version `version`."""
+        position_bits = store.field_bit("x") | store.field_bit("y") | store.field_bit("floor")
+        for section in SHOOTABLE_SECTIONS:
+            states = store.states[section]
+            for object_id, mask in store.changed_in(version)[section].items():
+                state = states.get(object_id)
+                if state is not None and mask & position_bits:
+                    self.record(section, object_id, state["x"], state["y"], state.get("floor", 0), now)
+
+    def record_all(self, store: StateStore, now: float):
+        """Records the current position of every shootable object (e.g. at startup)."""
+        for section in SHOOTABLE_SECTIONS:
+            for object_id, state in store.states[section].items():
+                self.record(section, object_id, state["x"], state["y"], state.get("floor", 0), now)
+
+    def forget(self, section: str, object_id: str):
+        key = (section, object_id)
+        self.history.pop(key, None)
+        self.bounds.pop(key, None)
+        for cell in self.registered.pop(key, ()):
+            self._discard(key, cell)
+
+    def _register(self, key: ObjectKey, samples: Iterable[Sample]):
+        """Registers `key` in every cell within the hit radius of the box around its kept positions."""
+        radius = self.radius
+        bounds = []
+        for floor in {sample[3] for sample in samples}:
+            xs = [sample[1] for sample in samples if sample[3] == floor]
+            ys = [sample[2] for sample in samples if sample[3] == floor]
+            bounds.append((floor, math.floor(min(xs) - radius), math.floor(min(ys) - radius),
+                           math.floor(max(xs) + radius), math.floor(max(ys) + radius)))
+        bounds = tuple(sorted(bounds))
+        if self.bounds.get(key) == bounds:
+            return # Usual case: moved, but still within the same cells
+        self.bounds[key] = bounds
+        cells = frozenset((floor, cell_x, cell_y) for floor, min_x, min_y, max_x, max_y in bounds
+                          for cell_x in range(min_x, max_x + 1) for cell_y in range(min_y, max_y + 1))
+        old = self.registered.get(key, frozenset())
+        for cell in old - cells:
+            self._discard(key, cell)
+        for cell in cells - old:
+            self.cells.setdefault(cell, set()).add(key)
+        self.registered[key] = cells
+
+    def _discard(self, key: ObjectKey, cell: Cell):
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self.cells[cell] # Keep only occupied cells
+
+    def position_at(self, key: ObjectKey, when: float) -> Optional[Tuple[float, float, int]]:
+        """Where an object was at time `when` (its oldest kept position if that is older); None if unknown."""
+        samples = self.history.get(key)
+        if not samples:
+            return None
+        previous = samples[0]
+        for sample in samples:
+            if sample[0] > when:
+                # Interpolate between consecutive ticks; a longer gap means it stood still until `sample`
+                if previous is not sample and sample[3] == previous[3] and sample[0] - previous[0] <= 1.5 * self.tick_rate:
+                    blend = (when - previous[0]) / (sample[0] - previous[0])
+                    return (previous[1] + (sample[1] - previous[1]) * blend,
+                            previous[2] + (sample[2] - previous[2]) * blend, previous[3])
+                break
+            previous = sample
+        return previous[1], previous[2], previous[3]
+
+    # --- Shots ---
+    def trace(self, x: float, y: float, angle: float, floor: int, when: float, store: StateStore,
+              ignore: Optional[ObjectKey] = None) -> Optional[Tuple[ObjectKey, float]]:
+        """
+        The first living player or sprite a shot from (x, y) along `angle`
+        hits, tested at their positions at time `when`, and the distance to
+        it; None if the shot hits a wall or runs out of range first.
+        `ignore` is the shooter.
+        """
+        game_map = self.game_map
+        if game_map.floor != floor:
+            game_map.set_floor(floor)
+            if game_map.floor != floor:
+                return None
+        walls = game_map.walls
+        dir_x, dir_y = math.cos(angle), math.sin(angle)
+        map_x, map_y = int(x), int(y)
+        # DDA setup as in raycast.py: distance along the ray to the next x and y grid lines
+        delta_x = abs(1 / dir_x) if dir_x else math.inf
+        delta_y = abs(1 / dir_y) if dir_y else math.inf
+        step_x = 1 if dir_x >= 0 else -1
+        step_y = 1 if dir_y >= 0 else -1
+        side_x = ((map_x + 1 - x) if dir_x >= 0 else (x - map_x)) * delta_x
+        side_y = ((map_y + 1 - y) if dir_y >= 0 else (y - map_y)) * delta_y
+
+        radius_squared = self.radius * self.radius
+        best: Optional[ObjectKey] = None
+        best_distance = self.max_range
+        tested: Set[ObjectKey] = set()
+        entry = 0.0
+        while entry < best_distance:
+            if walls[game_map.index(map_x, map_y)]:
+                if best_distance > entry:
+                    best = None # The wall stops the shot before the best hit (the padding is a wall too)
+                break
+            for key in self.cells.get((floor, map_x, map_y), ()):
+                if key in tested or key == ignore:
+                    continue
+                tested.add(key)
+                state = store.states[key[0]].get(key[1])
+                if state is None or state.get("is_dead"):
+                    continue
+                position = self.position_at(key, when)
+                if position is None or position[2] != floor:
+                    continue
+                self.tests += 1
+                # Ray against the object's hit circle
+                offset_x, offset_y = position[0] - x, position[1] - y
+                along = offset_x * dir_x + offset_y * dir_y
+                if along < 0:
+                    continue
+                miss_squared = offset_x * offset_x + offset_y * offset_y - along * along
+                if miss_squared > radius_squared:
+                    continue
+                distance = max(0.0, along - math.sqrt(radius_squared - miss_squared))
+                if distance < best_distance:
+                    best, best_distance = key, distance
+            # Next cell; every hit inside this one has been found once the best is no further than its exit
+            exit_distance = min(side_x, side_y)
+            if best is not None and best_distance <= exit_distance:
+                break
+            if side_x < side_y:
+                side_x += delta_x
+                map_x += step_x
+            else:
+                side_y += delta_y
+                map_y += step_y
+            entry = exit_distance
+        return (best, best_distance) if best is not None else None
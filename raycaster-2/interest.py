@@ -0,0 +1,137 @@
+# interest.py
+# Area-of-interest (AOI) bookkeeping for the server: which players, sprites
+# and entities each client currently knows about. Objects are tracked in a
+# SpatialIndex so finding what is near a client only looks at nearby tiles.
+import math
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from spatial_index import SpatialIndex
+
+SECTIONS = ("players", "sprites", "entities") # Same keys as game_state_full / game_state_update
+
+Interest = Dict[str, Set[str]] # section -> object ids
+
+class _Tracked:
+    """Position of one server object, as stored in the spatial index."""
+    __slots__ = ("section", "id", "x", "y", "floor")
+
+    def __init__(self, section: str, object_id: str):
+        self.section = section
+        self.id = object_id
+        self.x = 0.0
+        self.y = 0.0
+        self.floor = 0
+
+
+def _empty_interest() -> Interest:
+    return {section: set() for section in SECTIONS}
+
+
+class InterestManager:
+    """
+    An object is of interest to a viewer if it is on the viewer's floor,
+    within `radius` tiles and (with a visibility table for that floor, see
+    `pvs`: floor -> PotentiallyVisibleSet) in a tile the viewer's tile can see. Once of interest it stays so until it is more
+    than `radius + hysteresis` away, so objects near the edge don't flicker
+    in and out. A viewer is never of interest to itself.
+    Not thread-safe: the server calls it with server_state_lock held.
+    """
+    def __init__(self, radius: float, hysteresis: float = 2.0, pvs: Optional[Dict[int, Any]] = None):
+        self.radius = radius
+        self.hysteresis = hysteresis
+        self.pvs = pvs # Floor -> visibility table; floors without one aren't filtered by visibility
+        self.index = SpatialIndex()
+        self._objects: Dict[Tuple[str, str], _Tracked] = {}
+        self._interest: Dict[str, Interest] = {} # viewer id -> what that client currently knows about
+
+    # --- Objects ---
+    def track(self, section: str, object_id: str, state: Dict[str, Any]):
+        """Adds an object or refreshes its position from its state dict."""
+        key = (section, object_id)
+        tracked = self._objects.get(key)
+        if tracked is None:
+            tracked = self._objects[key] = _Tracked(section, object_id)
+        tracked.x = state.get("x", tracked.x)
+        tracked.y = state.get("y", tracked.y)
+        tracked.floor = state.get("floor", tracked.floor)
+        self.index.update(tracked)
+
+    def untrack(self, section: str, object_id: str):
+        """Forgets an object (e.g. a player that disconnected); viewers drop it without a leave event."""
+        tracked = self._objects.pop((section, object_id), None)
+        if tracked is not None:
+            self.index.remove(tracked)
+        for interest in self._interest.values():
+            interest[section].discard(object_id)
+
+    # --- Viewers ---
+    def add_viewer(self, viewer_id: str, viewer_state: Dict[str, Any]) -> Interest:
+        """Registers a client and returns its initial interest (what its full state should contain)."""
+        interest = _empty_interest()
+        for tracked in self._candidates(viewer_id, viewer_state):
+            if self.is_interesting(viewer_state, tracked, False):
+                interest[tracked.section].add(tracked.id)
+        self._interest[viewer_id] = interest
+        return interest
+
+    def remove_viewer(self, viewer_id: str):
+        self._interest.pop(viewer_id, None)
+
+    def interest_of(self, viewer_id: str) -> Interest:
+        return self._interest.get(viewer_id) or _empty_interest()
+
+    def is_interesting(self, viewer_state: Dict[str, Any], tracked: _Tracked, known: bool) -> bool:
+        """Interest test for one object; `known` applies the hysteresis for objects the viewer already has."""
+        if tracked.floor != viewer_state.get("floor", 0):
+            return False
+        vx, vy = viewer_state.get("x", 0.0), viewer_state.get("y", 0.0)
+        limit = self.radius + self.hysteresis if known else self.radius
+        if math.hypot(tracked.x - vx, tracked.y - vy) > limit:
+            return False
+        pvs = self.pvs.get(tracked.floor) if self.pvs else None # Same floor as the viewer (checked above)
+        return pvs is None or pvs.can_see(vx, vy, tracked.x, tracked.y)
+
+    def update_viewer(self, viewer_id: str, viewer_state: Dict[str, Any], viewer_moved: bool,
+                      changed: Dict[str, Iterable[str]]) -> Tuple[Interest, Interest]:
+        """
+        Brings a viewer's interest up to date and returns (entered, left).
+        If the viewer moved, everything near it is re-evaluated; otherwise
+        only the objects in `changed` (section -> ids) can have entered or left.
+        """
+        interest = self._interest.get(viewer_id)
+        if interest is None:
+            interest = self._interest[viewer_id] = _empty_interest()
+        entered, left = _empty_interest(), _empty_interest()
+
+        if viewer_moved:
+            candidates = self._candidates(viewer_id, viewer_state)
+            now = _empty_interest()
+            for tracked in candidates:
+                if self.is_interesting(viewer_state, tracked, tracked.id in interest[tracked.section]):
+                    now[tracked.section].add(tracked.id)
+            for section in SECTIONS:
+                entered[section] = now[section] - interest[section]
+                left[section] = interest[section] - now[section]
+            self._interest[viewer_id] = now
+            return entered, left
+
+        for section, object_ids in changed.items():
+            known_ids = interest[section]
+            for object_id in object_ids:
+                tracked = self._objects.get((section, object_id))
+                if tracked is None or (section == "players" and object_id == viewer_id):
+                    continue
+                known = object_id in known_ids
+                if self.is_interesting(viewer_state, tracked, known) != known:
+                    (left if known else entered)[section].add(object_id)
+                    if known:
+                        known_ids.discard(object_id)
+                    else:
+                        known_ids.add(object_id)
+        return entered, left
+
+    def _candidates(self, viewer_id: str, viewer_state: Dict[str, Any]) -> List[_Tracked]:
+        """Tracked objects that could be of interest, i.e. within the leave radius (excluding the viewer)."""
+        found = self.index.query_radius(viewer_state.get("x", 0.0), viewer_state.get("y", 0.0),
+                                        self.radius + self.hysteresis)
+        return [tracked for tracked in found if not (tracked.section == "players" and tracked.id == viewer_id)]
@@ -0,0 +1,107 @@
+# interpolation.py
+# Smooths networked movement: objects are drawn slightly in the past, between
+# the two server snapshots around that time, instead of jumping to each new
+# packet as it arrives.
+import math
+from typing import Optional, Tuple
+
+import config
+
+def wrap_angle(angle: float) -> float:
+    """Maps an angle difference into [-pi, pi)."""
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+def lerp_angle(a: float, b: float, t: float) -> float:
+    """Blends from `a` to `b` along the shorter way round the circle."""
+    return (a + wrap_angle(b - a) * t) % (2 * math.pi)
+
+
+class SnapshotBuffer:
+    """
+    Fixed-size ring of timestamped (x, y, angle) snapshots, oldest first.
+    sample(t) interpolates between the two snapshots around `t`. Past the
+    newest snapshot it extrapolates along the last observed velocity for at
+    most `max_extrapolation` seconds, then holds.
+    """
+    def __init__(self, capacity: int = config.SNAPSHOT_BUFFER_SIZE,
+                 max_extrapolation: float = config.MAX_EXTRAPOLATION):
+        self.capacity = capacity
+        self.max_extrapolation = max_extrapolation
+        self.times = [0.0] * capacity
+        self.xs = [0.0] * capacity
+        self.ys = [0.0] * capacity
+        self.angles = [0.0] * capacity
+        self.start = 0 # Slot of the oldest snapshot
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _slot(self, i: int) -> int:
+        """Ring slot of the i-th snapshot (0 = oldest, -1 = newest)."""
+        if i < 0:
+            i += self.count
+        return (self.start + i) % self.capacity
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+    def push(self, time: float, x: float, y: float, angle: float):
+        """Adds a snapshot; one at the same time as (or before) the newest replaces it."""
+        if self.count and time <= self.times[self._slot(-1)]:
+            slot = self._slot(-1) # Several packets handled in the same frame: keep the latest state
+            time = self.times[slot]
+        elif self.count < self.capacity:
+            slot = self._slot(self.count)
+            self.count += 1
+        else:
+            slot = self.start # Full: overwrite the oldest
+            self.start = (self.start + 1) % self.capacity
+        self.times[slot] = time
+        self.xs[slot] = x
+        self.ys[slot] = y
+        self.angles[slot] = angle
+
+    def shift(self, delta: float):
+        """Moves every snapshot `delta` seconds in time (e.g. onto another clock)."""
+        for i in range(self.count):
+            self.times[self._slot(i)] += delta
+
+    def newest_time(self) -> Optional[float]:
+        return self.times[self._slot(-1)] if self.count else None
+
+    def sample(self, time: float) -> Optional[Tuple[float, float, float]]:
+        """(x, y, angle) at `time`, or None if the buffer is empty."""
+        if self.count == 0:
+            return None
+        first = self._slot(0)
+        if time <= self.times[first]:
+            return self.xs[first], self.ys[first], self.angles[first]
+
+        newest = self._slot(-1)
+        if time >= self.times[newest]:
+            if self.count == 1:
+                return self.xs[newest], self.ys[newest], self.angles[newest]
+            # Extrapolate from the last two snapshots, for a bounded time
+            previous = self._slot(-2)
+            span = self.times[newest] - self.times[previous]
+            ahead = min(time - self.times[newest], self.max_extrapolation)
+            if span <= 0 or ahead <= 0:
+                return self.xs[newest], self.ys[newest], self.angles[newest]
+            t = ahead / span
+            return (self.xs[newest] + (self.xs[newest] - self.xs[previous]) * t,
+                    self.ys[newest] + (self.ys[newest] - self.ys[previous]) * t,
+                    self.angles[newest])
+
+        # Newest-first scan: render time is almost always in the last couple of intervals
+        for i in range(self.count - 2, -1, -1):
+            a = self._slot(i)
+            if self.times[a] <= time:
+                b = self._slot(i + 1)
+                t = (time - self.times[a]) / (self.times[b] - self.times[a])
+                return (self.xs[a] + (self.xs[b] - self.xs[a]) * t,
+                        self.ys[a] + (self.ys[b] - self.ys[a]) * t,
+                        lerp_angle(self.angles[a], self.angles[b], t))
+        return self.xs[first], self.ys[first], self.angles[first]
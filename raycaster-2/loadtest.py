@@ -0,0 +1,484 @@
+# loadtest.py
+# Server load test: a swarm of headless clients in one process (one asyncio
+# event loop) against server.py, started in a subprocess. Each client
+# negotiates the wire protocol like NetworkClient, then walks scripted paths
+# through the map it is sent (BFS between random open tiles, steering with
+# the same key commands and movement.step prediction as the game) and sends
+# player_input at NETWORK_UPDATE_RATE. Usage:
+#   python loadtest.py [--clients 10 50 100] [--mode threaded asyncio] [--seconds N]
+#                      [--protocol binary/4|json] [--connect HOST:PORT]
+#                      [--json] [--output report.json] [--compare old_report.json]
+# Reports, per mode and client count:
+# - handshake time (connect to handshake_ack) and join time (to game_state_full)
+# - update round trip: sending an input batch to receiving the
+#   player_state_correction that acknowledges it (includes waiting for the
+#   next server tick, so about half a tick at best)
+# - inbound bandwidth and messages, disconnects, mispredictions (corrections
+#   that disagree with the client's own prediction; should be 0)
+# - the server's CPU use (not with --connect, which tests a running server)
+# The report is JSON with --json/--output; --compare prints the differences
+# from an earlier report, e.g. one taken with the previous server version.
+# The clients need CPU too: if the load test's own CPU use (reported) nears a
+# full core, or the two together near the machine's cores, the timings are
+# the clients' limit rather than the server's.
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+import movement
+from map import GameMap
+from protocol import PROTOCOL_VERSION, JsonCodec, MessageReader, ProtocolError, make_codec
+
+try:
+    import psutil
+except ImportError:
+    psutil = None # Server CPU is read from /proc instead (Linux only)
+
+LOAD_HOST = "127.0.0.1"
+LOAD_PORT = 5599
+COMMANDS_PER_SEND = max(1, round(config.TARGET_FPS * config.NETWORK_UPDATE_RATE)) # Frames per player_input
+COMMAND_DT = movement.quantize_dt(1 / config.TARGET_FPS)
+CONNECT_SPREAD = 1.0 # Seconds over which the clients connect, so the server isn't hit by all handshakes at once
+SETTLE_TIME = 1.0 # Seconds between the last connect and the start of the measurement
+SERVER_START_TIMEOUT = 10.0
+WAYPOINT_RADIUS = 0.25 # Tiles from a waypoint's centre at which it counts as reached
+STUCK_TIME = 3.0 # Seconds without reaching a waypoint before a client plans a new path
+RUN_CHANCE = 0.3 # Fraction of paths walked running
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize_ms(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/max of durations in seconds, in milliseconds (None without samples)."""
+    return {name: percentile(values, fraction) * 1000 if values else None
+            for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))}
+
+
+def find_path(game_map: GameMap, start: Tuple[int, int], goal: Tuple[int, int]) -> List[Tuple[int, int]]:
+    """Tiles from start (exclusive) to goal, 4-connected through open tiles of the bound floor; empty if unreachable."""
+    came_from: Dict[Tuple[int, int], Optional[Tuple[int, int]]] = {start: None}
+    frontier = deque([start])
+    while frontier:
+        tile = frontier.popleft()
+        if tile == goal:
+            path = []
+            while tile != start:
+                path.append(tile)
+                tile = came_from[tile]
+            path.reverse()
+            return path
+        x, y = tile
+        for neighbour in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if neighbour not in came_from and not game_map.is_wall(neighbour[0] + 0.5, neighbour[1] + 0.5):
+                came_from[neighbour] = tile
+                frontier.append(neighbour)
+    return []
+
+
+class LoadStats:
+    """Counters shared by all clients; only handshakes are counted before the measurement window starts."""
+    def __init__(self):
+        self.measuring = False
+        self.handshake_times: List[float] = []
+        self.join_times: List[float] = []
+        self.round_trips: List[float] = []
+        self.messages = 0
+        self.bytes = 0
+        self.connected = 0
+        self.joined = 0
+        self.disconnects = 0
+        self.errors = 0
+        self.corrections = 0
+        self.mispredictions = 0
+        self.waypoints = 0
+        self.game_map: Optional[GameMap] = None # Shared by the clients (one event loop; each binds its floor before use)
+
+
+class LoadClient:
+    """One headless client walking scripted paths; seeded by its index, so runs are repeatable."""
+    def __init__(self, index: int, protocol: str, stats: LoadStats):
+        self.index = index
+        self.protocol = protocol
+        self.stats = stats
+        self.rng = random.Random(index)
+        self.client_id: Optional[str] = None
+        self.connect_time = 0.0
+        # Predicted state (None until the server has told us where we are)
+        self.state: Optional[List[Any]] = None # [x, y, angle, floor]
+        self.path: List[Tuple[int, int]] = []
+        self.running = False
+        self.last_progress = 0.0
+        self.seq = 0
+        self.pending: deque = deque() # (seq, dt, keys) not yet acknowledged, for reconciliation
+        self.sent_at: Dict[int, float] = {} # Last seq of each unacknowledged batch -> send time
+        self.codec = JsonCodec()
+        self.reader = MessageReader(JsonCodec())
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.joined = asyncio.Event()
+
+    async def run(self, host: str, port: int, stop: asyncio.Event):
+        self.connect_time = time.perf_counter()
+        try:
+            stream_reader, self.writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            print(f"Client {self.index}: connection failed: {e}")
+            self.stats.errors += 1
+            return
+        self.stats.connected += 1
+        receiver = asyncio.create_task(self.receive(stream_reader, stop))
+        joined = asyncio.create_task(self.joined.wait())
+        try:
+            # The game only starts sending input once it has the full state
+            await asyncio.wait([receiver, joined], return_when=asyncio.FIRST_COMPLETED)
+            while not stop.is_set() and not receiver.done():
+                self.send_inputs()
+                try:
+                    await asyncio.wait_for(stop.wait(), config.NETWORK_UPDATE_RATE)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.writer.close()
+            for task in (receiver, joined):
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    # --- Scripted movement ---
+    def plan(self, now: float):
+        """Picks a random open tile and a path to it from the current tile."""
+        game_map = self.stats.game_map
+        x, y, _, floor = self.state
+        movement.bind_floor(game_map, floor)
+        for _ in range(10): # A few tries: the pick may be a wall or unreachable
+            goal = (self.rng.randrange(game_map.width), self.rng.randrange(game_map.height))
+            if not game_map.is_wall(goal[0] + 0.5, goal[1] + 0.5):
+                self.path = find_path(game_map, (int(x), int(y)), goal)
+                if self.path:
+                    break
+        self.running = self.rng.random() < RUN_CHANCE
+        self.last_progress = now
+
+    def steer(self, now: float) -> int:
+        """Keys for one frame: turn towards the next waypoint, walk once roughly facing it."""
+        if self.state is None or self.stats.game_map is None:
+            return 0
+        if not self.path or now - self.last_progress > STUCK_TIME:
+            self.plan(now)
+            if not self.path:
+                return movement.KEY_TURN_LEFT # Boxed in (or map not walkable): turn on the spot
+        x, y, angle, _ = self.state
+        target_x, target_y = self.path[0][0] + 0.5, self.path[0][1] + 0.5
+        if math.hypot(target_x - x, target_y - y) < WAYPOINT_RADIUS:
+            self.path.pop(0)
+            self.last_progress = now
+            self.stats.waypoints += 1
+            return self.steer(now) if self.path else 0
+        # Signed angle to the waypoint in -PI..PI; turning right increases the angle (see movement.step)
+        error = (math.atan2(target_y - y, target_x - x) - angle + math.pi) % (2 * math.pi) - math.pi
+        turn = config.PLAYER_ROTATION_SPEED * COMMAND_DT
+        keys = 0
+        if error > turn / 2:
+            keys |= movement.KEY_TURN_RIGHT
+        elif error < -turn / 2:
+            keys |= movement.KEY_TURN_LEFT
+        if abs(error) < 0.6:
+            keys |= movement.KEY_FORWARD | (movement.KEY_RUN if self.running else 0)
+        return keys
+
+    def predict(self, keys: int):
+        if self.state is None or self.stats.game_map is None:
+            return
+        x, y, angle, floor = self.state
+        movement.bind_floor(self.stats.game_map, floor)
+        x, y, angle, floor, _ = movement.step(x, y, angle, floor, keys, COMMAND_DT, self.stats.game_map)
+        self.state = [x, y, angle, floor]
+
+    def send_inputs(self):
+        now = time.perf_counter()
+        commands = []
+        for _ in range(COMMANDS_PER_SEND):
+            keys = self.steer(now)
+            self.predict(keys)
+            self.seq += 1
+            self.pending.append((self.seq, COMMAND_DT, keys))
+            commands.append([COMMAND_DT, keys])
+        while len(self.pending) > config.INPUT_HISTORY_SIZE:
+            self.pending.popleft()
+        self.sent_at[self.seq] = now
+        first_seq = self.seq - len(commands) + 1
+        self.writer.write(self.codec.encode({"type": "player_input", "payload": {"seq": first_seq, "commands": commands}}))
+
+    def reconcile(self, payload: Dict[str, Any]):
+        """Like Player.reconcile, but snaps: the server's state at `ack` plus the commands it hasn't processed yet."""
+        ack = payload.get("ack", 0)
+        while self.pending and self.pending[0][0] <= ack:
+            self.pending.popleft()
+        if self.state is None:
+            if all(key in payload for key in ("x", "y", "angle", "floor")):
+                self.state = [payload["x"], payload["y"], payload["angle"], payload["floor"]]
+            return
+        x, y = payload.get("x", self.state[0]), payload.get("y", self.state[1])
+        angle, floor = payload.get("angle", self.state[2]), payload.get("floor", self.state[3])
+        for _, dt, keys in self.pending:
+            movement.bind_floor(self.stats.game_map, floor)
+            x, y, angle, floor, _ = movement.step(x, y, angle, floor, keys, dt, self.stats.game_map)
+        self.stats.corrections += 1
+        if floor != self.state[3] or math.hypot(x - self.state[0], y - self.state[1]) > config.RECONCILE_EPSILON:
+            if self.stats.measuring:
+                self.stats.mispredictions += 1
+            self.state = [x, y, angle, floor]
+
+    # --- Receiving ---
+    async def receive(self, stream_reader: asyncio.StreamReader, stop: asyncio.Event):
+        stats = self.stats
+        try:
+            while True:
+                data = await stream_reader.read(65536)
+                if not data:
+                    if not stop.is_set():
+                        print(f"Client {self.index}: server closed the connection")
+                        stats.disconnects += 1
+                    return
+                if stats.measuring:
+                    stats.bytes += len(data)
+                self.reader.feed(data)
+                for message in self.reader.messages():
+                    if stats.measuring:
+                        stats.messages += 1
+                    self.handle(message)
+        except (ConnectionError, ProtocolError) as e:
+            if not stop.is_set():
+                print(f"Client {self.index}: {e}")
+                stats.disconnects += 1
+
+    def handle(self, message: Dict[str, Any]):
+        msg_type = message.get("type")
+        payload = message.get("payload") or {}
+        if msg_type == "player_state_correction":
+            ack = payload.get("ack", 0)
+            now = time.perf_counter()
+            for last_seq in [seq for seq in self.sent_at if seq <= ack]:
+                sent_at = self.sent_at.pop(last_seq)
+                if self.stats.measuring:
+                    self.stats.round_trips.append(now - sent_at)
+            self.reconcile(payload)
+        elif msg_type == "handshake_ack":
+            self.client_id = payload.get("client_id")
+            self.stats.handshake_times.append(time.perf_counter() - self.connect_time)
+            codec = make_codec(self.protocol)
+            if self.protocol != JsonCodec.name and codec is not None and self.protocol in payload.get("protocols", []):
+                self.writer.write(self.codec.encode({"type": "protocol_select", "payload": {"protocol": self.protocol}}))
+                self.codec = codec
+        elif msg_type == "protocol_ack":
+            codec = make_codec(payload.get("protocol", ""))
+            if codec is not None:
+                self.reader.codec = codec
+        elif msg_type == "game_state_full" and not self.joined.is_set():
+            grid = (payload.get("map") or {}).get("grid")
+            if self.stats.game_map is None and grid:
+                self.stats.game_map = GameMap()
+                self.stats.game_map.update_map(grid)
+            own = (payload.get("players") or {}).get(self.client_id)
+            if own is not None:
+                self.state = [own["x"], own["y"], own["angle"], own.get("floor", 0)]
+            self.stats.join_times.append(time.perf_counter() - self.connect_time)
+            self.stats.joined += 1
+            self.joined.set()
+
+
+async def run_clients(host: str, port: int, count: int, seconds: float, protocol: str, on_measure=None) -> LoadStats:
+    """Connects `count` clients, lets them settle, then measures for `seconds`."""
+    stats = LoadStats()
+    stop = asyncio.Event()
+    tasks = []
+    for index in range(count):
+        tasks.append(asyncio.create_task(LoadClient(index, protocol, stats).run(host, port, stop)))
+        await asyncio.sleep(CONNECT_SPREAD / count)
+    await asyncio.sleep(SETTLE_TIME) # Handshakes, protocol switches, full states
+    if on_measure is not None:
+        on_measure()
+    stats.measuring = True
+    await asyncio.sleep(seconds)
+    stats.measuring = False
+    stop.set()
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def server_cpu_seconds(pid: int) -> Optional[float]:
+    """User + system CPU time used so far by process `pid` (None if it can't be read on this platform)."""
+    if psutil is not None:
+        times = psutil.Process(pid).cpu_times()
+        return times.user + times.system
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK") # utime, stime
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def start_server(mode: str, port: int) -> subprocess.Popen:
+    """Starts server.py on LOAD_HOST:port and waits until it accepts connections."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen([sys.executable, "server.py", "--mode", mode, "--host", LOAD_HOST, "--port", str(port)],
+                               cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py --mode {mode} exited with code {process.returncode}")
+        try:
+            socket.create_connection((LOAD_HOST, port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"server.py --mode {mode} did not start listening within {SERVER_START_TIMEOUT:.0f} s")
+
+
+def source_revision() -> Optional[str]:
+    """Git revision of this checkout (with "-dirty" if it has changes), to tell reports apart; None outside git."""
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_once(mode: str, address: Optional[str], count: int, seconds: float, protocol: str) -> Dict[str, Any]:
+    """One measurement: starts a server (unless `address` is given), runs the swarm and returns the report row."""
+    process = None
+    if address is None:
+        host, port = LOAD_HOST, LOAD_PORT
+        process = start_server(mode, port)
+    else:
+        host, port_text = address.rsplit(":", 1)
+        port = int(port_text)
+    cpu = {}
+
+    def on_measure():
+        cpu["wall"], cpu["own"] = time.perf_counter(), time.process_time()
+        if process is not None:
+            cpu["start"] = server_cpu_seconds(process.pid)
+
+    try:
+        stats = asyncio.run(run_clients(host, port, count, seconds, protocol, on_measure))
+        elapsed = time.perf_counter() - cpu["wall"]
+        own_percent = (time.process_time() - cpu["own"]) / elapsed * 100
+        cpu_percent = None
+        if process is not None and cpu.get("start") is not None:
+            used = server_cpu_seconds(process.pid)
+            if used is not None:
+                cpu_percent = (used - cpu["start"]) / elapsed * 100
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    return {
+        "mode": mode, "clients": count, "connected": stats.connected, "joined": stats.joined,
+        "disconnects": stats.disconnects, "connect_errors": stats.errors,
+        "server_cpu_percent": cpu_percent, "load_test_cpu_percent": own_percent,
+        "handshake_ms": summarize_ms(stats.handshake_times),
+        "join_ms": summarize_ms(stats.join_times),
+        "updates": len(stats.round_trips),
+        "update_rtt_ms": summarize_ms(stats.round_trips),
+        "inbound_kb_per_s": stats.bytes / seconds / 1024,
+        "inbound_kb_per_s_per_client": stats.bytes / seconds / 1024 / max(1, stats.joined),
+        "inbound_messages_per_s": stats.messages / seconds,
+        "mispredictions": stats.mispredictions,
+        "waypoints_reached": stats.waypoints,
+    }
+
+
+def load_test(modes: List[str], client_counts: List[int], seconds: float, protocol: str, connect: Optional[str],
+              as_json: bool, output: Optional[str] = None, compare: Optional[str] = None):
+    targets = modes if connect is None else ["external"]
+    results = []
+    for mode in targets:
+        for count in client_counts:
+            row = run_once(mode, connect, count, seconds, protocol)
+            results.append(row)
+            if not as_json:
+                print_row(row)
+    report = {
+        "revision": source_revision(), "protocol_version": PROTOCOL_VERSION, "protocol": protocol,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "seconds": seconds,
+        "tick_rate": 1 / config.SERVER_TICK_RATE, "update_rate": 1 / config.NETWORK_UPDATE_RATE,
+        "results": results,
+    }
+    if as_json:
+        print(json.dumps(report, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {output}")
+    if compare:
+        with open(compare) as f:
+            print_comparison(json.load(f), report)
+
+
+def print_row(row: Dict[str, Any]):
+    cpu = "n/a" if row["server_cpu_percent"] is None else f"{row['server_cpu_percent']:5.1f}%"
+    rtt, join = row["update_rtt_ms"], row["join_ms"]
+    if rtt["p50"] is None:
+        timings = "no updates acknowledged"
+    else:
+        timings = f"update RTT p50 {rtt['p50']:6.1f} ms  p95 {rtt['p95']:6.1f}  p99 {rtt['p99']:6.1f}  max {rtt['max']:6.1f}"
+    joined = "no client joined" if join["p50"] is None else f"join p50 {join['p50']:.0f} ms  max {join['max']:.0f}"
+    print(f"{row['mode']:>9} {row['clients']:>4} clients: server CPU {cpu} (load test {row['load_test_cpu_percent']:.0f}%)"
+          f"  {timings}  {joined}")
+    print(f"{'':>23}{row['inbound_kb_per_s']:.0f} KB/s in ({row['inbound_kb_per_s_per_client']:.1f} per client), "
+          f"{row['inbound_messages_per_s']:.0f} msgs/s, {row['disconnects']} disconnects, "
+          f"{row['mispredictions']} mispredictions")
+
+
+def print_comparison(old: Dict[str, Any], new: Dict[str, Any]):
+    """Changes from an earlier report, for rows with the same mode and client count."""
+    print(f"Compared with {old.get('revision') or 'unknown revision'} ({old.get('time', '?')}):")
+    previous = {(row["mode"], row["clients"]): row for row in old.get("results", [])}
+    for row in new["results"]:
+        before = previous.get((row["mode"], row["clients"]))
+        if before is None:
+            print(f"{row['mode']:>9} {row['clients']:>4} clients: not in the earlier report")
+            continue
+        changes = []
+        for label, key, sub in (("server CPU %", "server_cpu_percent", None), ("RTT p50 ms", "update_rtt_ms", "p50"),
+                                ("RTT p99 ms", "update_rtt_ms", "p99"), ("join p99 ms", "join_ms", "p99"),
+                                ("KB/s in", "inbound_kb_per_s", None), ("disconnects", "disconnects", None)):
+            old_value = before.get(key) if sub is None else (before.get(key) or {}).get(sub)
+            new_value = row.get(key) if sub is None else (row.get(key) or {}).get(sub)
+            if old_value is None or new_value is None:
+                continue
+            changes.append(f"{label} {old_value:.1f} -> {new_value:.1f}")
+        print(f"{row['mode']:>9} {row['clients']:>4} clients: " + ", ".join(changes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Raycaster server load test")
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 50, 100], help="Client counts to test")
+    parser.add_argument("--mode", nargs="+", choices=["threaded", "asyncio"], default=["threaded", "asyncio"],
+                        help="Server modes to start (see server.py --mode)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Measurement time per run")
+    parser.add_argument("--protocol", default=config.NETWORK_PROTOCOL, help="Wire protocol the clients request")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="Test a running server instead of starting one")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--output", metavar="FILE", help="Also write the JSON report to FILE")
+    parser.add_argument("--compare", metavar="FILE", help="Print the changes from an earlier JSON report")
+    args = parser.parse_args()
+    load_test(args.mode, args.clients, args.seconds, args.protocol, args.connect, args.json, args.output, args.compare)
@@ -11,27 +11,42 @@ from player import Player
 from remote_player import RemotePlayer # Only the class needed here
 from sprite import Sprite
 from entity import Entity
-from network import NetworkClient
+from network import NetworkClient, ThreadedNetworkClient, UdpNetworkClient
 from renderer import Renderer
+from spatial_index import SpatialIndex
 
 class Game:
-    def __init__(self):
-        # Initialization
-        pr.init_window(config.SCREEN_WIDTH, config.SCREEN_HEIGHT, "Python Raycaster Multiplayer")
-        pr.set_target_fps(config.TARGET_FPS)
-        # pr.hide_cursor() # Optional: Hide cursor during gameplay
+    def __init__(self, headless: bool = False, networked: bool = True):
+        # headless: no window or GPU, frames are rendered into the software framebuffer only
+        # networked: False runs a local session without contacting the server
+        self.headless = headless
+        self.networked = networked
 
-        self.assets_manager = AssetsManager()
+        # Initialization
+        if not headless:
+            pr.init_window(config.SCREEN_WIDTH, config.SCREEN_HEIGHT, "Python Raycaster Multiplayer")
+            pr.set_target_fps(config.TARGET_FPS)
+            # pr.hide_cursor() # Optional: Hide cursor during gameplay
+
+        # The software backend samples textures on the CPU, so keep their pixels around
+        self.assets_manager = AssetsManager(use_gpu=not headless,
+                                            keep_pixels=headless or config.RENDER_BACKEND == "software")
         self.game_map = GameMap()
         self.player = Player(config.PLAYER_START_X, config.PLAYER_START_Y, config.PLAYER_START_ANGLE)
-        self.network_client = NetworkClient()
-        self.renderer = Renderer(self.assets_manager)
+        # Threaded: the frame never waits on the socket (receive, send and reconnects happen in the background)
+        if config.NETWORK_TRANSPORT == "udp":
+            self.network_client = UdpNetworkClient() # Never blocks either; lost state datagrams are superseded, not resent
+        else:
+            self.network_client = ThreadedNetworkClient() if config.NETWORK_THREADED else NetworkClient()
+        # Tile buckets of every remote player/sprite/entity; objects keep their own entry current
+        self.spatial_index = SpatialIndex()
+        self.renderer = Renderer(self.assets_manager, headless=headless, spatial_index=self.spatial_index)
 
         # Game State Management
         self.remote_players: dict[str, RemotePlayer] = {}
         self.sprites: dict[str, Sprite] = {}
         self.entities: dict[str, Entity] = {}
-        self.game_state = config.STATE_CONNECTING # Start in connecting state
+        self.game_state = config.STATE_CONNECTING if networked else config.STATE_PLAYING # Start in connecting state
         self.client_id: Optional[str] = None # Assigned by server upon connection
 
         # Timing for network updates
@@ -59,21 +74,26 @@ class Game:
             self.update(delta_time)
 
             # --- Draw ---
-            self.renderer.draw_frame(self.player, self.game_map, self.remote_players, self.sprites, self.entities)
+            self.draw()
 
         self.shutdown()
 
+    def draw(self):
+        """Renders the current game state (to the window, or the framebuffer when headless)."""
+        self.renderer.draw_frame(self.player, self.game_map, self.remote_players, self.sprites, self.entities)
+
     def update(self, delta_time: float):
         """Handles all game logic updates for a frame."""
 
         # Handle Network Updates (Receive)
-        if self.network_client.connected:
-            server_messages = self.network_client.receive_data()
-            self.process_server_messages(server_messages)
-        elif self.game_state != config.STATE_CONNECTING:
-            # If disconnected unexpectedly, maybe try reconnecting or go to a menu
-            print("Connection lost. Attempting to reconnect...")
-            self.game_state = config.STATE_CONNECTING
+        if self.networked:
+            if self.network_client.connected:
+                server_messages = self.network_client.receive_data()
+                self.process_server_messages(server_messages)
+            elif self.game_state != config.STATE_CONNECTING:
+                # If disconnected unexpectedly, maybe try reconnecting or go to a menu
+                print("Connection lost. Attempting to reconnect...")
+                self.game_state = config.STATE_CONNECTING
 
 
         # Update based on Game State
@@ -82,30 +102,38 @@ class Game:
                  # Connection successful, wait for server handshake (e.g., client ID assignment)
                  # For now, just switch to playing - server needs to send initial state
                  print("Connected. Waiting for server state...")
+                 self.player.reset_inputs() # The server numbers this connection's input commands from 1
                  # Assume server will send initial state shortly
                  self.game_state = config.STATE_PLAYING # Or a STATE_LOADING if needed
-            else:
-                # Failed connection, maybe show an error message, wait and retry?
-                # For now, we just keep trying in the loop. Add delay?
-                 time.sleep(1.0) # Wait before retrying
+            elif self.network_client.blocking_connect:
+                # Failed connection, maybe show an error message?
+                # The threaded and UDP clients retry without blocking; this one blocks the loop between attempts
+                 time.sleep(config.NETWORK_RECONNECT_DELAY) # Wait before retrying
 
         elif self.game_state == config.STATE_PLAYING:
             # Update local player (input and movement)
             self.player.update(delta_time, self.game_map)
+            # Remote players are drawn slightly in the past, between their last two updates
+            now = time.monotonic()
+            for remote_player in self.remote_players.values():
+                remote_player.interpolate(now)
+            if self.player.floor != self.game_map.floor:
+                # Rode an elevator: rendering and collision follow the player to the new floor
+                self.game_map.set_floor(self.player.floor)
 
             # Update other game logic if needed (e.g., local effects)
 
             # Handle Network Updates (Send)
             current_time = time.time()
-            if self.network_client.connected and (current_time - self.last_network_send_time >= config.NETWORK_UPDATE_RATE):
-                player_state = self.player.get_state_dict()
-                self.network_client.send_data({
-                    "type": "player_update",
-                    "payload": player_state
-                })
+            if self.networked and self.network_client.connected and (current_time - self.last_network_send_time >= config.NETWORK_UPDATE_RATE):
+                # The server simulates the same commands and corrects us if it disagrees (see Player.reconcile)
+                commands = self.player.take_unsent_inputs()
+                if commands:
+                    self.network_client.send_data({
+                        "type": "player_input",
+                        "payload": {"seq": commands[0][0], "commands": [[dt, keys] for _, dt, keys in commands]}
+                    })
                 self.last_network_send_time = current_time
-                # Reset one-shot flags after sending
-                if self.player.is_shooting: self.player.is_shooting = False
 
 
         elif self.game_state == config.STATE_GAME_OVER:
@@ -114,7 +142,7 @@ class Game:
                 self.reset_game() # Example reset function
 
         # --- Check for connection loss outside receive block ---
-        if not self.network_client.connected and self.game_state == config.STATE_PLAYING:
+        if self.networked and not self.network_client.connected and self.game_state == config.STATE_PLAYING:
              print("Lost connection during gameplay.")
              self.game_state = config.STATE_CONNECTING # Try to reconnect
 
@@ -150,21 +178,23 @@ class Game:
                 player_id = payload.get("client_id")
                 if player_id and player_id in self.remote_players:
                     print(f"Player {player_id} disconnected.")
-                    del self.remote_players[player_id]
+                    self.spatial_index.remove(self.remote_players.pop(player_id))
 
             elif msg_type == "entity_update": # Example for single entity change
                  entity_id = payload.get("id")
                  if entity_id and entity_id in self.entities:
                      self.entities[entity_id].update_from_server(payload)
                  else: # New entity perhaps?
-                     self.entities[entity_id] = Entity(entity_id, payload)
+                     self.entities[entity_id] = Entity(entity_id, payload, self.spatial_index)
 
 
             elif msg_type == "map_update":
                  self.game_map.update_map(payload.get("grid", []))
 
             elif msg_type == "player_state_correction":
-                 # Server corrects local player state (e.g. health, death, possibly pos)
+                 # Server corrects local player state (e.g. health, death, position after our acknowledged inputs)
+                 if "ack" in payload:
+                     self.player.reconcile(payload, self.game_map)
                  self.player.apply_server_update(payload)
                  if self.player.is_dead and self.game_state != config.STATE_GAME_OVER:
                       print("Player died.")
@@ -197,12 +227,12 @@ class Game:
                 self.remote_players[pid].update_from_server(remote_players_data[pid])
             else:
                 print(f" Adding new remote player: {pid}")
-                self.remote_players[pid] = RemotePlayer(pid, remote_players_data[pid])
+                self.remote_players[pid] = RemotePlayer(pid, remote_players_data[pid], self.spatial_index)
 
         # Remove players no longer present in server state
         for pid in current_remote_ids - server_remote_ids:
             print(f" Removing stale remote player: {pid}")
-            del self.remote_players[pid]
+            self.spatial_index.remove(self.remote_players.pop(pid))
 
 
         # Update generic sprites
@@ -215,10 +245,10 @@ class Game:
                  self.sprites[sid].update_from_server(sprites_data[sid])
              else:
                   print(f" Adding new sprite: {sid}")
-                  self.sprites[sid] = Sprite(sid, sprites_data[sid])
+                  self.sprites[sid] = Sprite(sid, sprites_data[sid], self.spatial_index)
         for sid in current_sprite_ids - server_sprite_ids:
              print(f" Removing stale sprite: {sid}")
-             del self.sprites[sid]
+             self.spatial_index.remove(self.sprites.pop(sid))
 
 
         # Update entities
@@ -231,10 +261,10 @@ class Game:
                  self.entities[eid].update_from_server(entities_data[eid])
              else:
                   print(f" Adding new entity: {eid}")
-                  self.entities[eid] = Entity(eid, entities_data[eid])
+                  self.entities[eid] = Entity(eid, entities_data[eid], self.spatial_index)
         for eid in current_entity_ids - server_entity_ids:
              print(f" Removing stale entity: {eid}")
-             del self.entities[eid]
+             self.spatial_index.remove(self.entities.pop(eid))
 
         # Ensure playing state if we received a full update
         if self.game_state != config.STATE_GAME_OVER: # Don't override game over
@@ -255,7 +285,7 @@ class Game:
                 self.remote_players[pid].update_from_server(pdata)
             else: # New player joined mid-game
                  print(f" New player joined (incremental): {pid}")
-                 self.remote_players[pid] = RemotePlayer(pid, pdata)
+                 self.remote_players[pid] = RemotePlayer(pid, pdata, self.spatial_index)
 
         # Update specific sprites
         sprite_updates = update_data.get("sprites", {})
@@ -264,7 +294,7 @@ class Game:
                  self.sprites[sid].update_from_server(sdata)
              else:
                   print(f" New sprite added (incremental): {sid}")
-                  self.sprites[sid] = Sprite(sid, sdata)
+                  self.sprites[sid] = Sprite(sid, sdata, self.spatial_index)
 
         # Update specific entities
         entity_updates = update_data.get("entities", {})
@@ -273,30 +303,41 @@ class Game:
                  self.entities[eid].update_from_server(edata)
              else:
                   print(f" New entity added (incremental): {eid}")
-                  self.entities[eid] = Entity(eid, edata)
+                  self.entities[eid] = Entity(eid, edata, self.spatial_index)
 
-        # Handle removals (server might send a specific removal message or just stop sending updates for that ID)
-        # Handling removals via dedicated messages (like 'player_disconnect') is more robust.
+        # Objects that left our area of interest (the server stops updating them, so drop them)
+        removed = update_data.get("removed", {})
+        for section, objects in (("players", self.remote_players), ("sprites", self.sprites), ("entities", self.entities)):
+            for object_id in removed.get(section, []):
+                if object_id in objects:
+                    self.spatial_index.remove(objects.pop(object_id))
 
     def reset_game(self):
         """Resets the game state (e.g., after death)."""
         print("Resetting game...")
         self.player = Player(config.PLAYER_START_X, config.PLAYER_START_Y, config.PLAYER_START_ANGLE)
+        self.game_map.set_floor(self.player.floor)
         # Clear dynamic objects (server should resend them)
         self.remote_players.clear()
         self.sprites.clear()
         self.entities.clear()
-        # Re-request state from server or wait for it? Best practice: server sends state on respawn command.
-        # For now, just go back to playing/connecting state
-        self.game_state = config.STATE_CONNECTING # Or STATE_PLAYING if server auto-sends state
+        self.spatial_index.clear()
+        if self.networked and self.network_client.connected:
+            # Same connection: the server respawns us and resends the full state; the new Player numbers its inputs from 1
+            self.network_client.send_data({"type": "respawn", "payload": {}})
+            self.game_state = config.STATE_PLAYING
+        else:
+            self.game_state = config.STATE_CONNECTING if self.networked else config.STATE_PLAYING # A new connection spawns a new player
 
     def shutdown(self):
         """Cleans up resources before exiting."""
         print("Shutting down...")
+        self.renderer.unload()
         self.unload_content()
         if self.network_client.connected:
             self.network_client.disconnect()
-        pr.close_window()
+        if not self.headless:
+            pr.close_window()
         print("Shutdown complete.")
 
 
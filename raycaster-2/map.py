@@ -1,43 +1,179 @@
 # map.py
-from typing import List, Tuple
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+MAP_PADDING = 1     # Solid tiles around each floor on every side
+BORDER_TILE = 255   # Tile ID stored in the padding (never a real texture ID)
+MAX_TILE_ID = BORDER_TILE - 1
+ELEVATOR_TILE = 8   # Walkable tile that moves the player between floors (same ID as the live-map server)
+
+DEFAULT_GRID: List[List[int]] = [
+    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+    [1, 0, 0, 0, 2, 0, 0, 0, 0, 1],
+    [1, 0, 1, 0, 0, 0, 1, 0, 0, 1],
+    [1, 0, 2, 0, 0, 0, 3, 0, 0, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 0, 0, 0, 3, 0, 0, 0, 0, 1],
+    [1, 0, 0, 0, 1, 0, 1, 0, 0, 1],
+    [1, 0, 2, 0, 0, 0, 2, 0, 0, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+]
 
 class GameMap:
-    #modify this to 3dimensional height
+    """
+    Stack of tile floors stored in one flat, floor-major byte array with a
+    solid border around every floor.
+    The map is always bound to one active floor (`floor`): `tiles` (raw tile
+    codes), `textures` (wall texture IDs; 0 for empty and elevator tiles,
+    BORDER_TILE in the padding) and `walls` (1 where movement and rays are
+    blocked) all describe that floor. Each is (height + 2 * MAP_PADDING) rows
+    of `stride` bytes; use index() to address them. Stepping one tile out of
+    the floor always lands in the padding, so ray marching and collision
+    need no bounds checks.
+    Floors are packed from the source grid and get their derived planes only
+    when they become active; planes of floors more than one level away from
+    the active floor are dropped again.
+    """
     def __init__(self):
         # Example map - 0 = empty space, >0 = wall texture ID
-        self.grid: List[List[int]] = [
-            [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-            [1, 0, 0, 0, 2, 0, 0, 0, 0, 1],
-            [1, 0, 1, 0, 0, 0, 1, 0, 0, 1],
-            [1, 0, 2, 0, 0, 0, 3, 0, 0, 1],
-            [1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 0, 0, 0, 3, 0, 0, 0, 0, 1],
-            [1, 0, 0, 0, 1, 0, 1, 0, 0, 1],
-            [1, 0, 2, 0, 0, 0, 2, 0, 0, 1],
-            [1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-        ]
-        self.width = len(self.grid[0]) if self.grid else 0
-        self.height = len(self.grid) if self.grid else 0
+        self.version = 0 # Bumped whenever the active grid changes (lets renderers cache derived data)
+        self.revision = 0 # Bumped only when the map itself is replaced (update_map), not on floor changes
+        self.floor = 0
+        self._set_grid(DEFAULT_GRID)
+
+    def _set_grid(self, grid: list):
+        """
+        Takes a new map: rows of tile IDs (single floor), or rows of per-floor
+        stacks, grid[y][x][floor] (the live-map server's map_data format).
+        """
+        first = grid[0][0] if grid and grid[0] else 0
+        self.num_floors = max(1, len(first)) if isinstance(first, (list, tuple)) else 1
+        self._source = grid
+        self._stacked = isinstance(first, (list, tuple))
+        self.width = len(grid[0]) if grid else 0
+        self.height = len(grid) if grid else 0
+        self.stride = self.width + 2 * MAP_PADDING
+        self.plane_size = self.stride * (self.height + 2 * MAP_PADDING)
+
+        # One compact 3D array [floor][y][x]; floors stay BORDER_TILE until packed
+        self._stack = array('B', [BORDER_TILE]) * (self.plane_size * self.num_floors)
+        self._packed = [False] * self.num_floors
+        self._planes: Dict[int, Tuple[array, array]] = {} # floor -> (textures, walls), loaded floors only
+        self._grid_cache: Dict[int, List[List[int]]] = {}
+        self._activate(min(self.floor, self.num_floors - 1))
+
+    def _source_rows(self, floor: int) -> List[List[int]]:
+        if not self._stacked:
+            return self._source
+        return [[cell[floor] if floor < len(cell) else 1 for cell in row] for row in self._source]
+
+    def _load_floor(self, floor: int) -> Tuple[array, array]:
+        """Packs a floor into the stack (first time only) and builds its texture and wall planes."""
+        planes = self._planes.get(floor)
+        if planes is not None:
+            return planes
+
+        if not self._packed[floor]:
+            for y, row in enumerate(self._source_rows(floor)):
+                if len(row) != self.width:
+                    print(f"Warning: Map row {y} (floor {floor}) has {len(row)} tiles, expected {self.width}. Padding with walls.")
+                    row = (list(row) + [1] * self.width)[:self.width]
+                if any(not 0 <= tile <= MAX_TILE_ID for tile in row):
+                    print(f"Warning: Map row {y} (floor {floor}) has tile IDs outside 0-{MAX_TILE_ID}. Using 1 for them.")
+                    row = [tile if 0 <= tile <= MAX_TILE_ID else 1 for tile in row]
+                start = floor * self.plane_size + self.index(0, y)
+                self._stack[start:start + self.width] = array('B', row)
+            self._packed[floor] = True
+
+        plane = self._floor_view(floor)
+        textures = array('B', [0 if tile == ELEVATOR_TILE else tile for tile in plane])
+        walls = array('B', [1 if tile and tile != ELEVATOR_TILE else 0 for tile in plane])
+        planes = (textures, walls)
+        self._planes[floor] = planes
+        return planes
+
+    def _floor_view(self, floor: int) -> memoryview:
+        """Zero-copy view of one floor's raw tile plane inside the stack."""
+        start = floor * self.plane_size
+        return memoryview(self._stack)[start:start + self.plane_size]
+
+    def _activate(self, floor: int):
+        self.floor = floor
+        self.textures, self.walls = self._load_floor(floor)
+        self.tiles = self._floor_view(floor)
+        # Only the active floor and its direct neighbours keep derived planes
+        for loaded in [f for f in self._planes if abs(f - floor) > 1]:
+            del self._planes[loaded]
+
+    def set_floor(self, floor: int):
+        """Binds rendering and collision to `floor`, loading it if needed."""
+        if not 0 <= floor < self.num_floors:
+            print(f"Warning: Floor {floor} does not exist (map has {self.num_floors}).")
+            return
+        if floor != self.floor:
+            self._activate(floor)
+            self.version += 1
+
+    def loaded_floors(self) -> List[int]:
+        return sorted(self._planes)
+
+    def index(self, x: int, y: int) -> int:
+        """Flat index of tile (x, y) in the active floor planes; valid from -MAP_PADDING to width/height."""
+        return (y + MAP_PADDING) * self.stride + x + MAP_PADDING
+
+    @property
+    def grid(self) -> List[List[int]]:
+        """Row-major list-of-lists copy of the active floor (the format the server sends)."""
+        rows = self._grid_cache.get(self.floor)
+        if rows is None:
+            rows = [list(self.tiles[self.index(0, y):self.index(self.width, y)]) for y in range(self.height)]
+            self._grid_cache[self.floor] = rows
+        return rows
 
     def get_tile(self, x: int, y: int) -> int:
-        """Gets the tile ID at integer map coordinates."""
+        """Gets the tile ID at integer map coordinates on the active floor."""
         if 0 <= x < self.width and 0 <= y < self.height:
-            return self.grid[y][x]
+            return self.tiles[(y + MAP_PADDING) * self.stride + x + MAP_PADDING]
         return -1 # Return -1 for out of bounds
 
     def is_wall(self, x: float, y: float) -> bool:
-        """Checks if the given world coordinates are inside a wall."""
+        """Checks if the given world coordinates are inside a wall (everything outside the map is solid)."""
         map_x = int(x)
         map_y = int(y)
-        tile = self.get_tile(map_x, map_y)
-        return tile > 0 # Any tile ID > 0 is considered a wall
+        if -MAP_PADDING <= map_x < self.width + MAP_PADDING and -MAP_PADDING <= map_y < self.height + MAP_PADDING:
+            return self.walls[(map_y + MAP_PADDING) * self.stride + map_x + MAP_PADDING] == 1
+        return True
+
+    def is_elevator(self, x: float, y: float) -> bool:
+        return self.get_tile(int(x), int(y)) == ELEVATOR_TILE
+
+    def elevator_destination(self, x: float, y: float) -> Optional[int]:
+        """Next floor up (wrapping) where the elevator at (x, y) can drop the player, or None."""
+        map_x, map_y = int(x), int(y)
+        if not self.is_elevator(x, y):
+            return None
+        for step in range(1, self.num_floors):
+            floor = (self.floor + step) % self.num_floors
+            # Read the source directly: the destination only gets loaded once the player arrives
+            tile = self._source_tile(map_x, map_y, floor)
+            if tile == 0 or tile == ELEVATOR_TILE:
+                return floor
+        return None
+
+    def _source_tile(self, x: int, y: int, floor: int) -> int:
+        if self._packed[floor]:
+            return self._stack[floor * self.plane_size + self.index(x, y)]
+        cell = self._source[y][x]
+        if not self._stacked:
+            return cell
+        return cell[floor] if floor < len(cell) else 1
 
-    def update_map(self, new_grid: List[List[int]]):
+    def update_map(self, new_grid: list):
         """Updates the map grid (e.g., received from server)."""
-        self.grid = new_grid
-        self.width = len(self.grid[0]) if self.grid else 0
-        self.height = len(self.grid) if self.grid else 0
+        self._set_grid(new_grid)
+        self.version += 1
+        self.revision += 1
         print("Map updated.")
 
-    # TODO: Add method to load map from file or server data
\ No newline at end of file
+    # TODO: Add method to load map from file or server data
@@ -0,0 +1,78 @@
+# movement.py
+# Player movement rules, shared by the client (prediction) and the server
+# (authoritative simulation). Both step the same input commands through the
+# same code, so for an honest client they agree exactly and no correction is
+# ever visible. Keep this free of pyray: the server imports it.
+import math
+from typing import Optional, Tuple
+
+import config
+from protocol import INPUT_DT_SCALE
+
+# Bits of an input command's `keys` (one command per client frame)
+KEY_FORWARD = 1
+KEY_BACK = 2
+KEY_TURN_LEFT = 4
+KEY_TURN_RIGHT = 8
+KEY_RUN = 16
+KEY_ELEVATOR = 32 # Pressed (not held) this frame
+KEY_SHOOT = 64    # Pressed this frame
+
+MoveState = Tuple[float, float, float, int, bool] # x, y, angle, floor, is_running
+
+def quantize_dt(dt: float) -> float:
+    """Command duration as it goes over the wire (clamped to MAX_INPUT_DT); the client must move by this, not by dt."""
+    dt = min(max(dt, 0.0), config.MAX_INPUT_DT)
+    return round(dt * INPUT_DT_SCALE) / INPUT_DT_SCALE
+
+
+def step(x: float, y: float, angle: float, floor: int, keys: int, dt: float, game_map) -> MoveState:
+    """
+    Applies one input command and returns the new state.
+    `game_map` must be bound to `floor` (GameMap.set_floor); None moves without collision.
+    """
+    move_speed = config.PLAYER_MOVE_SPEED
+    rot_speed = config.PLAYER_ROTATION_SPEED * dt
+
+    # Rotation, kept within 0 to 2*PI
+    if keys & KEY_TURN_LEFT:
+        angle -= rot_speed
+    if keys & KEY_TURN_RIGHT:
+        angle += rot_speed
+    angle = angle % (2 * math.pi)
+
+    is_running = bool(keys & KEY_RUN)
+    if is_running:
+        move_speed *= config.PLAYER_RUN_MULTIPLIER
+    move_step = move_speed * dt
+    move_x = 0.0
+    move_y = 0.0
+    if keys & KEY_FORWARD:
+        move_x += math.cos(angle) * move_step
+        move_y += math.sin(angle) * move_step
+    if keys & KEY_BACK:
+        move_x -= math.cos(angle) * move_step
+        move_y -= math.sin(angle) * move_step
+
+    # Collision is checked separately for X and Y for smoother sliding against walls
+    target_x = x + move_x
+    target_y = y + move_y
+    if game_map is None:
+        return target_x, target_y, angle, floor, is_running
+    if not game_map.is_wall(target_x, y):
+        x = target_x
+    if not game_map.is_wall(x, target_y):
+        y = target_y
+
+    # Elevators: rides to the next floor with open space above/below the tile
+    if keys & KEY_ELEVATOR and game_map.is_elevator(x, y):
+        destination: Optional[int] = game_map.elevator_destination(x, y)
+        if destination is not None:
+            floor = destination
+    return x, y, angle, floor, is_running
+
+
+def bind_floor(game_map, floor: int):
+    """Binds `game_map` to `floor` before stepping a player on it (no-op without a map or if already bound)."""
+    if game_map is not None and game_map.floor != floor:
+        game_map.set_floor(floor)
@@ -1,24 +1,36 @@
 # network.py
+import selectors
 import socket
-import json
+import threading
 import time
 import config
-from typing import Optional, Dict, Any, List
+from collections import deque
+from typing import Optional, Dict, Any, Deque, List
+from protocol import JsonCodec, MessageReader, ProtocolError, make_codec
+from udp_transport import DatagramLink, LinkConditions, UNRELIABLE_MESSAGE_TYPES, UdpPeer
+
+MAX_INPUT_COMMANDS = 255 # Commands per UDP player_input message (the binary codec's u8 count; more would fall back to JSON)
 
 class NetworkClient:
+    blocking_connect = True # connect() waits for the connection (the game sleeps between failed attempts)
+
     def __init__(self):
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_ip = config.SERVER_IP
         self.server_port = config.SERVER_PORT
         self.connected = False
-        self.buffer = "" # Buffer for receiving partial messages
+        self.codec = JsonCodec() # Encoder for outgoing messages (switched after protocol negotiation)
+        self.reader = MessageReader(JsonCodec()) # Buffers partial messages, decodes with its own codec
+        self.protocol_requested = False
 
     def connect(self) -> bool:
         """Attempts to connect to the server."""
         try:
             print(f"Attempting to connect to {self.server_ip}:{self.server_port}...")
+            self.reset_protocol()
             self.client.settimeout(2.0) # Timeout for connection attempt
             self.client.connect((self.server_ip, self.server_port))
+            self.client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Small messages go out at once, not after Nagle's wait
             self.client.settimeout(config.SOCKET_TIMEOUT) # Set to non-blocking/short timeout for recv
             # Optional: Send an initial handshake message
             # self.send_data({"type": "connect", "player_name": "Player"})
@@ -41,9 +53,8 @@ class NetworkClient:
             return
 
         try:
-            message = json.dumps(data) + '\n' # Add newline as delimiter
-            self.client.sendall(message.encode('utf-8'))
-            # print(f"Sent: {message.strip()}") # Debug
+            self.client.sendall(self.codec.encode(data))
+            # print(f"Sent: {data}") # Debug
         except socket.error as e:
             print(f"Network send error: {e}")
             self.connected = False # Assume disconnect on send error
@@ -60,24 +71,18 @@ class NetworkClient:
         try:
             # Keep receiving small chunks until a socket timeout (no more data currently)
             while True:
-                 chunk = self.client.recv(4096).decode('utf-8')
-                 if not chunk:
+                 if not self.reader.recv_into(self.client): # Straight into the reader's buffer
                       # Empty chunk usually means server disconnected gracefully
                       print("Server disconnected.")
                       self.connected = False
                       return [] # Return empty list, signal disconnection upstream
 
-                 self.buffer += chunk
-                 # Process complete messages (delimited by newline)
-                 while '\n' in self.buffer:
-                    message_str, self.buffer = self.buffer.split('\n', 1)
-                    if message_str:
-                        try:
-                            message_dict = json.loads(message_str)
-                            messages.append(message_dict)
-                            # print(f"Recv: {message_dict}") # Debug
-                        except json.JSONDecodeError:
-                             print(f"Warning: Received invalid JSON: {message_str}")
+                 # Process complete messages (the reader's codec may change between two of them)
+                 for message_dict in self.reader.messages():
+                    if self.handle_protocol_message(message_dict):
+                        continue
+                    messages.append(message_dict)
+                    # print(f"Recv: {message_dict}") # Debug
         except socket.timeout:
             # This is expected in non-blocking mode when no data is available
             pass
@@ -91,6 +96,10 @@ class NetworkClient:
              else:
                  print(f"Network receive error: {e}")
              self.connected = False # Assume disconnect on error
+        except ProtocolError as e:
+            # A corrupt binary stream can't be resynchronised
+            print(f"Network protocol error: {e}")
+            self.connected = False
         except Exception as e:
             print(f"Error decoding received data: {e}")
             # Potentially corrupt data, maybe clear buffer?
@@ -98,6 +107,30 @@ class NetworkClient:
 
         return messages
 
+    def handle_protocol_message(self, message: Dict[str, Any]) -> bool:
+        """
+        Negotiates the wire format. Returns True if the message was consumed here.
+        handshake_ack lists the server's codecs; if it offers config.NETWORK_PROTOCOL
+        we select it (in JSON) and encode with it from then on. The server answers
+        protocol_ack, after which everything it sends uses the new codec too.
+        """
+        msg_type = message.get("type")
+        payload = message.get("payload") or {}
+        if msg_type == "handshake_ack" and not self.protocol_requested:
+            wanted = getattr(config, "NETWORK_PROTOCOL", JsonCodec.name)
+            codec = make_codec(wanted)
+            if wanted != JsonCodec.name and codec is not None and wanted in payload.get("protocols", []):
+                self.send_data({"type": "protocol_select", "payload": {"protocol": wanted}})
+                self.codec = codec
+                self.protocol_requested = True
+            return False # The game still needs the handshake (client ID)
+        if msg_type == "protocol_ack":
+            codec = make_codec(payload.get("protocol", ""))
+            if codec is not None:
+                self.reader.codec = codec
+                print(f"Using wire protocol '{codec.name}'.")
+            return True
+        return False
 
     def disconnect(self):
         """Closes the connection to the server."""
@@ -117,4 +150,360 @@ class NetworkClient:
                 print("Disconnected.")
         # Recreate socket for potential reconnection
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.buffer = ""
\ No newline at end of file
+        self.reset_protocol()
+
+    def reset_protocol(self):
+        """Every new connection starts in JSON."""
+        self.codec = JsonCodec()
+        self.reader = MessageReader(JsonCodec())
+        self.protocol_requested = False
+
+class ThreadedNetworkClient(NetworkClient):
+    """
+    NetworkClient whose socket is owned by a background I/O thread, so the
+    game loop never waits on the network: connect() only asks the thread to
+    (re)connect, send_data() queues, and receive_data() drains the messages
+    the thread has already decoded.
+    The thread connects (blocking, off the game loop) and retries every
+    NETWORK_RECONNECT_DELAY while the game keeps calling connect(). After a
+    dropped connection it waits for connect() again, so the game always
+    notices the reconnect (it gets a new client ID). Outgoing messages are
+    encoded on the I/O thread, in order, so the switch to the negotiated
+    codec can't reorder them.
+    """
+    blocking_connect = False
+
+    def __init__(self):
+        super().__init__()
+        self.client.close() # The I/O thread opens its own socket for every connection
+        self.inbox: Deque[Dict[str, Any]] = deque() # Decoded server messages (appended by the I/O thread only)
+        self.outbox: Deque[Dict[str, Any]] = deque() # Messages from the game, encoded by the I/O thread
+        self.out_buffer = bytearray() # Encoded bytes not yet accepted by the socket (I/O thread only)
+        self.thread: Optional[threading.Thread] = None
+        self.connect_requested = False
+        self.stop_requested = False
+        self.next_attempt = 0.0
+        self.wake_reader, self.wake_writer = socket.socketpair() # Wakes the I/O thread's select()
+        self.wake_reader.setblocking(False)
+        self.wake_writer.setblocking(False)
+
+    # --- Game thread ---
+    def connect(self) -> bool:
+        """Non-blocking: True once connected; otherwise asks the I/O thread to connect and returns False."""
+        if self.connected:
+            return True
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_requested = False
+            self.thread = threading.Thread(target=self._run, name="network-io", daemon=True)
+            self.thread.start()
+        if not self.connect_requested:
+            self.connect_requested = True
+            self._wake()
+        return False
+
+    def send_data(self, data: Dict[str, Any]):
+        """Queues a message; it is encoded and sent by the I/O thread."""
+        if threading.current_thread() is self.thread:
+            self.out_buffer += self.codec.encode(data) # From the I/O thread itself (protocol_select): encode now, in order
+            return
+        if not self.connected:
+            print("Error: Not connected to server.")
+            return
+        self.outbox.append(data)
+        self._wake()
+
+    def receive_data(self) -> List[Dict[str, Any]]:
+        """Returns every message received since the last call (never blocks)."""
+        messages = []
+        inbox = self.inbox
+        while inbox:
+            messages.append(inbox.popleft())
+        return messages
+
+    def disconnect(self):
+        """Sends a disconnect notice, closes the connection and stops the I/O thread."""
+        if self.connected:
+            print("Disconnecting from server...")
+            self.send_data({"type": "disconnect"})
+        self.connect_requested = False
+        self.stop_requested = True
+        self._wake()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=config.NETWORK_SHUTDOWN_TIMEOUT)
+        self.thread = None
+
+    def _wake(self):
+        try:
+            self.wake_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass # Already has a wakeup pending
+
+    # --- I/O thread ---
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.wake_reader, selectors.EVENT_READ)
+        sock = None
+        try:
+            while not self.stop_requested:
+                if sock is None:
+                    now = time.monotonic()
+                    if self.connect_requested and now >= self.next_attempt:
+                        sock = self._open_connection()
+                        if sock is None:
+                            self.next_attempt = time.monotonic() + config.NETWORK_RECONNECT_DELAY
+                        else:
+                            selector.register(sock, selectors.EVENT_READ)
+                    if sock is None:
+                        # Wait for connect()/disconnect(), or until the next attempt is due
+                        timeout = max(0.0, self.next_attempt - time.monotonic()) if self.connect_requested else None
+                        self._drain_wakeups(selector.select(timeout))
+                        continue
+
+                self._encode_outbox()
+                selector.modify(sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if self.out_buffer else 0))
+                try:
+                    events = selector.select()
+                    self._drain_wakeups(events)
+                    for key, mask in events:
+                        if key.fileobj is sock and mask & selectors.EVENT_READ:
+                            self._receive(sock)
+                        if key.fileobj is sock and mask & selectors.EVENT_WRITE and self.out_buffer:
+                            del self.out_buffer[:sock.send(self.out_buffer)]
+                except (ConnectionError, ProtocolError, OSError) as e:
+                    if isinstance(e, ProtocolError):
+                        print(f"Network protocol error: {e}") # A corrupt binary stream can't be resynchronised
+                    elif not isinstance(e, ConnectionAbortedError):
+                        print(f"Server connection lost: {e}")
+                    selector.unregister(sock)
+                    self._close(sock)
+                    sock = None
+        finally:
+            if sock is not None:
+                self._shutdown(sock)
+            selector.close()
+
+    def _open_connection(self) -> Optional[socket.socket]:
+        print(f"Attempting to connect to {self.server_ip}:{self.server_port}...")
+        try:
+            sock = socket.create_connection((self.server_ip, self.server_port), timeout=2.0) # Timeout for connection attempt
+        except socket.timeout:
+            print("Connection attempt timed out.")
+            return None
+        except socket.error as e:
+            print(f"Connection failed: {e}")
+            return None
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Small messages go out at once, not after Nagle's wait
+        sock.setblocking(False)
+        self.reset_protocol()
+        self.inbox.clear() # Nothing from an earlier connection may be mistaken for this one's
+        self.outbox.clear()
+        self.out_buffer.clear()
+        self.client = sock
+        self.connect_requested = False
+        self.connected = True
+        print("Connection successful.")
+        return sock
+
+    def _receive(self, sock: socket.socket):
+        try:
+            received = self.reader.recv_into(sock)
+        except BlockingIOError:
+            return
+        if not received:
+            raise ConnectionAbortedError() # Server closed the connection
+        # Process complete messages (the reader's codec may change between two of them)
+        for message in self.reader.messages():
+            if not self.handle_protocol_message(message):
+                self.inbox.append(message)
+
+    def _encode_outbox(self):
+        while self.outbox:
+            data = self.outbox.popleft()
+            try:
+                self.out_buffer += self.codec.encode(data)
+            except Exception as e:
+                print(f"Error encoding data: {e}")
+
+    def _drain_wakeups(self, events):
+        if any(key.fileobj is self.wake_reader for key, _ in events):
+            try:
+                while self.wake_reader.recv(4096):
+                    pass
+            except (BlockingIOError, OSError):
+                pass
+
+    def _close(self, sock: socket.socket):
+        if not self.stop_requested:
+            print("Server disconnected.")
+        self.connected = False
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def _shutdown(self, sock: socket.socket):
+        """Sends what is still queued (e.g. the disconnect notice), then closes."""
+        try:
+            self._encode_outbox()
+            sock.setblocking(True)
+            sock.settimeout(config.NETWORK_SHUTDOWN_TIMEOUT)
+            sock.sendall(self.out_buffer)
+            sock.shutdown(socket.SHUT_RDWR) # Graceful shutdown
+        except OSError as e:
+            print(f"Error during shutdown: {e}")
+        self.out_buffer.clear()
+        self._close(sock)
+        print("Disconnected.")
+
+
+class UdpNetworkClient(NetworkClient):
+    """
+    NetworkClient over UDP (see udp_transport.py; the server must run with
+    --mode udp). Per-tick state travels unreliably, newest wins; everything
+    else is reliable. Nothing here blocks: connect() sends a reliable hello
+    and reports True once the handshake arrives, and every call pumps the
+    socket (receiving, resending, acknowledging).
+    Lost player_input datagrams cost nothing: every one repeats all commands
+    the server hasn't acknowledged yet (it skips the ones it already has).
+    """
+    blocking_connect = False
+
+    def __init__(self):
+        super().__init__()
+        self.client.close() # A datagram socket is opened for every connection
+        self.sock: Optional[socket.socket] = None
+        self.link: Optional[DatagramLink] = None
+        self.peer: Optional[UdpPeer] = None
+        self.address = (self.server_ip, self.server_port)
+        self.inbox: Deque[Dict[str, Any]] = deque()
+        self.unacked_inputs: List[list] = [] # [seq, dt, keys] the server hasn't acknowledged (oldest first)
+        self.removed_at: Dict[tuple, int] = {} # (section, id) -> stamp of the reliable message that removed it
+        self.next_attempt = 0.0
+
+    def connect(self) -> bool:
+        """Non-blocking: True once the server's handshake has arrived."""
+        if self.connected:
+            return True
+        now = time.monotonic()
+        if self.peer is None or (self.peer.timed_out(now) and now >= self.next_attempt):
+            self._open(now)
+        self._pump()
+        return self.connected
+
+    def _open(self, now: float):
+        if self.sock is not None:
+            print("No answer from server, retrying...")
+            self.sock.close()
+        print(f"Attempting to connect to {self.server_ip}:{self.server_port} (UDP)...")
+        self.reset_protocol()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.link = DatagramLink(self.sock, LinkConditions.from_config())
+        self.peer = UdpPeer(self.link, self.address)
+        self.inbox.clear()
+        self.unacked_inputs.clear()
+        self.removed_at.clear()
+        self.next_attempt = now + config.NETWORK_RECONNECT_DELAY
+        self.peer.send({"type": "hello"}, True, self.codec) # Resent until the server acknowledges it
+
+    def send_data(self, data: Dict[str, Any]):
+        """Sends a message on the channel its type belongs to."""
+        if not self.connected or self.peer is None:
+            print("Error: Not connected to server.")
+            return
+        msg_type = data.get("type")
+        if msg_type == "player_input":
+            data = self._with_unacked_inputs(data)
+        elif msg_type == "respawn":
+            self.unacked_inputs.clear() # The server numbers commands from 1 again (see ClientSession.respawn)
+        self.peer.send(data, msg_type not in UNRELIABLE_MESSAGE_TYPES, self.codec)
+        self.link.flush()
+
+    def _with_unacked_inputs(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Extends a player_input batch back to the oldest command the server hasn't acknowledged."""
+        payload = data.get("payload") or {}
+        first_seq = payload.get("seq")
+        commands = payload.get("commands", [])
+        self.unacked_inputs.extend([seq, dt, keys] for seq, (dt, keys) in enumerate(commands, first_seq))
+        del self.unacked_inputs[:-config.INPUT_HISTORY_SIZE] # Bounded like Player.pending_inputs
+        resend = self.unacked_inputs[:MAX_INPUT_COMMANDS] # Oldest first: the server applies commands in order
+        return {"type": "player_input",
+                "payload": {"seq": resend[0][0], "commands": [[dt, keys] for _, dt, keys in resend]}}
+
+    def receive_data(self) -> List[Dict[str, Any]]:
+        """Returns every message received since the last call (never blocks)."""
+        if self.connected:
+            self._pump()
+        messages = []
+        inbox = self.inbox
+        while inbox:
+            messages.append(inbox.popleft())
+        return messages
+
+    def _pump(self):
+        """Handles waiting datagrams, then resends/acknowledges and checks for a silent server."""
+        sock, peer = self.sock, self.peer
+        if sock is None or peer is None:
+            return
+        while True:
+            try:
+                datagram, address = sock.recvfrom(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break # e.g. ICMP port unreachable while the server is down: the timeout handles it
+            if address != self.address:
+                continue
+            for message, reliable, stamp in peer.receive(datagram):
+                self._deliver(message, reliable, stamp)
+        now = time.monotonic()
+        peer.poll(now)
+        self.link.flush(now)
+        if self.connected and peer.timed_out(now):
+            print("Server timed out.")
+            self.connected = False
+            self.peer = None
+            sock.close()
+            self.sock = None
+
+    def _deliver(self, message: Dict[str, Any], reliable: bool, stamp: int):
+        msg_type = message.get("type")
+        payload = message.get("payload") or {}
+        if msg_type == "handshake_ack":
+            self.connected = True
+            print("Connection successful.")
+        elif msg_type == "player_state_correction":
+            ack = payload.get("ack", 0)
+            self.unacked_inputs = [command for command in self.unacked_inputs if command[0] > ack]
+        elif msg_type == "player_disconnect":
+            self.removed_at[("players", payload.get("client_id"))] = stamp
+        elif msg_type == "game_state_update":
+            if reliable:
+                for section, object_ids in payload.get("removed", {}).items():
+                    for object_id in object_ids:
+                        self.removed_at[(section, object_id)] = stamp
+                for section, records in payload.items():
+                    if section != "removed":
+                        for object_id in records:
+                            self.removed_at.pop((section, object_id), None) # Back in view
+            elif self.removed_at:
+                # Sent before a reliable removal but arrived after it: don't bring the object back
+                for section, records in payload.items():
+                    for object_id in [oid for oid in records if self.removed_at.get((section, oid), 0) > stamp]:
+                        del records[object_id]
+        if not self.handle_protocol_message(message):
+            self.inbox.append(message)
+
+    def disconnect(self):
+        """Sends a disconnect notice (best effort) and closes the socket."""
+        if self.connected and self.peer is not None:
+            print("Disconnecting from server...")
+            self.peer.send({"type": "disconnect"}, True, self.codec) # Not resent: the server times us out if it's lost
+            self.link.flush(float("inf")) # Including datagrams still held back by the simulator
+            print("Disconnected.")
+        self.connected = False
+        self.peer = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.reset_protocol()
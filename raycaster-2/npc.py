@@ -0,0 +1,193 @@
+# npc.py
+# Server-side NPCs: sprites that chase the nearest player through the map.
+# Paths come from flow fields: one breadth-first search outward from a
+# player's tile gives every open tile of that floor its distance to the
+# player, and so the next tile to head for. Every NPC chasing a player in
+# that tile shares the field, and fields are cached by (floor, tile), so one
+# is only built when a player moves to a tile without one (or the map is
+# replaced). A tick then costs each NPC a table lookup and a short move,
+# however many NPCs there are. Keep this free of pyray: the server imports it.
+import math
+import random
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from map import MAP_PADDING, GameMap
+from state_store import StateStore
+
+UNREACHABLE = -1
+_UNKNOWN = -2 # next_step not worked out yet for this tile
+
+class FlowField:
+    """
+    Steps (4-connected) from every tile of one floor to the `target` tile, in
+    GameMap's padded plane layout (GameMap.index); UNREACHABLE where walls cut
+    a tile off or it is more than `max_steps` away. `game_map` must be bound
+    to `floor`. The padding is solid, so the search needs no bounds checks.
+    """
+    def __init__(self, game_map: GameMap, floor: int, target: int, max_steps: Optional[int] = None):
+        self.floor = floor
+        self.target = target
+        self.stride = stride = game_map.stride
+        self.walls = walls = game_map.walls
+        self.distance = distance = array('i', [UNREACHABLE]) * game_map.plane_size
+        self._steps = array('i', [_UNKNOWN]) * game_map.plane_size # Memoized next_step per tile, shared by all chasers
+        if walls[target]:
+            return
+        distance[target] = 0
+        frontier = [target]
+        steps = 0
+        offsets = (1, -1, stride, -stride)
+        while frontier and steps != max_steps:
+            steps += 1
+            next_frontier = []
+            for index in frontier:
+                for offset in offsets:
+                    neighbour = index + offset
+                    if distance[neighbour] == UNREACHABLE and not walls[neighbour]:
+                        distance[neighbour] = steps
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+
+    def next_step(self, index: int) -> Optional[int]:
+        """Neighbouring tile (8-connected, never cutting a wall corner) closest to the target; None at or cut off from it."""
+        step = self._steps[index]
+        if step == _UNKNOWN:
+            step = self._steps[index] = self._best_neighbour(index)
+        return step if step >= 0 else None
+
+    def _best_neighbour(self, index: int) -> int:
+        distance, walls, stride = self.distance, self.walls, self.stride
+        best, best_distance = UNREACHABLE, distance[index]
+        if best_distance <= 0:
+            return UNREACHABLE
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)):
+            if dx and dy and (walls[index + dx] or walls[index + dy * stride]):
+                continue # Diagonal past a wall corner
+            neighbour = index + dx + dy * stride
+            if 0 <= distance[neighbour] < best_distance:
+                best, best_distance = neighbour, distance[neighbour]
+        return best
+
+
+class NpcSystem:
+    """
+    Moves registered sprites (see add) towards the nearest living player on
+    their floor within `chase_range` tiles, stopping `stop_distance` short of
+    them (an NPC whose way there is over twice that long stays put: fields
+    only search that far). update() is called once per server tick with the server's state
+    store, and moves go through it like any other change, so they reach
+    clients in the tick's game_state_update.
+    `game_map` is used for collision (it is re-bound to each floor as needed).
+    """
+    def __init__(self, game_map: GameMap, speed: float = 1.5, chase_range: float = 8.0,
+                 stop_distance: float = 1.0, cache_size: int = 64):
+        self.game_map = game_map
+        self.speed = speed # Tiles per second
+        self.chase_range = chase_range
+        self.stop_distance = stop_distance
+        self.cache_size = cache_size # Flow fields kept; the least recently used is dropped first
+        self.npcs: Dict[str, float] = {} # Sprite id -> speed
+        self.fields: "OrderedDict[Tuple[int, int], FlowField]" = OrderedDict() # (floor, target tile index) -> field
+        self.map_revision = game_map.revision
+        self.fields_built = 0
+
+    def add(self, sprite_id: str, speed: Optional[float] = None):
+        self.npcs[sprite_id] = self.speed if speed is None else speed
+
+    def remove(self, sprite_id: str):
+        self.npcs.pop(sprite_id, None)
+
+    def field_to(self, floor: int, x: float, y: float) -> Optional[FlowField]:
+        """The (cached) flow field towards tile (x, y) of `floor`; None if the floor doesn't exist."""
+        game_map = self.game_map
+        if game_map.revision != self.map_revision:
+            self.fields.clear() # Map replaced: every field is stale
+            self.map_revision = game_map.revision
+        if game_map.floor != floor:
+            game_map.set_floor(floor)
+            if game_map.floor != floor:
+                return None
+        key = (floor, game_map.index(int(x), int(y)))
+        field = self.fields.get(key)
+        if field is not None:
+            self.fields.move_to_end(key)
+            return field
+        field = self.fields[key] = FlowField(game_map, floor, key[1], math.ceil(2 * self.chase_range))
+        self.fields_built += 1
+        if len(self.fields) > self.cache_size:
+            self.fields.popitem(last=False)
+        return field
+
+    def update(self, store: StateStore, dt: float) -> int:
+        """Moves every NPC one tick of `dt` seconds; returns how many moved."""
+        if not self.npcs:
+            return 0
+        # Living players bucketed by floor and chase-range cell: each NPC only looks at the 3x3 cells around it
+        cell_size = max(self.chase_range, 1.0)
+        buckets: Dict[Tuple[int, int, int], List[Tuple[float, float]]] = {}
+        for state in store.states["players"].values():
+            if not state.get("is_dead"):
+                x, y = state["x"], state["y"]
+                buckets.setdefault((state.get("floor", 0), int(x // cell_size), int(y // cell_size)), []).append((x, y))
+        if not buckets:
+            return 0
+
+        sprites = store.states["sprites"]
+        stride = self.game_map.stride
+        range_squared = self.chase_range * self.chase_range
+        moved = 0
+        for sprite_id, speed in self.npcs.items():
+            state = sprites.get(sprite_id)
+            if state is None or state.get("is_dead"):
+                continue
+            x, y, floor = state["x"], state["y"], state.get("floor", 0)
+            cell_x, cell_y = int(x // cell_size), int(y // cell_size)
+            target = None
+            best = range_squared
+            for cx in (cell_x - 1, cell_x, cell_x + 1):
+                for cy in (cell_y - 1, cell_y, cell_y + 1):
+                    for px, py in buckets.get((floor, cx, cy), ()):
+                        distance_squared = (px - x) ** 2 + (py - y) ** 2
+                        if distance_squared < best:
+                            target, best = (px, py), distance_squared
+            if target is None or best <= self.stop_distance * self.stop_distance:
+                continue
+
+            field = self.field_to(floor, target[0], target[1])
+            if field is None:
+                continue
+            index = self.game_map.index(int(x), int(y))
+            if index == field.target:
+                goal_x, goal_y = target # Same tile: straight at the player
+                remaining = math.sqrt(best) - self.stop_distance
+            else:
+                step = field.next_step(index)
+                if step is None:
+                    continue # No way through (or the NPC is stuck in a wall)
+                goal_x = step % stride - MAP_PADDING + 0.5
+                goal_y = step // stride - MAP_PADDING + 0.5
+                remaining = math.hypot(goal_x - x, goal_y - y)
+            travel = min(speed * dt, remaining)
+            if travel <= 0.0:
+                continue
+            length = math.hypot(goal_x - x, goal_y - y)
+            store.update("sprites", sprite_id, {"x": x + (goal_x - x) / length * travel,
+                                                "y": y + (goal_y - y) / length * travel})
+            moved += 1
+        return moved
+
+
+def open_tiles(game_map: GameMap) -> List[Tuple[int, int]]:
+    """Walkable tiles of the floor `game_map` is bound to."""
+    return [(x, y) for y in range(game_map.height) for x in range(game_map.width) if not game_map.is_wall(x + 0.5, y + 0.5)]
+
+
+def spawn_positions(game_map: GameMap, count: int, seed: int = 0) -> List[Tuple[float, float]]:
+    """`count` random tile centres on open tiles of the bound floor (for extra NPCs)."""
+    rng = random.Random(seed)
+    tiles = open_tiles(game_map)
+    if not tiles:
+        return []
+    return [(x + 0.5, y + 0.5) for x, y in (rng.choice(tiles) for _ in range(count))]
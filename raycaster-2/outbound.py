@@ -0,0 +1,120 @@
+# outbound.py
+# Per-client queue of messages waiting to be written to the socket, shared by
+# the threaded (server.py) and asyncio (async_server.py) transports. Sending
+# only queues, so the simulation thread never waits on a client; the
+# transport's writer drains the queue. While a client falls behind, state
+# updates coalesce in the queue instead of piling up.
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, Optional
+
+# Messages that only carry the latest state of objects. While one is still
+# queued, newer ones are merged into it instead of queued behind it.
+STATE_MESSAGE_TYPES = {"game_state_update"}
+# Messages that are complete on their own: a newer one replaces a queued one outright
+LATEST_ONLY_MESSAGE_TYPES = {"player_state_correction"}
+
+
+class OutgoingMessage:
+    """One queued message, already encoded with the codec in use when it was queued."""
+    __slots__ = ("message", "codec", "data", "owned")
+
+    def __init__(self, message: Dict[str, Any], codec, data: bytes):
+        self.message = message
+        self.codec = codec
+        self.data = data
+        self.owned = False # True once `message` is our private copy (the original is shared with other clients)
+
+    def merge(self, message: Dict[str, Any]):
+        """
+        Folds a newer state update into this one: per object, newer fields win.
+        An object removed by one update and re-added by the other ends up in
+        whichever state the newer update leaves it.
+        """
+        if not self.owned:
+            payload = {section: {oid: dict(fields) for oid, fields in records.items()}
+                       for section, records in self.message["payload"].items() if section != "removed"}
+            if "removed" in self.message["payload"]:
+                payload["removed"] = {section: list(ids) for section, ids in self.message["payload"]["removed"].items()}
+            self.message = {"type": self.message["type"], "payload": payload}
+            self.owned = True
+        payload = self.message["payload"]
+        removed = payload.get("removed", {})
+        for section, records in message["payload"].items():
+            if section == "removed":
+                continue
+            merged = payload.setdefault(section, {})
+            for oid, fields in records.items():
+                if oid in removed.get(section, ()):
+                    removed[section].remove(oid) # Came back: its new (full) state follows
+                merged.setdefault(oid, {}).update(fields)
+        for section, ids in message["payload"].get("removed", {}).items():
+            for oid in ids:
+                payload.get(section, {}).pop(oid, None)
+                if oid not in removed.setdefault(section, []):
+                    removed[section].append(oid)
+        if removed:
+            payload["removed"] = {section: ids for section, ids in removed.items() if ids}
+            if not payload["removed"]:
+                del payload["removed"]
+        self.data = self.codec.encode(self.message)
+
+
+class OutboundQueue:
+    """
+    Unsent messages of one client, oldest first. Not thread-safe: the
+    threaded transport guards it with its own lock.
+    """
+    def __init__(self):
+        self.items: Deque[OutgoingMessage] = deque()
+        self.coalesced = 0 # State updates merged into an earlier queued one (i.e. dropped as stale)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self) -> Iterator[OutgoingMessage]:
+        return iter(self.items)
+
+    def put(self, message: Dict[str, Any], codec, encoded: Optional[Dict[str, bytes]] = None):
+        """
+        Queues `message` encoded with `codec`. `encoded` (codec name -> bytes)
+        is shared by every recipient of the same message, so it is serialized
+        once per format rather than once per client. Raises if encoding fails.
+        """
+        msg_type = message.get("type")
+        queued = self._queued_of_type(msg_type, codec)
+        if queued is not None:
+            self.coalesced += 1
+            if msg_type in STATE_MESSAGE_TYPES:
+                queued.merge(message) # Still unsent: send one newer state instead of two
+                return
+            self.items.remove(queued) # Superseded; the new one goes to the back
+        if encoded is None:
+            data = codec.encode(message)
+        else:
+            data = encoded.get(codec.name)
+            if data is None:
+                data = encoded[codec.name] = codec.encode(message)
+        self.items.append(OutgoingMessage(message, codec, data))
+
+    def pop(self) -> bytes:
+        """The oldest queued message's bytes."""
+        return self.items.popleft().data
+
+    def clear(self):
+        self.items.clear()
+
+    def _queued_of_type(self, msg_type: str, codec) -> Optional[OutgoingMessage]:
+        """
+        The unsent message of `msg_type` that a new one can be folded into, if
+        any. Only looks back past other coalescable messages (a tick queues a
+        state update and a correction), never past e.g. a player_disconnect.
+        """
+        if msg_type not in STATE_MESSAGE_TYPES and msg_type not in LATEST_ONLY_MESSAGE_TYPES:
+            return None
+        for queued in reversed(self.items):
+            queued_type = queued.message.get("type")
+            if queued_type == msg_type:
+                return queued if queued.codec is codec else None
+            if queued_type not in STATE_MESSAGE_TYPES and queued_type not in LATEST_ONLY_MESSAGE_TYPES:
+                return None
+        return None
@@ -2,83 +2,131 @@
 import pyray as pr
 import math
 import config
+import movement
+from protocol import INPUT_DT_SCALE
+from collections import deque
 from map import GameMap # Import GameMap for collision detection
-from typing import Tuple
+from typing import Deque, List, Tuple
+
+InputCommand = Tuple[int, float, int] # (seq, dt, keys), see movement.py
 
 class Player:
     def __init__(self, x: float, y: float, angle: float):
         self.x = x
         self.y = y
         self.angle = angle # Radians
+        self.floor = 0 # Map floor the player is on (see GameMap.set_floor)
         self.health = config.PLAYER_HEALTH_START
+        self.mana = config.PLAYER_MANA_START
         self.is_shooting = False
         self.is_dead = False
         self.is_running = False
         self.delta_time = 0.0 # Will be updated each frame
-
-    def handle_input(self, game_map: GameMap):
-        """Processes player input for movement and actions."""
-        if self.is_dead:
-            return
-
-        move_speed = config.PLAYER_MOVE_SPEED
-        rot_speed = config.PLAYER_ROTATION_SPEED * self.delta_time
-
-        # Rotation
+        # Client-side prediction: inputs are applied immediately and kept until the server has processed them
+        self.input_seq = 0 # Sequence number of the last recorded input command
+        self.last_sent_seq = 0
+        self.pending_inputs: Deque[InputCommand] = deque(maxlen=config.INPUT_HISTORY_SIZE)
+        self.input_time_debt = 0.0 # Frame time not yet covered by a (quantized) command
+        self.correction_x = 0.0 # Reconciliation offset still to be blended in (see reconcile)
+        self.correction_y = 0.0
+
+    def read_input(self) -> int:
+        """Samples the keyboard/mouse into an input command's key bits (see movement.py)."""
+        keys = 0
+        if pr.is_key_down(pr.KeyboardKey.KEY_UP) or pr.is_key_down(pr.KeyboardKey.KEY_W):
+            keys |= movement.KEY_FORWARD
+        if pr.is_key_down(pr.KeyboardKey.KEY_DOWN) or pr.is_key_down(pr.KeyboardKey.KEY_S):
+            keys |= movement.KEY_BACK
         if pr.is_key_down(pr.KeyboardKey.KEY_LEFT) or pr.is_key_down(pr.KeyboardKey.KEY_A):
-            self.angle -= rot_speed
+            keys |= movement.KEY_TURN_LEFT
         if pr.is_key_down(pr.KeyboardKey.KEY_RIGHT) or pr.is_key_down(pr.KeyboardKey.KEY_D):
-            self.angle += rot_speed
-
-        # Ensure angle stays within 0 to 2*PI
-        self.angle = self.angle % (2 * math.pi)
-        if self.angle < 0:
-            self.angle += (2 * math.pi)
-
-        # Movement Speed (Running)
-        self.is_running = pr.is_key_down(pr.KeyboardKey.KEY_LEFT_SHIFT) or pr.is_key_down(pr.KeyboardKey.KEY_RIGHT_SHIFT)
-        if self.is_running:
-             move_speed *= config.PLAYER_RUN_MULTIPLIER
+            keys |= movement.KEY_TURN_RIGHT
+        if pr.is_key_down(pr.KeyboardKey.KEY_LEFT_SHIFT) or pr.is_key_down(pr.KeyboardKey.KEY_RIGHT_SHIFT):
+            keys |= movement.KEY_RUN
+        if pr.is_key_pressed(pr.KeyboardKey.KEY_E):
+            keys |= movement.KEY_ELEVATOR
+        if pr.is_mouse_button_pressed(pr.MouseButton.MOUSE_BUTTON_LEFT):
+            keys |= movement.KEY_SHOOT # Server should handle cooldown/ammo
+        return keys
 
-        move_step = move_speed * self.delta_time
-        move_x = 0.0
-        move_y = 0.0
+    def apply_input(self, keys: int, dt: float, game_map: GameMap):
+        """Moves the player by one input command (the same step the server simulates)."""
+        self.x, self.y, self.angle, self.floor, self.is_running = movement.step(
+            self.x, self.y, self.angle, self.floor, keys, dt, game_map)
+        self.is_shooting = bool(keys & movement.KEY_SHOOT) # True for the frame the button was pressed
 
-        # Forward/Backward Movement
-        if pr.is_key_down(pr.KeyboardKey.KEY_UP) or pr.is_key_down(pr.KeyboardKey.KEY_W):
-            move_x += math.cos(self.angle) * move_step
-            move_y += math.sin(self.angle) * move_step
-        if pr.is_key_down(pr.KeyboardKey.KEY_DOWN) or pr.is_key_down(pr.KeyboardKey.KEY_S):
-            move_x -= math.cos(self.angle) * move_step
-            move_y -= math.sin(self.angle) * move_step
-
-        # Strafing (Optional - add if desired)
-        # angle_strafe = self.angle + math.pi / 2.0
-        # if pr.is_key_down(pr.KeyboardKey.KEY_Q): # Strafe Left
-        #     move_x -= math.cos(angle_strafe) * move_step
-        #     move_y -= math.sin(angle_strafe) * move_step
-        # if pr.is_key_down(pr.KeyboardKey.KEY_E): # Strafe Right
-        #     move_x += math.cos(angle_strafe) * move_step
-        #     move_y += math.sin(angle_strafe) * move_step
-
-        # Simple Collision Detection (check target position before moving)
-        target_x = self.x + move_x
-        target_y = self.y + move_y
-
-        # Check collision separately for X and Y for smoother sliding against walls
-        if not game_map.is_wall(target_x, self.y):
-            self.x = target_x
-        if not game_map.is_wall(self.x, target_y):
-            self.y = target_y
-
-        # Shooting (simple toggle for now)
-        if pr.is_mouse_button_pressed(pr.MouseButton.MOUSE_BUTTON_LEFT):
-             self.is_shooting = True # Server should handle cooldown/ammo
+    def handle_input(self, game_map: GameMap):
+        """Processes player input for movement and actions, remembering the command until the server acknowledges it."""
+        if self.is_dead:
+            return
+        # Move by the duration the server will see; the rounding remainder carries over to the next frame
+        self.input_time_debt += self.delta_time
+        dt = movement.quantize_dt(self.input_time_debt)
+        self.input_time_debt -= dt
+        if self.input_time_debt > 1.0 / INPUT_DT_SCALE:
+            self.input_time_debt = 0.0 # Frame longer than MAX_INPUT_DT (a hitch): the rest is dropped, not caught up
+        keys = self.read_input()
+        self.apply_input(keys, dt, game_map)
+        self.input_seq += 1
+        self.pending_inputs.append((self.input_seq, dt, keys))
+
+    def take_unsent_inputs(self) -> List[InputCommand]:
+        """Input commands recorded since the last call, oldest first (consecutive sequence numbers)."""
+        unsent = [command for command in self.pending_inputs if command[0] > self.last_sent_seq]
+        if unsent:
+            self.last_sent_seq = unsent[-1][0]
+        return unsent
+
+    def reset_inputs(self):
+        """Forgets the input history (new connection: the server numbers commands from 1 again)."""
+        self.pending_inputs.clear()
+        self.input_seq = 0
+        self.last_sent_seq = 0
+        self.correction_x = self.correction_y = 0.0
+
+    def reconcile(self, data: dict, game_map: GameMap):
+        """
+        Applies an authoritative player_state_correction: the server's state
+        after command `ack`. Commands it hasn't processed yet are replayed on
+        top of it. If that lands where we already are, nothing changes; small
+        differences are blended in over a few frames, large ones snap.
+        """
+        ack = data.get("ack", 0)
+        while self.pending_inputs and self.pending_inputs[0][0] <= ack:
+            self.pending_inputs.popleft()
+
+        x, y = data.get("x", self.x), data.get("y", self.y)
+        angle, floor = data.get("angle", self.angle), data.get("floor", self.floor)
+        for _, dt, keys in self.pending_inputs:
+            movement.bind_floor(game_map, floor)
+            x, y, angle, floor, _ = movement.step(x, y, angle, floor, keys, dt, game_map)
+        movement.bind_floor(game_map, self.floor)
+
+        # Where the prediction says we are, once any correction still being blended in is done
+        predicted_x, predicted_y = self.x + self.correction_x, self.y + self.correction_y
+        if floor == self.floor and math.hypot(x - predicted_x, y - predicted_y) <= config.RECONCILE_EPSILON:
+            return # Prediction was right (the usual case)
+        self.angle = angle
+        if floor != self.floor or math.hypot(x - self.x, y - self.y) > config.RECONCILE_SNAP_DISTANCE:
+            self.x, self.y, self.floor = x, y, floor
+            self.correction_x = self.correction_y = 0.0
         else:
-             # This might need refinement - maybe only set to false after server ack?
-             # Or based on animation duration? For now, just reset if not pressed.
-             # A better approach is often making is_shooting True for one frame on press.
-             self.is_shooting = False # Reset shooting state
+            self.correction_x, self.correction_y = x - self.x, y - self.y
+
+    def _blend_correction(self, game_map: GameMap):
+        """Moves part of the way towards the reconciled position (all of it if a wall is in the way)."""
+        if not self.correction_x and not self.correction_y:
+            return
+        blend = min(1.0, config.RECONCILE_RATE * self.delta_time)
+        step_x, step_y = self.correction_x * blend, self.correction_y * blend
+        if game_map.is_wall(self.x + step_x, self.y + step_y):
+            step_x, step_y = self.correction_x, self.correction_y
+        self.x += step_x
+        self.y += step_y
+        self.correction_x -= step_x
+        self.correction_y -= step_y
+        if abs(self.correction_x) < 1e-9 and abs(self.correction_y) < 1e-9:
+            self.correction_x = self.correction_y = 0.0
 
     def update(self, delta_time: float, game_map: GameMap):
         """Updates player state based on input and time."""
@@ -86,6 +134,7 @@ class Player:
         # Handle input only if not dead
         if not self.is_dead:
             self.handle_input(game_map)
+        self._blend_correction(game_map)
 
         # Update dead state based on health (server will likely be the authority)
         if self.health <= 0:
@@ -98,6 +147,7 @@ class Player:
             "x": round(self.x, 4),
             "y": round(self.y, 4),
             "angle": round(self.angle, 4),
+            "floor": self.floor,
             "health": self.health,
             "is_shooting": self.is_shooting,
             "is_dead": self.is_dead,
@@ -107,15 +157,9 @@ class Player:
 
     def apply_server_update(self, data: dict):
         """Applies authoritative state updates from the server (e.g., health)."""
-        # Important: Avoid directly setting position/angle if server doesn't correct it,
-        # unless implementing server reconciliation. Usually, server only sends corrections
-        # or health/death status.
+        # Position comes through reconcile() (player_state_correction), which replays unacknowledged inputs.
         self.health = data.get("health", self.health)
         self.is_dead = data.get("is_dead", self.is_dead)
-        # Potentially server could force position if cheating detected or on spawn:
-        # self.x = data.get("x", self.x)
-        # self.y = data.get("y", self.y)
-        # self.angle = data.get("angle", self.angle)
 
     def get_pos_tuple(self) -> Tuple[float, float]:
         return (self.x, self.y)
@@ -128,13 +172,13 @@ class Player:
         Returns the camera plane vector.
         This version uses the definition common in many raycasting tutorials
         (e.g., LodeV), directly relating plane to direction components.
-        The scaling factor (0.66) determines the field of view.
+        The plane length tan(FOV / 2) makes the projection match config.PLAYER_FOV;
+        walls (CameraRayTable) and sprites both project through this vector.
         """
         dir_x = math.cos(self.angle)
         dir_y = math.sin(self.angle)
-        # Common FOV scaling factor (approx 90 degrees horizontal)
-        # Adjust this value to change the FOV if needed
-        scale = 0.66
+        # Half-width of the camera plane at distance 1 from the player
+        scale = math.tan(config.PLAYER_FOV / 2.0)
 
         # Calculate plane vector components based on direction
         # plane_x = -dir_y * scale
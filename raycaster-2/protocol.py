@@ -0,0 +1,461 @@
+# protocol.py
+# Wire formats shared by NetworkClient and the server.
+# Every connection starts with newline-delimited JSON. The server lists the
+# codecs it speaks in handshake_ack; the client may answer protocol_select,
+# after which both directions switch to that codec (see MessageReader for how
+# the switch happens between two messages of the same stream).
+import json
+import math
+import struct
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from framing import ReceiveBuffer
+
+PROTOCOL_VERSION = 4 # 2: game_state_update can carry "removed" (area-of-interest leave events); 3: player "t";
+                     # 4: player_input / player_state_correction (server-authoritative movement)
+
+class ProtocolError(Exception):
+    """Raised when a binary stream can't be decoded (the connection must be dropped)."""
+
+
+class JsonCodec:
+    """Newline-delimited JSON, the original format and the fallback."""
+    name = "json"
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        return (json.dumps(message) + '\n').encode('utf-8')
+
+    def decode(self, buffer: bytearray, start: int, limit: Optional[int] = None) -> Tuple[Optional[Dict[str, Any]], int]:
+        """
+        Decodes one message from buffer[start:limit]. Returns (message, next_start);
+        next_start == start if incomplete.
+        """
+        end = buffer.find(b'\n', start, len(buffer) if limit is None else limit)
+        if end < 0:
+            return None, start
+        line = memoryview(buffer)[start:end] # Decoded straight from the receive buffer
+        try:
+            text = str(line, 'utf-8')
+            if not text.strip():
+                return None, end + 1
+            return json.loads(text), end + 1
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            print(f"Warning: Received invalid JSON: {bytes(line[:200])!r}")
+            return None, end + 1 # Skip the bad line, the stream stays in sync
+
+
+# --- Binary codec ---
+# Frame: u32 body length, then the body: u8 message kind + kind-specific data.
+# Object records (see RecordLayout) only carry the fields present in the
+# dict, so partial (delta) updates are small.
+_FRAME_HEADER = struct.Struct("!I")
+_KIND = struct.Struct("!B")
+_MASK = struct.Struct("!H")
+_COUNT = struct.Struct("!H")
+
+KIND_JSON = 0            # Any message, embedded as UTF-8 JSON (fallback for everything without a layout)
+KIND_PLAYER_UPDATE = 1   # {"type": "player_update", "payload": <player record without id>}
+KIND_STATE_UPDATE = 2    # {"type": "game_state_update", "payload": {"players"|"sprites"|"entities": {id: record},
+                         #                                         "removed": {section: [id, ...]}}}
+KIND_PLAYER_INPUT = 3    # {"type": "player_input", "payload": {"seq": first seq, "commands": [[dt, keys], ...]}}
+KIND_CORRECTION = 4      # {"type": "player_state_correction", "payload": {"ack", "x", "y", "angle", "floor"}}
+
+POSITION_SCALE = 256.0   # Positions are u16 in 1/256 tile steps (0 to 256 tiles)
+ANGLE_SCALE = 65536.0 / (2 * math.pi) # Angles are u16 over a full turn
+SCALE_SCALE = 256.0      # Sprite scales are u16 in 1/256 steps
+TIME_SCALE = 1000.0      # Sender timestamps are u32 milliseconds since the sender connected
+INPUT_DT_SCALE = 10000.0 # Input command durations are u16 in 1/10000 s steps (see movement.quantize_dt)
+
+_FIELD_CODES = {"pos": "H", "angle": "H", "scale": "H", "i16": "h", "u8": "B", "time": "I"}
+
+_INPUT_HEADER = struct.Struct("!IB")   # first seq, command count
+_INPUT_COMMAND = struct.Struct("!HB")  # dt, keys
+# Corrections carry exact doubles: the client replays its inputs from this state and
+# compares against its own prediction, so quantizing it would show up as an error
+_CORRECTION = struct.Struct("!IdddB")  # ack, x, y, angle, floor
+_CORRECTION_FIELDS = {"ack", "x", "y", "angle", "floor"}
+
+
+class _Unencodable(Exception):
+    """A value doesn't fit the fixed layout; the message is sent as embedded JSON instead."""
+
+
+def _quantizer(scale: float, limit: int) -> Callable[[Any], int]:
+    def quantize(value: Any) -> int:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise _Unencodable(value)
+        q = int(round(value * scale))
+        if not 0 <= q <= limit:
+            raise _Unencodable(value)
+        return q
+    return quantize
+
+
+def _quantize_angle(value: Any) -> int:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise _Unencodable(value)
+    return int(round((value % (2 * math.pi)) * ANGLE_SCALE)) & 0xFFFF
+
+
+def _check_int(value: Any) -> int:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise _Unencodable(value)
+    return value # Range is checked by struct.pack
+
+
+_ENCODERS: Dict[str, Callable[[Any], int]] = {
+    "pos": _quantizer(POSITION_SCALE, 0xFFFF), "angle": _quantize_angle,
+    "scale": _quantizer(SCALE_SCALE, 0xFFFF), "i16": _check_int, "u8": _check_int,
+    "time": _quantizer(TIME_SCALE, 0xFFFFFFFF),
+}
+_DECODERS: Dict[str, Callable[[int], Any]] = {
+    "pos": lambda q: round(q / POSITION_SCALE, 4), "angle": lambda q: round(q / ANGLE_SCALE, 4),
+    "scale": lambda q: round(q / SCALE_SCALE, 4), "i16": int, "u8": int,
+    "time": lambda q: q / TIME_SCALE,
+}
+_quantize_input_dt = _quantizer(INPUT_DT_SCALE, 0xFFFF)
+
+
+class _RecordPlan:
+    """Compiled encoding of the records of one layout that carry exactly the fields in `mask`."""
+    def __init__(self, layout: "RecordLayout", mask: int):
+        present = [(name, kind) for bit, (name, kind) in enumerate(layout.fields) if mask & (1 << bit)]
+        self.numeric = [(name, kind) for name, kind in present if kind in _FIELD_CODES]
+        self.strings = [name for name, kind in present if kind == "str"]
+        self.bools = [(index, name) for index, name in enumerate(layout.bool_names) if mask & (1 << layout.bit_of[name])]
+        codes = "".join(_FIELD_CODES[kind] for _, kind in self.numeric) + ("B" if self.bools else "")
+        self.struct = struct.Struct("!" + codes) # Every fixed-size field of the record in one pack/unpack
+        self.encoders = [(name, _ENCODERS[kind]) for name, kind in self.numeric]
+        self.decoders = [(name, _DECODERS[kind]) for name, kind in self.numeric]
+
+
+class RecordLayout:
+    """
+    Field order and encodings of one object record.
+    On the wire a record is: u16 field mask, the present fixed-size fields in
+    layout order, one byte with the present bool fields (if any), then the
+    present strings in layout order. The struct for each mask is compiled once.
+    """
+    def __init__(self, fields: List[Tuple[str, str]]):
+        self.fields = fields
+        self.names = {name for name, _ in fields}
+        self.bit_of = {name: bit for bit, (name, _) in enumerate(fields)}
+        self.bool_names = [name for name, kind in fields if kind == "bool"]
+        self._plans: Dict[int, _RecordPlan] = {}
+
+    def plan(self, mask: int) -> _RecordPlan:
+        plan = self._plans.get(mask)
+        if plan is None:
+            plan = self._plans[mask] = _RecordPlan(self, mask)
+        return plan
+
+PLAYER_LAYOUT = RecordLayout([("x", "pos"), ("y", "pos"), ("angle", "angle"), ("health", "i16"), ("floor", "u8"),
+                              ("t", "time"), ("is_shooting", "bool"), ("is_dead", "bool"), ("is_running", "bool")])
+SPRITE_LAYOUT = RecordLayout([("id", "str"), ("x", "pos"), ("y", "pos"), ("texture_name", "str"), ("texture_index", "u8"),
+                              ("health", "i16"), ("scale", "scale"), ("floor", "u8"), ("is_shooting", "bool"), ("is_dead", "bool")])
+ENTITY_LAYOUT = RecordLayout([("id", "str"), ("x", "pos"), ("y", "pos"), ("type", "str"), ("texture_name", "str"),
+                              ("texture_index", "u8"), ("scale", "scale"), ("floor", "u8"), ("is_active", "bool")])
+STATE_SECTIONS = [("players", PLAYER_LAYOUT), ("sprites", SPRITE_LAYOUT), ("entities", ENTITY_LAYOUT)]
+_SECTION_NAMES = {section for section, _ in STATE_SECTIONS}
+_REMOVED_BIT = 1 << len(STATE_SECTIONS) # Presence bit of the "removed" id lists
+
+
+def _encode_str(value: Any, out: bytearray):
+    if not isinstance(value, str):
+        raise _Unencodable(value)
+    data = value.encode('utf-8')
+    if len(data) > 255:
+        raise _Unencodable(value)
+    out += _KIND.pack(len(data))
+    out += data
+
+
+def _encode_id(value: Any, out: bytearray):
+    """IDs that are canonical UUID strings (the server's client IDs) take 16 bytes, others are strings."""
+    if isinstance(value, str) and len(value) == 36:
+        try:
+            parsed = uuid.UUID(value)
+        except ValueError:
+            parsed = None
+        if parsed is not None and str(parsed) == value:
+            out += b'\x01'
+            out += parsed.bytes
+            return
+    out += b'\x00'
+    _encode_str(value, out)
+
+
+def _encode_record(record: Dict[str, Any], layout: RecordLayout, out: bytearray):
+    if not isinstance(record, dict):
+        raise _Unencodable(record)
+    mask = 0
+    bit_of = layout.bit_of
+    for key in record:
+        bit = bit_of.get(key)
+        if bit is None:
+            raise _Unencodable(key)
+        mask |= 1 << bit
+    plan = layout.plan(mask)
+    values = [encode(record[name]) for name, encode in plan.encoders]
+    if plan.bools:
+        bools = 0
+        for index, name in plan.bools:
+            value = record[name]
+            if not isinstance(value, bool):
+                raise _Unencodable(value)
+            bools |= value << index
+        values.append(bools)
+    out += _MASK.pack(mask)
+    try:
+        out += plan.struct.pack(*values)
+    except struct.error:
+        raise _Unencodable(record)
+    for name in plan.strings:
+        _encode_str(record[name], out)
+
+
+# The same client IDs arrive every tick; formatting a UUID is most of the cost of decoding one
+_UUID_TEXT: Dict[bytes, str] = {}
+_UUID_TEXT_LIMIT = 4096
+
+
+class _Reader:
+    """Cursor over one frame body (a memoryview of the receive buffer)."""
+    def __init__(self, data: memoryview):
+        self.data = data
+        self.pos = 0
+
+    def unpack(self, fmt: struct.Struct) -> tuple:
+        if self.pos + fmt.size > len(self.data):
+            raise ProtocolError("Truncated frame")
+        values = fmt.unpack_from(self.data, self.pos)
+        self.pos += fmt.size
+        return values
+
+    def take(self, count: int) -> memoryview:
+        if self.pos + count > len(self.data):
+            raise ProtocolError("Truncated frame")
+        chunk = self.data[self.pos:self.pos + count]
+        self.pos += count
+        return chunk
+
+    def string(self) -> str:
+        length, = self.unpack(_KIND)
+        try:
+            return str(self.take(length), 'utf-8')
+        except UnicodeDecodeError as e:
+            raise ProtocolError(f"Bad string: {e}")
+
+    def ident(self) -> str:
+        tag, = self.unpack(_KIND)
+        if tag == 1:
+            raw = bytes(self.take(16))
+            text = _UUID_TEXT.get(raw)
+            if text is None:
+                if len(_UUID_TEXT) >= _UUID_TEXT_LIMIT:
+                    _UUID_TEXT.clear()
+                text = _UUID_TEXT[raw] = str(uuid.UUID(bytes=raw))
+            return text
+        return self.string()
+
+
+def _decode_record(reader: _Reader, layout: RecordLayout) -> Dict[str, Any]:
+    mask, = reader.unpack(_MASK)
+    if mask >> len(layout.fields):
+        raise ProtocolError(f"Bad field mask {mask:#x}")
+    plan = layout.plan(mask)
+    values = reader.unpack(plan.struct)
+    record = {name: decode(value) for (name, decode), value in zip(plan.decoders, values)}
+    if plan.bools:
+        bools = values[-1]
+        for index, name in plan.bools:
+            record[name] = bool(bools & (1 << index))
+    for name in plan.strings:
+        record[name] = reader.string()
+    return record
+
+
+class BinaryCodec:
+    """Length-prefixed frames with fixed layouts for the per-tick messages."""
+    name = f"binary/{PROTOCOL_VERSION}"
+
+    def __init__(self, max_frame_size: int = 1 << 20):
+        self.max_frame_size = max_frame_size
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        body = bytearray()
+        try:
+            self._encode_body(message, body)
+        except _Unencodable:
+            body = bytearray(_KIND.pack(KIND_JSON))
+            body += json.dumps(message).encode('utf-8')
+        return _FRAME_HEADER.pack(len(body)) + bytes(body)
+
+    def _encode_body(self, message: Dict[str, Any], body: bytearray):
+        msg_type = message.get("type")
+        payload = message.get("payload")
+        if set(message) != {"type", "payload"} or not isinstance(payload, dict):
+            raise _Unencodable(message)
+        if msg_type == "player_update":
+            body += _KIND.pack(KIND_PLAYER_UPDATE)
+            _encode_record(payload, PLAYER_LAYOUT, body)
+        elif msg_type == "game_state_update":
+            if any(key not in _SECTION_NAMES and key != "removed" for key in payload):
+                raise _Unencodable(payload)
+            body += _KIND.pack(KIND_STATE_UPDATE)
+            for section, layout in STATE_SECTIONS:
+                records = payload.get(section, {})
+                if not isinstance(records, dict) or len(records) > 0xFFFF:
+                    raise _Unencodable(records)
+                body += _COUNT.pack(len(records))
+                for object_id, record in records.items():
+                    _encode_id(object_id, body)
+                    _encode_record(record, layout, body)
+            # Sections that were absent decode as absent (not as empty dicts)
+            present = sum(1 << i for i, (section, _) in enumerate(STATE_SECTIONS) if section in payload)
+            removed = payload.get("removed")
+            if removed is not None:
+                if not isinstance(removed, dict) or any(key not in _SECTION_NAMES for key in removed):
+                    raise _Unencodable(removed)
+                present |= _REMOVED_BIT
+            body += _KIND.pack(present)
+            if removed is not None:
+                for section, _ in STATE_SECTIONS:
+                    object_ids = removed.get(section, [])
+                    if not isinstance(object_ids, list) or len(object_ids) > 0xFFFF:
+                        raise _Unencodable(object_ids)
+                    body += _COUNT.pack(len(object_ids))
+                    for object_id in object_ids:
+                        _encode_id(object_id, body)
+        elif msg_type == "player_input":
+            commands = payload.get("commands")
+            if set(payload) != {"seq", "commands"} or not isinstance(commands, list) or len(commands) > 0xFF:
+                raise _Unencodable(payload)
+            body += _KIND.pack(KIND_PLAYER_INPUT)
+            try:
+                body += _INPUT_HEADER.pack(_check_int(payload["seq"]), len(commands))
+                for dt, keys in commands:
+                    body += _INPUT_COMMAND.pack(_quantize_input_dt(dt), _check_int(keys))
+            except (struct.error, TypeError, ValueError):
+                raise _Unencodable(payload)
+        elif msg_type == "player_state_correction":
+            if set(payload) != _CORRECTION_FIELDS:
+                raise _Unencodable(payload)
+            body += _KIND.pack(KIND_CORRECTION)
+            try:
+                body += _CORRECTION.pack(_check_int(payload["ack"]), payload["x"], payload["y"], payload["angle"],
+                                         _check_int(payload["floor"]))
+            except struct.error:
+                raise _Unencodable(payload)
+        else:
+            raise _Unencodable(message)
+
+    def decode(self, buffer: bytearray, start: int, limit: Optional[int] = None) -> Tuple[Optional[Dict[str, Any]], int]:
+        """
+        Decodes one frame from buffer[start:limit]. Returns (message, next_start);
+        next_start == start if incomplete.
+        """
+        if limit is None:
+            limit = len(buffer)
+        if limit - start < _FRAME_HEADER.size:
+            return None, start
+        length, = _FRAME_HEADER.unpack_from(buffer, start)
+        if length == 0 or length > self.max_frame_size:
+            raise ProtocolError(f"Bad frame length {length}")
+        end = start + _FRAME_HEADER.size + length
+        if limit < end:
+            return None, start
+        reader = _Reader(memoryview(buffer)[start + _FRAME_HEADER.size:end]) # Parsed in place, no copy
+        kind, = reader.unpack(_KIND)
+        if kind == KIND_JSON:
+            try:
+                return json.loads(str(reader.data[1:], 'utf-8')), end
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                raise ProtocolError(f"Bad embedded JSON: {e}")
+        if kind == KIND_PLAYER_UPDATE:
+            return {"type": "player_update", "payload": _decode_record(reader, PLAYER_LAYOUT)}, end
+        if kind == KIND_STATE_UPDATE:
+            sections = []
+            for section, layout in STATE_SECTIONS:
+                count, = reader.unpack(_COUNT)
+                records = {}
+                for _ in range(count):
+                    object_id = reader.ident()
+                    records[object_id] = _decode_record(reader, layout)
+                sections.append((section, records))
+            present, = reader.unpack(_KIND)
+            payload: Dict[str, Any] = {section: records for i, (section, records) in enumerate(sections) if present & (1 << i)}
+            if present & _REMOVED_BIT:
+                removed = {}
+                for section, _ in STATE_SECTIONS:
+                    count, = reader.unpack(_COUNT)
+                    object_ids = [reader.ident() for _ in range(count)]
+                    if object_ids:
+                        removed[section] = object_ids
+                payload["removed"] = removed
+            return {"type": "game_state_update", "payload": payload}, end
+        if kind == KIND_PLAYER_INPUT:
+            seq, count = reader.unpack(_INPUT_HEADER)
+            commands = []
+            for _ in range(count):
+                dt, keys = reader.unpack(_INPUT_COMMAND)
+                commands.append([dt / INPUT_DT_SCALE, keys])
+            return {"type": "player_input", "payload": {"seq": seq, "commands": commands}}, end
+        if kind == KIND_CORRECTION:
+            ack, x, y, angle, floor = reader.unpack(_CORRECTION)
+            return {"type": "player_state_correction",
+                    "payload": {"ack": ack, "x": x, "y": y, "angle": angle, "floor": floor}}, end
+        raise ProtocolError(f"Unknown frame kind {kind}")
+
+
+CODECS: Dict[str, Callable[[], Any]] = {JsonCodec.name: JsonCodec, BinaryCodec.name: BinaryCodec}
+
+def supported_protocols() -> List[str]:
+    """Codec names in order of preference (sent in handshake_ack)."""
+    return [BinaryCodec.name, JsonCodec.name]
+
+def make_codec(name: str):
+    factory = CODECS.get(name)
+    return factory() if factory else None
+
+
+class MessageReader:
+    """
+    Accumulates received bytes (see framing.ReceiveBuffer) and yields complete messages.
+    The codec can be swapped between two yielded messages (e.g. right after
+    protocol_select/protocol_ack); the remaining bytes are then decoded with
+    the new codec. Consumed bytes are released once per batch rather than per
+    message, so a large burst is decoded in linear time.
+    """
+    def __init__(self, codec=None):
+        self.codec = codec or JsonCodec()
+        self.buffer = ReceiveBuffer()
+
+    def feed(self, data: bytes):
+        self.buffer.feed(data)
+
+    def recv_into(self, sock) -> int:
+        """Receives straight into the buffer (one recv_into). Returns the byte count; 0 means the peer closed."""
+        return self.buffer.recv_into(sock)
+
+    def messages(self) -> Iterator[Dict[str, Any]]:
+        buffer = self.buffer
+        pos = buffer.start
+        try:
+            while True:
+                message, next_pos = self.codec.decode(buffer.data, pos, buffer.end)
+                if next_pos == pos:
+                    break # Incomplete message, wait for more data
+                pos = next_pos
+                if message is not None:
+                    yield message
+        finally:
+            buffer.consume_to(pos)
+
+
+def delta_state(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields of `current` that differ from `previous` (everything if there is no previous state)."""
+    if previous is None:
+        return dict(current)
+    return {key: value for key, value in current.items() if key not in previous or previous[key] != value}
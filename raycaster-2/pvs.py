@@ -0,0 +1,235 @@
+# pvs.py
+# Potentially visible set: for every empty map tile, the tiles and sectors
+# that can be seen from somewhere inside it. Built once per map (at load or
+# offline), stored as integer bitsets and cached on disk keyed by map hash.
+import hashlib
+import json
+import math
+import os
+from typing import List, Optional
+
+import config
+from map import GameMap, MAP_PADDING
+
+PVS_FORMAT_VERSION = 1
+
+# Rays are fanned out from points on the border of each source tile. Any line
+# of sight from inside the tile leaves it through its border, so border points
+# see everything interior points can (up to the sampling density).
+_BORDER_SAMPLES = 4 # Sample points per tile side
+_BORDER_INSET = 0.001 # Keeps the samples strictly inside the tile
+
+
+class PotentiallyVisibleSet:
+    """
+    Tile-to-tile visibility table.
+    Bit (y * width + x) of tile_bits[source] is set if tile (x, y) may be seen
+    from tile `source`; sector_bits works the same on a grid of
+    sector_size x sector_size tile blocks. Sources that are walls or outside
+    the map have no entry, and queries from them are answered "visible".
+    """
+    def __init__(self, width: int, height: int, sector_size: int,
+                 tile_bits: List[Optional[int]], sector_bits: List[Optional[int]], map_hash: str = ""):
+        self.width = width
+        self.height = height
+        self.sector_size = sector_size
+        self.sectors_x = (width + sector_size - 1) // sector_size
+        self.sectors_y = (height + sector_size - 1) // sector_size
+        self.tile_bits = tile_bits
+        self.sector_bits = sector_bits
+        self.map_hash = map_hash
+
+    def _tile_index(self, x: float, y: float) -> int:
+        """Index of the tile containing world position (x, y), or -1 outside the map."""
+        tx, ty = int(math.floor(x)), int(math.floor(y))
+        if 0 <= tx < self.width and 0 <= ty < self.height:
+            return ty * self.width + tx
+        return -1
+
+    def _sector_index(self, x: float, y: float) -> int:
+        tx, ty = int(math.floor(x)), int(math.floor(y))
+        if 0 <= tx < self.width and 0 <= ty < self.height:
+            return (ty // self.sector_size) * self.sectors_x + tx // self.sector_size
+        return -1
+
+    def visible_tiles(self, x: float, y: float) -> Optional[int]:
+        """Bitset of tiles visible from world position (x, y); None if unknown (wall/outside)."""
+        source = self._tile_index(x, y)
+        return self.tile_bits[source] if source >= 0 else None
+
+    def can_see(self, from_x: float, from_y: float, to_x: float, to_y: float) -> bool:
+        """False only if nothing at (to_x, to_y) can be visible from (from_x, from_y)."""
+        source = self._tile_index(from_x, from_y)
+        target = self._tile_index(to_x, to_y)
+        if source < 0 or target < 0 or self.tile_bits[source] is None:
+            return True # Unknown: be conservative
+        return (self.tile_bits[source] >> target) & 1 == 1
+
+    def can_see_sector(self, from_x: float, from_y: float, to_x: float, to_y: float) -> bool:
+        """Coarse version of can_see at sector granularity."""
+        source = self._tile_index(from_x, from_y)
+        target = self._sector_index(to_x, to_y)
+        if source < 0 or target < 0 or self.sector_bits[source] is None:
+            return True
+        return (self.sector_bits[source] >> target) & 1 == 1
+
+    # --- Disk cache ---
+    def save(self, path: str):
+        """Writes the table as JSON (bitsets as hex strings)."""
+        data = {
+            "version": PVS_FORMAT_VERSION,
+            "map_hash": self.map_hash,
+            "width": self.width,
+            "height": self.height,
+            "sector_size": self.sector_size,
+            "tiles": [format(bits, "x") if bits is not None else None for bits in self.tile_bits],
+            "sectors": [format(bits, "x") if bits is not None else None for bits in self.sector_bits],
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path) # Atomic, so a concurrent reader never sees half a file
+
+    @classmethod
+    def load(cls, path: str) -> Optional["PotentiallyVisibleSet"]:
+        """Reads a table written by save(); None if missing or from another format version."""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != PVS_FORMAT_VERSION:
+            return None
+        parse = lambda values: [int(v, 16) if v is not None else None for v in values]
+        return cls(data["width"], data["height"], data["sector_size"],
+                   parse(data["tiles"]), parse(data["sectors"]), data.get("map_hash", ""))
+
+
+def map_hash(game_map: GameMap, max_depth: float = config.MAX_RENDER_DEPTH,
+             sector_size: int = config.PVS_SECTOR_SIZE,
+             rays_per_origin: int = config.PVS_RAYS_PER_ORIGIN) -> str:
+    """Hash of the grid and build settings; identifies a cached table."""
+    settings = json.dumps([PVS_FORMAT_VERSION, game_map.width, game_map.height, max_depth, sector_size, rays_per_origin])
+    digest = hashlib.sha1(settings.encode("utf-8"))
+    digest.update(game_map.textures) # Active floor's padded wall plane, hashed straight from its buffer
+    return digest.hexdigest()
+
+
+def build_pvs(game_map: GameMap, max_depth: float = config.MAX_RENDER_DEPTH,
+              sector_size: int = config.PVS_SECTOR_SIZE,
+              rays_per_origin: int = config.PVS_RAYS_PER_ORIGIN) -> PotentiallyVisibleSet:
+    """
+    Builds the table by fanning rays out of points along the border of every
+    empty tile (the same DDA as raycast.cast_rays) and marking each tile they
+    pass through or stop at, up to `max_depth`. The result is then grown by
+    one tile in every direction: sprites straddle tile borders, and the
+    sampled fan could otherwise miss slivers seen through narrow gaps.
+    """
+    import numpy as np # Only needed for building; loading and queries are pure Python
+
+    # Zero-copy view of the active floor without its border
+    padded = np.frombuffer(game_map.textures, dtype=np.uint8).reshape(game_map.height + 2 * MAP_PADDING, game_map.stride)
+    grid = padded[MAP_PADDING:MAP_PADDING + game_map.height, MAP_PADDING:MAP_PADDING + game_map.width]
+    height, width = grid.shape
+    sectors_x = (width + sector_size - 1) // sector_size
+    sectors_y = (height + sector_size - 1) // sector_size
+
+    # Ray directions shared by every origin
+    angles = np.arange(rays_per_origin) * (2 * math.pi / rays_per_origin)
+    dirs_x = np.cos(angles)
+    dirs_y = np.sin(angles)
+    with np.errstate(divide='ignore'):
+        delta_x = np.where(dirs_x != 0, np.abs(1.0 / dirs_x), np.inf)
+        delta_y = np.where(dirs_y != 0, np.abs(1.0 / dirs_y), np.inf)
+    step_x = np.where(dirs_x < 0, -1, 1)
+    step_y = np.where(dirs_y < 0, -1, 1)
+    along = [_BORDER_INSET + (1.0 - 2 * _BORDER_INSET) * i / _BORDER_SAMPLES for i in range(_BORDER_SAMPLES)]
+    far = 1.0 - _BORDER_INSET
+    offsets = ([(t, _BORDER_INSET) for t in along] + [(far, t) for t in along] +      # Top, right
+               [(1.0 - t, far) for t in along] + [(_BORDER_INSET, 1.0 - t) for t in along]) # Bottom, left
+    reach = max_depth + math.sqrt(2) # A viewer anywhere in the tile may be a diagonal further than the sample point
+    max_steps = int(reach * 2) + 2
+
+    tile_bits: List[Optional[int]] = [None] * (width * height)
+    sector_bits: List[Optional[int]] = [None] * (width * height)
+    tile_sector = ((np.arange(height)[:, None] // sector_size) * sectors_x
+                   + np.arange(width)[None, :] // sector_size)
+
+    for sy, sx in zip(*np.nonzero(grid == 0)):
+        seen = np.zeros((height, width), dtype=bool)
+        seen[sy, sx] = True
+        for ox, oy in offsets:
+            pos_x, pos_y = sx + ox, sy + oy
+            map_x = np.full(rays_per_origin, sx, dtype=np.intp)
+            map_y = np.full(rays_per_origin, sy, dtype=np.intp)
+            with np.errstate(invalid='ignore'):
+                side_x = np.where(dirs_x < 0, ox * delta_x, (1.0 - ox) * delta_x)
+                side_y = np.where(dirs_y < 0, oy * delta_y, (1.0 - oy) * delta_y)
+            active = np.arange(rays_per_origin)
+
+            for _ in range(max_steps):
+                if active.size == 0:
+                    break
+                in_x = side_x[active] < side_y[active]
+                ix, iy = active[in_x], active[~in_x]
+                travelled = np.empty(active.size)
+                travelled[in_x] = side_x[ix]
+                travelled[~in_x] = side_y[iy]
+                map_x[ix] += step_x[ix]
+                side_x[ix] += delta_x[ix]
+                map_y[iy] += step_y[iy]
+                side_y[iy] += delta_y[iy]
+
+                mx, my = map_x[active], map_y[active]
+                inside = (mx >= 0) & (mx < width) & (my >= 0) & (my < height) & (travelled <= reach)
+                mx, my = mx[inside], my[inside]
+                seen[my, mx] = True # Entered this tile (walls included: their faces are visible)
+                active = active[inside][grid[my, mx] == 0]
+
+        # Grow by one tile (8-neighbourhood)
+        grown = seen.copy()
+        grown[1:, :] |= seen[:-1, :]
+        grown[:-1, :] |= seen[1:, :]
+        grown[:, 1:] |= grown[:, :-1].copy()
+        grown[:, :-1] |= grown[:, 1:].copy()
+
+        source = int(sy) * width + int(sx)
+        tile_bits[source] = int.from_bytes(np.packbits(grown.ravel(), bitorder="little").tobytes(), "little")
+        sectors = np.zeros(sectors_x * sectors_y, dtype=bool)
+        sectors[tile_sector[grown]] = True
+        sector_bits[source] = int.from_bytes(np.packbits(sectors, bitorder="little").tobytes(), "little")
+
+    return PotentiallyVisibleSet(width, height, sector_size, tile_bits, sector_bits, map_hash(game_map, max_depth, sector_size, rays_per_origin))
+
+
+def load_or_build_pvs(game_map: GameMap, cache_dir: str = config.PVS_CACHE_DIR) -> PotentiallyVisibleSet:
+    """Returns the table for `game_map`, from the disk cache when present, otherwise building and caching it."""
+    key = map_hash(game_map)
+    path = os.path.join(cache_dir, f"{key}.json")
+    pvs = PotentiallyVisibleSet.load(path)
+    if pvs is not None and pvs.width == game_map.width and pvs.height == game_map.height:
+        return pvs
+
+    print(f"Building visibility table for {game_map.width}x{game_map.height} map...")
+    pvs = build_pvs(game_map)
+    try:
+        pvs.save(path)
+    except OSError as e:
+        print(f"Warning: Could not cache visibility table to {path}: {e}")
+    return pvs
+
+
+if __name__ == "__main__":
+    # Offline build: python pvs.py  (fills the cache for the default map)
+    import time
+    game_map = GameMap()
+    start = time.perf_counter()
+    table = build_pvs(game_map)
+    elapsed = time.perf_counter() - start
+    path = os.path.join(config.PVS_CACHE_DIR, f"{table.map_hash}.json")
+    table.save(path)
+    known = [bits for bits in table.tile_bits if bits is not None]
+    average = sum(bin(bits).count("1") for bits in known) / max(1, len(known))
+    print(f"Built PVS for {len(known)} empty tiles in {elapsed:.2f}s "
+          f"(avg {average:.1f} of {game_map.width * game_map.height} tiles visible) -> {path}")
@@ -0,0 +1,125 @@
+# raycast.py
+# Batched DDA ray casting: marches every ray of a frame at once with NumPy
+import numpy as np
+import config
+from map import GameMap, MAP_PADDING, BORDER_TILE
+
+class RayBatch:
+    """Struct-of-arrays result for one frame of rays (one entry per ray)."""
+    def __init__(self, num_rays: int):
+        self.dist = np.full(num_rays, config.MAX_RENDER_DEPTH, dtype=np.float64) # Perpendicular distance
+        self.wall_id = np.zeros(num_rays, dtype=np.int32) # Texture ID of the wall hit, 0 = no hit
+        self.side = np.zeros(num_rays, dtype=np.int8)     # 0 for Y-side hit, 1 for X-side hit
+        self.tex_x = np.zeros(num_rays, dtype=np.int32)   # Texture column of the hit
+
+    @property
+    def hit(self) -> np.ndarray:
+        """Boolean mask of rays that hit a wall within range."""
+        return self.wall_id > 0
+
+    def __len__(self) -> int:
+        return self.wall_id.shape[0]
+
+
+def grid_to_array(game_map: GameMap) -> np.ndarray:
+    """
+    Zero-copy uint8 view of the active floor's padded wall texture plane, indexed [y, x].
+    Tile (x, y) lives at [y + MAP_PADDING, x + MAP_PADDING]; the border holds BORDER_TILE.
+    """
+    return np.frombuffer(game_map.textures, dtype=np.uint8).reshape(game_map.height + 2 * MAP_PADDING, game_map.stride)
+
+
+def cast_rays(pos_x: float, pos_y: float,
+              ray_dir_x: np.ndarray, ray_dir_y: np.ndarray,
+              grid: np.ndarray,
+              max_depth: float = config.MAX_RENDER_DEPTH,
+              texture_size: int = config.TEXTURE_SIZE) -> RayBatch:
+    """
+    Casts all rays simultaneously from (pos_x, pos_y) through the padded
+    `grid` from grid_to_array(). Mirrors the scalar DDA in
+    Renderer._cast_single_ray step for step, so results can be compared
+    column-for-column.
+    """
+    num_rays = ray_dir_x.shape[0]
+    result = RayBatch(num_rays)
+    max_steps = int(max_depth * 2) # Same step limit as the scalar caster
+
+    map_x0 = int(pos_x)
+    map_y0 = int(pos_y)
+    # Rays can only start on the map or its border; from there every step lands inside the padded grid
+    if not (-MAP_PADDING <= map_x0 < grid.shape[1] - MAP_PADDING and -MAP_PADDING <= map_y0 < grid.shape[0] - MAP_PADDING):
+        return result
+
+    # Horizontal/vertical rays get an infinite delta, like the scalar path.
+    # 0 * inf produces NaN for rays starting exactly on a grid line; NaN never
+    # compares smaller, which matches the scalar comparison behaviour.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta_dist_x = np.where(ray_dir_x != 0, np.abs(1.0 / ray_dir_x), np.inf)
+        delta_dist_y = np.where(ray_dir_y != 0, np.abs(1.0 / ray_dir_y), np.inf)
+
+        step_x = np.where(ray_dir_x < 0, -1, 1)
+        step_y = np.where(ray_dir_y < 0, -1, 1)
+        side_dist_x = np.where(ray_dir_x < 0, (pos_x - map_x0) * delta_dist_x, (map_x0 + 1.0 - pos_x) * delta_dist_x)
+        side_dist_y = np.where(ray_dir_y < 0, (pos_y - map_y0) * delta_dist_y, (map_y0 + 1.0 - pos_y) * delta_dist_y)
+
+    map_x = np.full(num_rays, map_x0, dtype=np.intp)
+    map_y = np.full(num_rays, map_y0, dtype=np.intp)
+    side = result.side
+    wall_id = result.wall_id
+    travelled = np.zeros(num_rays, dtype=np.float64) # Approximate distance travelled
+    active = np.flatnonzero(np.ones(num_rays, dtype=bool)) # Indices of rays still marching
+
+    for _ in range(max_steps):
+        if active.size == 0:
+            break
+
+        # Jump to next map square, either in x-direction or in y-direction
+        step_in_x = side_dist_x[active] < side_dist_y[active]
+        ix = active[step_in_x]
+        iy = active[~step_in_x]
+
+        map_x[ix] += step_x[ix]
+        travelled[ix] = side_dist_x[ix]
+        side_dist_x[ix] += delta_dist_x[ix]
+        side[ix] = 1 # Hit an X-side (vertical line)
+
+        map_y[iy] += step_y[iy]
+        travelled[iy] = side_dist_y[iy]
+        side_dist_y[iy] += delta_dist_y[iy]
+        side[iy] = 0 # Hit a Y-side (horizontal line)
+
+        # Look up tiles (no bounds check: the solid border stops every ray); rays reaching the border stop without a hit
+        tiles = grid[map_y[active] + MAP_PADDING, map_x[active] + MAP_PADDING]
+
+        hit_wall = tiles > 0
+        too_far = travelled[active] > max_depth # Walls beyond the render depth are dropped
+        accepted = hit_wall & ~too_far & (tiles != BORDER_TILE)
+        wall_id[active[accepted]] = tiles[accepted]
+
+        active = active[~hit_wall & ~too_far]
+
+    hit = wall_id > 0
+    if not hit.any():
+        return result
+
+    idx = np.flatnonzero(hit)
+    dir_x = ray_dir_x[idx]
+    dir_y = ray_dir_y[idx]
+    x_side = side[idx] == 1
+
+    # Perpendicular distance using the map coordinates of the wall hit
+    with np.errstate(divide='ignore', invalid='ignore'):
+        perp_x = (map_x[idx] - pos_x + (1 - step_x[idx]) / 2) / dir_x
+        perp_y = (map_y[idx] - pos_y + (1 - step_y[idx]) / 2) / dir_y
+    perp_wall_dist = np.maximum(0.01, np.where(x_side, perp_x, perp_y)) # Avoid zero distance
+    result.dist[idx] = perp_wall_dist
+
+    # Texture column from the exact hit coordinates (see Renderer._calculate_texture_x)
+    hit_x = pos_x + perp_wall_dist * dir_x
+    hit_y = pos_y + perp_wall_dist * dir_y
+    wall_x = np.where(x_side, hit_y - np.floor(hit_y), hit_x - np.floor(hit_x))
+    flip = np.where(x_side, dir_x < 0, dir_y > 0)
+    wall_x = np.where(flip, 1.0 - wall_x, wall_x)
+    result.tex_x[idx] = np.clip((wall_x * texture_size).astype(np.int32), 0, texture_size - 1)
+
+    return result
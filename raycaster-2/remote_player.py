@@ -1,49 +1,106 @@
 # remote_player.py
 import math
+import time
 from typing import Optional
 from typing import Tuple
 import config
+from interpolation import SnapshotBuffer
+from spatial_index import SpatialIndex
 
 class RemotePlayer:
-    def __init__(self, player_id: str, data: dict):
+    def __init__(self, player_id: str, data: dict, spatial_index: Optional[SpatialIndex] = None):
         self.id = player_id
         self.x: float = 0.0
         self.y: float = 0.0
+        self.floor: int = 0 # Map floor the object is on
         self.angle: float = 0.0
         self.health: int = 100
         self.is_shooting: bool = False
         self.is_dead: bool = False
         self.is_running: bool = False
+        self.running_flag: bool = False # Last is_running value from the server (is_running also needs movement)
         self.is_walking: bool = False # Determine based on position change
-        self.last_update_time: float = 0.0 # For interpolation or state detection
-        self.last_x: float = 0.0
+        self.last_update_time: float = 0.0 # Local (time.monotonic) time of the newest server update
+        self.last_x: float = 0.0 # Previous server position (x/y/angle are the smoothed, drawn values)
         self.last_y: float = 0.0
+        self.server_x: float = 0.0 # Newest server state
+        self.server_y: float = 0.0
+        self.server_angle: float = 0.0
+        self.snapshots = SnapshotBuffer() # Timed in the sender's clock (its "t"), or ours if it sends none
+        self.clock_offset: Optional[float] = None # Our clock minus the sender's, at the lowest latency seen
         self.sprite_name = "WinterGuard" # Could be sent by server if different player types
 
+        self.spatial_index = spatial_index # Kept up to date with our position, if given
         self.update_from_server(data) # Initialize with first data packet
-
-    def update_from_server(self, data: dict):
-        """Updates the state of this remote player from server data."""
-        new_x = data.get("x", self.x)
-        new_y = data.get("y", self.y)
+        self.x, self.y, self.angle = self.server_x, self.server_y, self.server_angle # Appear at the initial position straight away
+        if self.spatial_index is not None:
+            self.spatial_index.update(self)
+
+    def update_from_server(self, data: dict, timestamp: Optional[float] = None):
+        """
+        Updates the state of this remote player from server data, received at
+        `timestamp` (time.monotonic(), defaults to now). Position and angle go
+        into the snapshot buffer; interpolate() moves the drawn player.
+        """
+        now = time.monotonic() if timestamp is None else timestamp
+        sent_at = data.get("t")
+        if sent_at is None:
+            snapshot_time = now - (self.clock_offset or 0.0)
+        else:
+            # Snapshots are spaced by when they were sent, not by when the server tick delivered them.
+            # The offset follows the fastest delivery, creeping up slowly in case latency grows for good.
+            offset = now - sent_at
+            if self.clock_offset is None:
+                # First "t": snapshots so far (e.g. the join record) were stamped with our clock, move them onto the sender's
+                self.snapshots.shift(-offset)
+                self.clock_offset = offset
+            elif offset < self.clock_offset:
+                self.clock_offset = offset
+            else:
+                self.clock_offset += (offset - self.clock_offset) * 0.01
+            snapshot_time = sent_at
+        new_x = data.get("x", self.server_x)
+        new_y = data.get("y", self.server_y)
+        new_angle = data.get("angle", self.server_angle)
 
         # Determine if walking/running based on position change and server flag
-        # Threshold check helps ignore minor network jitter if not interpolating
-        pos_changed = abs(new_x - self.x) > 0.01 or abs(new_y - self.y) > 0.01
+        # Threshold check helps ignore minor network jitter
+        pos_changed = abs(new_x - self.server_x) > 0.01 or abs(new_y - self.server_y) > 0.01
 
-        self.is_running = data.get("is_running", False) and pos_changed
+        # Updates may be partial (only changed fields), so missing flags keep their last value
+        self.running_flag = data.get("is_running", self.running_flag)
+        self.is_running = self.running_flag and pos_changed
         self.is_walking = (not self.is_running) and pos_changed
 
-        self.last_x = self.x
-        self.last_y = self.y
-        self.x = new_x
-        self.y = new_y
-        self.angle = data.get("angle", self.angle) # Angle needed to face sprite correctly
+        newest = self.snapshots.newest_time()
+        if newest is not None and snapshot_time - newest > config.NETWORK_UPDATE_RATE * 2:
+            # First update after standing still: start moving from the resting spot one
+            # interval earlier, rather than sliding over the whole idle period
+            self.snapshots.push(snapshot_time - config.NETWORK_UPDATE_RATE, self.server_x, self.server_y, self.server_angle)
+        floor = data.get("floor", self.floor)
+        if floor != self.floor:
+            self.snapshots.clear() # Changed floors: no blending between them
+        self.snapshots.push(snapshot_time, new_x, new_y, new_angle)
+
+        self.last_x = self.server_x
+        self.last_y = self.server_y
+        self.server_x = new_x
+        self.server_y = new_y
+        self.server_angle = new_angle # Angle needed to face sprite correctly
+        self.floor = floor
         self.health = data.get("health", self.health)
-        self.is_shooting = data.get("is_shooting", False) # Might need timing/animation logic
-        self.is_dead = data.get("is_dead", False)
-        # Record update time if needed for interpolation (requires pr.get_time())
-        # self.last_update_time = pr.get_time()
+        self.is_shooting = data.get("is_shooting", self.is_shooting) # Might need timing/animation logic
+        self.is_dead = data.get("is_dead", self.is_dead)
+        self.last_update_time = now
+
+    def interpolate(self, now: float):
+        """Moves the drawn player to where it was config.INTERPOLATION_DELAY seconds before `now`."""
+        sample = self.snapshots.sample(now - (self.clock_offset or 0.0) - config.INTERPOLATION_DELAY)
+        if sample is None:
+            return
+        self.x, self.y, self.angle = sample
+        if self.spatial_index is not None:
+            self.spatial_index.update(self)
 
     def get_texture_index(self, player_angle_rad: float) -> int:
         """Determines the correct sprite index based on state and viewing angle."""
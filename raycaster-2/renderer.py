@@ -1,6 +1,8 @@
 # renderer.py
 import pyray as pr
 import math # <-- Added import
+import time
+import numpy as np
 import config
 from typing import List, Dict, Tuple, Optional
 
@@ -9,39 +11,75 @@ from player import Player
 from remote_player import RemotePlayer, set_observer_state # Import the function too
 from sprite import Sprite
 from entity import Entity
-from map import GameMap
+from map import GameMap, MAP_PADDING, BORDER_TILE
 from assets_manager import AssetsManager
+from raycast import RayBatch, cast_rays, grid_to_array
+from camera import CameraRayTable
+from wall_batch import WallBatch
+from software_renderer import SoftwareRasterizer
+from zbuffer import ZBuffer
+from spatial_index import SpatialIndex
+from pvs import PotentiallyVisibleSet, load_or_build_pvs
 
 # Structure to hold ray hit information
 class RayHit:
-    def __init__(self, dist: float, wall_id: int, hit_x: float, hit_y: float, side: int, ray_angle: float):
+    def __init__(self, dist: float, wall_id: int, hit_x: float, hit_y: float, side: int, ray_dir_x: float, ray_dir_y: float):
         self.dist = dist          # Distance to wall hit
         self.wall_id = wall_id    # Texture ID of the wall hit
         self.hit_x = hit_x        # Exact world X coordinate of the hit
         self.hit_y = hit_y        # Exact world Y coordinate of the hit
         self.side = side          # 0 for Y-side hit, 1 for X-side hit (for shading/texture coord)
-        self.ray_angle = ray_angle # Angle of the ray that caused the hit
+        self.ray_dir_x = ray_dir_x # Direction of the ray that caused the hit
+        self.ray_dir_y = ray_dir_y
 
 class Renderer:
-    def __init__(self, assets_manager: AssetsManager):
+    def __init__(self, assets_manager: AssetsManager, headless: bool = False,
+                 spatial_index: Optional[SpatialIndex] = None):
         self.assets_manager = assets_manager
-        self.z_buffer: List[float] = [config.MAX_RENDER_DEPTH] * config.SCREEN_WIDTH # For sprite occlusion
-
-    def _cast_single_ray(self, player: Player, game_map: GameMap, ray_angle: float) -> Optional[RayHit]:
-        """Casts a single ray and returns hit information or None."""
-        # Normalize angle
-        ray_angle %= (2 * math.pi)
-        if ray_angle < 0: ray_angle += 2 * math.pi
-
+        self.headless = headless # No window: frames only go to the software framebuffer
+        # When given, objects are fetched from the index by view frustum instead of scanning every dict
+        self.spatial_index = spatial_index
+        self.z_buffer = ZBuffer(config.SCREEN_WIDTH, config.MAX_RENDER_DEPTH, config.RENDER_SCALE_FACTOR) # For sprite occlusion
+        self.raycast_mode = config.RAYCAST_MODE # "vectorized" or "scalar"
+        # NumPy copy of the map grid for the vectorized caster, rebuilt when the map version changes
+        self._grid_array: Optional[np.ndarray] = None
+        self._grid_version = -1
+        self._grid_map_id = -1
+        # Tile visibility table used to skip objects in unseen tiles, rebuilt when the map version changes
+        self.use_pvs = config.PVS_ENABLED
+        self._pvs: Optional[PotentiallyVisibleSet] = None
+        self._pvs_version = -1
+        self._pvs_map_id = -1
+        # Per-column camera rays, rebuilt only when FOV or resolution change
+        self._ray_table: Optional[CameraRayTable] = None
+        self.wall_draw_mode = config.WALL_DRAW_MODE # "batched" or "per_column"
+        self.wall_batch = WallBatch(config.NUM_RAYS)
+        # "raylib" issues draw calls per slice/stripe; "software" rasterizes into a NumPy framebuffer
+        self.backend = "software" if headless else config.RENDER_BACKEND
+        self.software: Optional[SoftwareRasterizer] = None
+        if self.backend == "software":
+            self.software = SoftwareRasterizer(assets_manager)
+        # Seconds spent in each stage of the last frame ("cast", "walls", "sprites", "ui")
+        self.stage_timings: Dict[str, float] = {}
+
+    def _cast_single_ray(self, player: Player, game_map: GameMap, ray_dir_x: float, ray_dir_y: float) -> Optional[RayHit]:
+        """
+        Casts a single ray and returns hit information or None.
+        The ray direction is dir + camera_x * plane (not normalized), so the
+        resulting distance is already perpendicular to the camera plane.
+        """
         map_x = int(player.x)
         map_y = int(player.y)
+        # Rays can only start on the map or its border; from there every step stays inside the padded tile plane
+        if not (-MAP_PADDING <= map_x < game_map.width + MAP_PADDING and -MAP_PADDING <= map_y < game_map.height + MAP_PADDING):
+            return None
+        tiles = game_map.textures # Wall texture IDs of the active floor (elevators are open floor)
+        stride = game_map.stride
 
         # Distances to next X and Y grid lines
         # Avoid division by zero for horizontal/vertical rays
-        cos_ray_angle = math.cos(ray_angle)
-        sin_ray_angle = math.sin(ray_angle)
-        delta_dist_x = abs(1 / cos_ray_angle) if cos_ray_angle != 0 else float('inf')
-        delta_dist_y = abs(1 / sin_ray_angle) if sin_ray_angle != 0 else float('inf')
+        delta_dist_x = abs(1 / ray_dir_x) if ray_dir_x != 0 else float('inf')
+        delta_dist_y = abs(1 / ray_dir_y) if ray_dir_y != 0 else float('inf')
 
 
         # Length of ray from current position to next x or y-side
@@ -52,14 +90,14 @@ class Renderer:
         step_x: int
         step_y: int
 
-        if cos_ray_angle < 0:
+        if ray_dir_x < 0:
             step_x = -1
             side_dist_x = (player.x - map_x) * delta_dist_x
         else:
             step_x = 1
             side_dist_x = (map_x + 1.0 - player.x) * delta_dist_x
 
-        if sin_ray_angle < 0:
+        if ray_dir_y < 0:
             step_y = -1
             side_dist_y = (player.y - map_y) * delta_dist_y
         else:
@@ -90,15 +128,14 @@ class Renderer:
                 current_dist_y += delta_dist_y
                 side = 0 # Hit a Y-side (horizontal line)
 
-            # Check if ray has hit a wall
-            if 0 <= map_x < game_map.width and 0 <= map_y < game_map.height:
-                 wall_id = game_map.grid[map_y][map_x]
-                 if wall_id > 0:
-                    hit = wall_id
-            else:
+            # Check if ray has hit a wall (the map's solid border means no bounds check is needed)
+            wall_id = tiles[(map_y + MAP_PADDING) * stride + map_x + MAP_PADDING]
+            if wall_id == BORDER_TILE:
                  # Hit edge of map boundaries - treat as a distant wall or stop ray
                  hit = -1 # Special value indicating out of bounds
                  break # Stop casting
+            if wall_id > 0:
+                hit = wall_id
 
             # Check distance limit based on approximate distance travelled
             if dist > config.MAX_RENDER_DEPTH:
@@ -111,19 +148,19 @@ class Renderer:
              # Use map coordinates of the *wall hit*
              if side == 1: # Hit X-side
                  # (map_x - player.x + (1 - step_x) / 2) is distance along X axis from player to wall center
-                 perp_wall_dist = (map_x - player.x + (1 - step_x) / 2) / cos_ray_angle if cos_ray_angle != 0 else float('inf')
+                 perp_wall_dist = (map_x - player.x + (1 - step_x) / 2) / ray_dir_x if ray_dir_x != 0 else float('inf')
              else: # Hit Y-side
                  # (map_y - player.y + (1 - step_y) / 2) is distance along Y axis from player to wall center
-                 perp_wall_dist = (map_y - player.y + (1 - step_y) / 2) / sin_ray_angle if sin_ray_angle != 0 else float('inf')
+                 perp_wall_dist = (map_y - player.y + (1 - step_y) / 2) / ray_dir_y if ray_dir_y != 0 else float('inf')
 
              # Clamp distance if it went slightly beyond due to calculation method
              perp_wall_dist = max(0.01, perp_wall_dist) # Avoid zero distance
 
              # Calculate exact hit coordinates (needed for texture mapping)
-             hit_x = player.x + perp_wall_dist * cos_ray_angle
-             hit_y = player.y + perp_wall_dist * sin_ray_angle
+             hit_x = player.x + perp_wall_dist * ray_dir_x
+             hit_y = player.y + perp_wall_dist * ray_dir_y
 
-             return RayHit(perp_wall_dist, hit, hit_x, hit_y, side, ray_angle)
+             return RayHit(perp_wall_dist, hit, hit_x, hit_y, side, ray_dir_x, ray_dir_y)
 
         return None # No hit within max distance or map bounds
 
@@ -136,15 +173,15 @@ class Renderer:
              # Use the Y coordinate of the hit point relative to the map tile floor
              wall_x = hit.hit_y - math.floor(hit.hit_y)
              # Flip texture coordinate if ray is moving left (hitting east face from west)
-             if math.cos(hit.ray_angle) < 0:
+             if hit.ray_dir_x < 0:
                  wall_x = 1.0 - wall_x
          else: # Hit a Y-side (horizontal wall line)
              # Use the X coordinate of the hit point relative to the map tile floor
              wall_x = hit.hit_x - math.floor(hit.hit_x)
              # Flip texture coordinate if ray is moving up (hitting south face from north)
-             # Screen Y is down. If sin(angle) > 0, ray moves "down" on screen (positive Y in world?)
-             # Let's assume world Y increases upwards. sin(angle) > 0 means moving up.
-             if math.sin(hit.ray_angle) > 0:
+             # Screen Y is down. If ray_dir_y > 0, ray moves "down" on screen (positive Y in world?)
+             # Let's assume world Y increases upwards. ray_dir_y > 0 means moving up.
+             if hit.ray_dir_y > 0:
                  wall_x = 1.0 - wall_x
 
          tex_x = int(wall_x * config.TEXTURE_SIZE)
@@ -160,19 +197,65 @@ class Renderer:
                    sprites: Dict[str, Sprite],
                    entities: Dict[str, Entity]):
         """Draws the entire game scene for one frame."""
+        if self.headless:
+            self.rasterize_frame(player, game_map, remote_players, sprites, entities)
+            start = time.perf_counter()
+            self.rasterize_ui(player)
+            self.stage_timings["ui"] = time.perf_counter() - start
+            return
+
         pr.begin_drawing()
         pr.clear_background(pr.BLACK) # Clear entire screen
 
-        self.draw_floor_ceiling()
-        self.draw_walls(player, game_map)
-        self.draw_objects(player, remote_players, sprites, entities)
+        if self.software:
+            self.rasterize_frame(player, game_map, remote_players, sprites, entities)
+            self.software.present() # One texture upload + one full-screen draw
+        else:
+            self.draw_floor_ceiling()
+            self.draw_walls(player, game_map)
+            start = time.perf_counter()
+            self.draw_objects(player, remote_players, sprites, entities, game_map)
+            self.stage_timings["sprites"] = time.perf_counter() - start
+        start = time.perf_counter()
         self.draw_ui(player) # Draw UI on top
+        self.stage_timings["ui"] = time.perf_counter() - start
 
         # Draw FPS
         pr.draw_fps(10, 10)
 
         pr.end_drawing()
 
+    def rasterize_frame(self,
+                        player: Player,
+                        game_map: GameMap,
+                        remote_players: Dict[str, RemotePlayer],
+                        sprites: Dict[str, Sprite],
+                        entities: Dict[str, Entity]):
+        """Renders the 3D view into the software framebuffer (no GPU calls)."""
+        batch = self.cast_walls(player, game_map)
+        start = time.perf_counter()
+        self.z_buffer.fill(batch)
+        self.software.draw_floor_ceiling()
+        self.software.draw_walls(batch)
+        walls_done = time.perf_counter()
+        self.draw_objects(player, remote_players, sprites, entities, game_map)
+        self.stage_timings["walls"] = walls_done - start
+        self.stage_timings["sprites"] = time.perf_counter() - walls_done
+
+    def rasterize_ui(self, player: Player):
+        """Draws the health and mana bars into the software framebuffer (text needs raylib)."""
+        bar_width = 200
+        bar_height = 20
+        bar_y = config.SCREEN_HEIGHT - 30
+        health_width = int(bar_width * max(0.0, player.health / config.PLAYER_HEALTH_START))
+        mana_width = int(bar_width * max(0.0, player.mana / config.PLAYER_MANA_START))
+        mana_x = config.SCREEN_WIDTH - 10 - bar_width
+
+        self.software.fill_rect(10, bar_y, bar_width, bar_height, pr.GRAY)
+        self.software.fill_rect(10, bar_y, health_width, bar_height, pr.RED)
+        self.software.fill_rect(mana_x, bar_y, bar_width, bar_height, pr.GRAY)
+        self.software.fill_rect(mana_x, bar_y, mana_width, bar_height, pr.BLUE)
+
     def draw_floor_ceiling(self):
         """Draws the floor and ceiling."""
         # Ceiling
@@ -181,28 +264,79 @@ class Renderer:
         pr.draw_rectangle(0, config.SCREEN_HEIGHT // 2, config.SCREEN_WIDTH, config.SCREEN_HEIGHT // 2, config.COLOR_FLOOR)
 
 
+    def _get_grid_array(self, game_map: GameMap) -> np.ndarray:
+        """Returns the cached NumPy copy of the map grid, refreshing it if the map changed."""
+        if self._grid_array is None or self._grid_version != game_map.version or self._grid_map_id != id(game_map):
+            self._grid_array = grid_to_array(game_map)
+            self._grid_version = game_map.version
+            self._grid_map_id = id(game_map)
+        return self._grid_array
+
+    def _get_pvs(self, game_map: GameMap) -> Optional[PotentiallyVisibleSet]:
+        """Returns the visibility table for the map (from the disk cache or built), refreshing it if the map changed."""
+        if not self.use_pvs or game_map.width == 0:
+            return None
+        if self._pvs is None or self._pvs_version != game_map.version or self._pvs_map_id != id(game_map):
+            self._pvs = load_or_build_pvs(game_map)
+            self._pvs_version = game_map.version
+            self._pvs_map_id = id(game_map)
+        return self._pvs
+
+    def _get_ray_table(self) -> CameraRayTable:
+        """Returns the per-column camera ray table, rebuilding it if FOV or resolution changed."""
+        if self._ray_table is None or not self._ray_table.matches(config.PLAYER_FOV, config.NUM_RAYS, config.SCREEN_WIDTH):
+            self._ray_table = CameraRayTable(config.PLAYER_FOV, config.NUM_RAYS, config.SCREEN_WIDTH)
+        return self._ray_table
+
+    def _cast_rays_scalar(self, player: Player, game_map: GameMap, ray_dirs_x: List[float], ray_dirs_y: List[float]) -> RayBatch:
+        """Casts the frame one ray at a time with _cast_single_ray (reference path)."""
+        batch = RayBatch(config.NUM_RAYS)
+        for i in range(config.NUM_RAYS):
+            hit = self._cast_single_ray(player, game_map, ray_dirs_x[i], ray_dirs_y[i])
+            if hit:
+                batch.dist[i] = hit.dist
+                batch.wall_id[i] = hit.wall_id
+                batch.side[i] = hit.side
+                batch.tex_x[i] = self._calculate_texture_x(hit, player)
+        return batch
+
+    def cast_walls(self, player: Player, game_map: GameMap) -> RayBatch:
+        """Casts one frame of rays using the configured raycast mode."""
+        start = time.perf_counter()
+        ray_dirs_x, ray_dirs_y = self._get_ray_table().rotate(player.get_dir_vector(), player.get_plane_vector())
+
+        if self.raycast_mode == "scalar":
+            batch = self._cast_rays_scalar(player, game_map, ray_dirs_x.tolist(), ray_dirs_y.tolist())
+        else:
+            batch = cast_rays(player.x, player.y, ray_dirs_x, ray_dirs_y, self._get_grid_array(game_map))
+        self.stage_timings["cast"] = time.perf_counter() - start
+        return batch
+
     def draw_walls(self, player: Player, game_map: GameMap):
         """Casts rays and draws wall slices."""
-        start_angle = player.angle - config.PLAYER_FOV / 2.0
-        angle_step = config.PLAYER_FOV / config.NUM_RAYS
+        batch = self.cast_walls(player, game_map)
+        start = time.perf_counter()
+        self.z_buffer.fill(batch)
 
-        # Reset Z-Buffer for this frame
-        self.z_buffer = [config.MAX_RENDER_DEPTH] * config.SCREEN_WIDTH
+        if self.wall_draw_mode == "batched":
+            self.wall_batch.draw(batch, self.assets_manager)
+        else:
+            self._draw_wall_columns(batch)
+        self.stage_timings["walls"] = time.perf_counter() - start
 
-        for i in range(config.NUM_RAYS):
-            ray_angle = start_angle + i * angle_step
-            hit = self._cast_single_ray(player, game_map, ray_angle)
+    def _draw_wall_columns(self, batch: RayBatch):
+        """Draws wall slices one draw_texture_pro call per ray (reference path)."""
+        dists = batch.dist.tolist()
+        wall_ids = batch.wall_id.tolist()
+        sides = batch.side.tolist()
+        tex_xs = batch.tex_x.tolist()
 
+        for i in range(config.NUM_RAYS):
+            wall_id = wall_ids[i]
             screen_x = i * config.RENDER_SCALE_FACTOR # Scale wall slice width
 
-            if hit:
-                # Store distance in Z-buffer for sprite occlusion
-                # Clamp distance to prevent issues
-                z_dist = max(0.01, hit.dist)
-                for k in range(config.RENDER_SCALE_FACTOR):
-                    buffer_idx = screen_x + k
-                    if 0 <= buffer_idx < config.SCREEN_WIDTH:
-                        self.z_buffer[buffer_idx] = z_dist
+            if wall_id > 0:
+                z_dist = max(0.01, dists[i])
 
                 # Calculate wall slice height - avoid division by zero
                 line_height = int(config.SCREEN_HEIGHT / z_dist) if z_dist > 0.01 else config.SCREEN_HEIGHT * 100
@@ -212,62 +346,95 @@ class Renderer:
                 draw_end = line_height // 2 + config.SCREEN_HEIGHT // 2
 
                 # Get texture
-                wall_texture = self.assets_manager.get_wall_texture(hit.wall_id)
-
-                # Calculate texture X coordinate
-                tex_x = self._calculate_texture_x(hit, player)
+                wall_texture = self.assets_manager.get_wall_texture(wall_id)
 
                 # Define source rectangle on the texture
-                tex_rect_src = pr.Rectangle(tex_x, 0, 1, float(wall_texture.height)) # Use texture height
+                tex_rect_src = pr.Rectangle(tex_xs[i], 0, 1, float(wall_texture.height)) # Use texture height
 
                 # Define destination rectangle on the screen
                 tex_rect_dest = pr.Rectangle(float(screen_x), float(draw_start), float(config.RENDER_SCALE_FACTOR), float(line_height))
 
                 # Apply simple shading based on wall side
                 tint = pr.WHITE
-                if hit.side == 1: # X-side hit, make slightly darker
+                if sides[i] == 1: # X-side hit, make slightly darker
                      tint = pr.Color(200, 200, 200, 255)
 
                 # Draw the texture slice
                 pr.draw_texture_pro(wall_texture, tex_rect_src, tex_rect_dest, pr.Vector2(0, 0), 0.0, tint)
 
-            # else: # No need to explicitly clear z_buffer if initialized each frame
-            #      pass
-
 
     def draw_objects(self,
                       player: Player,
                       remote_players: Dict[str, RemotePlayer],
                       sprites: Dict[str, Sprite],
-                      entities: Dict[str, Entity]):
+                      entities: Dict[str, Entity],
+                      game_map: Optional[GameMap] = None):
         """Draws all sprites and entities, sorted by distance."""
 
         set_observer_state(player.get_pos_tuple(), player.angle) # For remote player texture direction
 
+        all_objects = self._collect_objects(player, remote_players, sprites, entities, game_map)
+
+        # --- Get Player Vectors ---
+        player_dir_x, player_dir_y = player.get_dir_vector()
+        player_plane_x, player_plane_y = player.get_plane_vector() # Using updated get_plane_vector
+
+        # --- Draw sorted objects ---
+        for obj in all_objects:
+            if not self._project_object(obj, player, player_dir_x, player_dir_y, player_plane_x, player_plane_y):
+                continue
+            if self.software:
+                self.software.draw_sprite(obj["pixels"], obj["draw_start_x"], obj["draw_start_y"],
+                                          obj["sprite_width"], obj["sprite_height"], obj["transform_y"], self.z_buffer)
+            else:
+                self._draw_object_runs(obj)
+
+    def _collect_objects(self,
+                         player: Player,
+                         remote_players: Dict[str, RemotePlayer],
+                         sprites: Dict[str, Sprite],
+                         entities: Dict[str, Entity],
+                         game_map: Optional[GameMap] = None) -> List[dict]:
+        """Gathers every drawable object with its image, sorted furthest first."""
+        remote_candidates = remote_players.values()
+        sprite_candidates = sprites.values()
+        entity_candidates = entities.values()
+        if self.spatial_index is not None:
+            # Only objects inside the view frustum and MAX_RENDER_DEPTH
+            player_dir_x, player_dir_y = player.get_dir_vector()
+            player_plane_x, player_plane_y = player.get_plane_vector()
+            visible = self.spatial_index.query_frustum(player.x, player.y, player_dir_x, player_dir_y,
+                                                       player_plane_x, player_plane_y, config.MAX_RENDER_DEPTH)
+            remote_candidates = [obj for obj in visible if isinstance(obj, RemotePlayer)]
+            sprite_candidates = [obj for obj in visible if isinstance(obj, Sprite)]
+            entity_candidates = [obj for obj in visible if isinstance(obj, Entity)]
+        # Objects on other floors of the building are never visible
+        remote_candidates = [obj for obj in remote_candidates if obj.floor == player.floor]
+        sprite_candidates = [obj for obj in sprite_candidates if obj.floor == player.floor]
+        entity_candidates = [obj for obj in entity_candidates if obj.floor == player.floor]
+        pvs = self._get_pvs(game_map) if game_map is not None else None
+        if pvs is not None:
+            # Drop objects standing in tiles that can't be seen from the player's tile
+            can_see = lambda obj: pvs.can_see(player.x, player.y, obj.x, obj.y)
+            remote_candidates = [obj for obj in remote_candidates if can_see(obj)]
+            sprite_candidates = [obj for obj in sprite_candidates if can_see(obj)]
+            entity_candidates = [obj for obj in entity_candidates if can_see(obj)]
+
         # --- Combine all drawable objects into one list ---
         all_objects = []
         # Add remote players
-        for rp in remote_players.values():
+        for rp in remote_candidates:
             if not rp.is_dead: # Simple check
                 tex_index = rp.get_texture_index(player.angle)
-                texture = self.assets_manager.get_sprite_texture(rp.sprite_name, tex_index)
-                all_objects.append({
-                    "x": rp.x, "y": rp.y, "texture": texture, "scale": config.SPRITE_SCALE,
-                    "obj_ref": rp })
+                all_objects.append(self._object_entry(rp, rp.sprite_name, tex_index, config.SPRITE_SCALE))
         # Add generic sprites
-        for sp in sprites.values():
+        for sp in sprite_candidates:
              if sp.should_draw():
-                texture = self.assets_manager.get_sprite_texture(sp.texture_name, sp.texture_index)
-                all_objects.append({
-                    "x": sp.x, "y": sp.y, "texture": texture, "scale": sp.scale,
-                    "obj_ref": sp })
+                all_objects.append(self._object_entry(sp, sp.texture_name, sp.texture_index, sp.scale))
         # Add entities
-        for ent in entities.values():
+        for ent in entity_candidates:
             if ent.should_draw():
-                texture = self.assets_manager.get_sprite_texture(ent.texture_name, ent.texture_index)
-                all_objects.append({
-                    "x": ent.x, "y": ent.y, "texture": texture, "scale": ent.scale,
-                    "obj_ref": ent })
+                all_objects.append(self._object_entry(ent, ent.texture_name, ent.texture_index, ent.scale))
 
         # --- Calculate distance squared and sort ---
         for obj in all_objects:
@@ -276,124 +443,135 @@ class Renderer:
             obj["dist_sq"] = dx*dx + dy*dy
 
         all_objects.sort(key=lambda s: s["dist_sq"], reverse=True) # Furthest first
-
-        # --- Get Player Vectors ---
-        player_dir_x, player_dir_y = player.get_dir_vector()
-        player_plane_x, player_plane_y = player.get_plane_vector() # Using updated get_plane_vector
-
-        # --- Draw sorted objects ---
-        for obj in all_objects:
-            # --- Step 1: Translate to Player-Relative Coordinates ---
-            sprite_x = obj["x"] - player.x
-            sprite_y = obj["y"] - player.y
-
-            # --- Step 2: Transform using Inverse Camera Matrix ---
-            det = (player_plane_x * player_dir_y - player_dir_x * player_plane_y)
-            if abs(det) < 1e-9: # Avoid division by zero
+        return all_objects
+
+    def _object_entry(self, obj_ref, sprite_name: str, tex_index: int, scale: float) -> dict:
+        """Builds the draw-list entry for one object, with the image the active backend samples."""
+        entry = {"x": obj_ref.x, "y": obj_ref.y, "scale": scale, "obj_ref": obj_ref}
+        if self.software:
+            pixels = self.assets_manager.get_sprite_pixels(sprite_name, tex_index)
+            entry["pixels"] = pixels
+            entry["tex_w"], entry["tex_h"] = pixels.shape[1], pixels.shape[0]
+        else:
+            texture = self.assets_manager.get_sprite_texture(sprite_name, tex_index)
+            entry["texture"] = texture
+            entry["tex_w"], entry["tex_h"] = (texture.width, texture.height) if texture else (0, 0)
+        return entry
+
+    def _project_object(self, obj: dict, player: Player,
+                        player_dir_x: float, player_dir_y: float,
+                        player_plane_x: float, player_plane_y: float) -> bool:
+        """Projects an object onto the screen, storing its bounds in `obj`. False if it is not visible."""
+        # --- Step 1: Translate to Player-Relative Coordinates ---
+        sprite_x = obj["x"] - player.x
+        sprite_y = obj["y"] - player.y
+
+        # --- Step 2: Transform using Inverse Camera Matrix ---
+        det = (player_plane_x * player_dir_y - player_dir_x * player_plane_y)
+        if abs(det) < 1e-9: # Avoid division by zero
+            return False
+
+        inv_det = 1.0 / det
+        transform_x = inv_det * (player_dir_y * sprite_x - player_dir_x * sprite_y)
+        transform_y = inv_det * (-player_plane_y * sprite_x + player_plane_x * sprite_y)
+
+
+        # --- DEBUGGING PRINTS ---
+        is_test_sprite = False
+        obj_ref = obj.get("obj_ref")
+        # Check if obj_ref exists and has an 'id' attribute before accessing it
+        if obj_ref and hasattr(obj_ref, 'id') and obj_ref.id == "sprite_guard_npc":
+            is_test_sprite = True
+            print(f"--- Debug Sprite (sprite_guard_npc) ---")
+            print(f"  World Pos: ({obj['x']:.2f}, {obj['y']:.2f})")
+            print(f"  Player Pos: ({player.x:.2f}, {player.y:.2f}, Angle: {math.degrees(player.angle):.1f} deg)")
+            print(f"  Relative Pos (sprite_x, sprite_y): ({sprite_x:.2f}, {sprite_y:.2f})")
+            print(f"  Player Dir (x,y): ({player_dir_x:.2f}, {player_dir_y:.2f})")
+            print(f"  Player Plane (x,y): ({player_plane_x:.2f}, {player_plane_y:.2f})")
+            print(f"  Determinant (det): {det:.4f}") # Print determinant itself
+            print(f"  Inverse Determinant (inv_det): {inv_det:.4f}")
+            print(f"  Camera Space (transform_x, transform_y): ({transform_x:.4f}, {transform_y:.4f})")
+        # --- END DEBUGGING PRINTS ---
+
+
+        # --- Step 3: Check if Sprite is Behind Camera ---
+        if transform_y <= 0.1:
+             if is_test_sprite:
+                 print(f"  CULLED: transform_y ({transform_y:.4f}) <= 0.1")
+                 print(f"--------------------------------------")
+             return False
+
+        # --- Step 4: Calculate Screen Coordinates and Dimensions ---
+        sprite_screen_x = int((config.SCREEN_WIDTH / 2) * (1 + transform_x / transform_y))
+        sprite_height = abs(int(config.SCREEN_HEIGHT / transform_y * obj["scale"]))
+        aspect_ratio = 1.0
+        if obj["tex_h"] != 0:
+             aspect_ratio = float(obj["tex_w"]) / float(obj["tex_h"])
+        sprite_width = abs(int(sprite_height * aspect_ratio))
+
+        # Check for invalid texture dimensions or zero calculated sprite size
+        if obj["tex_h"] <= 0 or obj["tex_w"] <= 0 or sprite_width <= 0 or sprite_height <= 0:
+            return False
+
+        # --- Step 5: Calculate Drawing Bounds on Screen (Clamped) ---
+        vertical_offset = sprite_height // 5
+        draw_start_y = -sprite_height // 2 + config.SCREEN_HEIGHT // 2 + vertical_offset
+        draw_end_y = sprite_height // 2 + config.SCREEN_HEIGHT // 2 + vertical_offset
+        draw_start_x = -sprite_width // 2 + sprite_screen_x
+        draw_end_x = sprite_width // 2 + sprite_screen_x
+
+        obj["transform_y"] = transform_y
+        obj["sprite_width"] = sprite_width
+        obj["sprite_height"] = sprite_height
+        obj["draw_start_x"] = draw_start_x
+        obj["draw_end_x"] = draw_end_x
+        obj["draw_start_y"] = draw_start_y
+        obj["draw_end_y"] = draw_end_y
+        return True
+
+    def _draw_object_runs(self, obj: dict):
+        """Draws a projected object as one textured quad per contiguous run of unoccluded columns."""
+        sprite_width = obj["sprite_width"]
+        sprite_height = obj["sprite_height"]
+        draw_start_x = obj["draw_start_x"]
+        draw_start_y = obj["draw_start_y"]
+        draw_start_y_clamped = max(0, draw_start_y)
+        draw_end_y_clamped = min(config.SCREEN_HEIGHT, obj["draw_end_y"])
+        draw_start_x_clamped = max(0, draw_start_x)
+        draw_end_x_clamped = min(config.SCREEN_WIDTH, obj["draw_end_x"])
+
+        current_texture = obj["texture"]
+        tex_rect_src_h = float(obj["tex_h"])
+        tex_rect_src_w = float(obj["tex_w"])
+
+        # Calculate the actual visible height on screen AFTER clamping
+        clamped_dest_height = float(draw_end_y_clamped - draw_start_y_clamped)
+        if clamped_dest_height <= 0:
+            return
+
+        # --- Vertical source clipping: the same for every run of this object ---
+        # Convert the screen pixels clipped from the top into texture pixels
+        src_y_offset = ((draw_start_y_clamped - draw_start_y) / float(sprite_height)) * tex_rect_src_h
+        src_h = (clamped_dest_height / float(sprite_height)) * tex_rect_src_h
+        src_y = max(0.0, min(src_y_offset, tex_rect_src_h))
+        src_h = max(0.0, min(src_h, tex_rect_src_h - src_y))
+        if src_h <= 0:
+            return
+
+        # --- One quad per run of columns where the object is in front of the walls ---
+        texels_per_column = tex_rect_src_w / sprite_width
+        for run_start, run_end in self.z_buffer.visible_spans(draw_start_x_clamped, draw_end_x_clamped, obj["transform_y"]):
+            # Map the run's screen columns (relative to the sprite's screen start) -> texture X span
+            src_x = (run_start - draw_start_x) * texels_per_column
+            src_w = (run_end - run_start) * texels_per_column
+            src_x = max(0.0, min(src_x, tex_rect_src_w))
+            src_w = max(0.0, min(src_w, tex_rect_src_w - src_x))
+            if src_w <= 0:
                 continue
 
-            inv_det = 1.0 / det
-            transform_x = inv_det * (player_dir_y * sprite_x - player_dir_x * sprite_y)
-            transform_y = inv_det * (-player_plane_y * sprite_x + player_plane_x * sprite_y)
-
-
-            # --- DEBUGGING PRINTS ---
-            is_test_sprite = False
-            obj_ref = obj.get("obj_ref")
-            # Check if obj_ref exists and has an 'id' attribute before accessing it
-            if obj_ref and hasattr(obj_ref, 'id') and obj_ref.id == "sprite_guard_npc":
-                is_test_sprite = True
-                print(f"--- Debug Sprite (sprite_guard_npc) ---")
-                print(f"  World Pos: ({obj['x']:.2f}, {obj['y']:.2f})")
-                print(f"  Player Pos: ({player.x:.2f}, {player.y:.2f}, Angle: {math.degrees(player.angle):.1f} deg)")
-                print(f"  Relative Pos (sprite_x, sprite_y): ({sprite_x:.2f}, {sprite_y:.2f})")
-                print(f"  Player Dir (x,y): ({player_dir_x:.2f}, {player_dir_y:.2f})")
-                print(f"  Player Plane (x,y): ({player_plane_x:.2f}, {player_plane_y:.2f})")
-                print(f"  Determinant (det): {det:.4f}") # Print determinant itself
-                print(f"  Inverse Determinant (inv_det): {inv_det:.4f}")
-                print(f"  Camera Space (transform_x, transform_y): ({transform_x:.4f}, {transform_y:.4f})")
-            # --- END DEBUGGING PRINTS ---
-
-
-            # --- Step 3: Check if Sprite is Behind Camera ---
-            if transform_y <= 0.1:
-                 if is_test_sprite:
-                     print(f"  CULLED: transform_y ({transform_y:.4f}) <= 0.1")
-                     print(f"--------------------------------------")
-                 continue
-
-            # --- Step 4: Calculate Screen Coordinates and Dimensions ---
-            sprite_screen_x = int((config.SCREEN_WIDTH / 2) * (1 + transform_x / transform_y))
-            sprite_height = abs(int(config.SCREEN_HEIGHT / transform_y * obj["scale"]))
-            aspect_ratio = 1.0
-            current_texture = obj.get("texture") # Get texture safely
-            if current_texture and current_texture.height != 0:
-                 aspect_ratio = float(current_texture.width) / float(current_texture.height)
-            sprite_width = abs(int(sprite_height * aspect_ratio))
-
-            # --- Step 5: Calculate Drawing Bounds on Screen (Clamped) ---
-            vertical_offset = sprite_height // 5
-            draw_start_y = -sprite_height // 2 + config.SCREEN_HEIGHT // 2 + vertical_offset
-            draw_end_y = sprite_height // 2 + config.SCREEN_HEIGHT // 2 + vertical_offset
-            draw_start_y_clamped = max(0, draw_start_y)
-            draw_end_y_clamped = min(config.SCREEN_HEIGHT, draw_end_y)
-
-            draw_start_x = -sprite_width // 2 + sprite_screen_x
-            draw_end_x = sprite_width // 2 + sprite_screen_x
-            draw_start_x_clamped = max(0, draw_start_x)
-            draw_end_x_clamped = min(config.SCREEN_WIDTH, draw_end_x)
-
-            # --- Step 6: Draw Vertical Stripes with Z-Buffer Check ---
-            tex_rect_src_h = float(current_texture.height) if current_texture else 0.0
-            tex_rect_src_w = float(current_texture.width) if current_texture else 0.0
-
-            # Check for invalid texture dimensions or zero calculated sprite width
-            if tex_rect_src_h <= 0 or tex_rect_src_w <= 0 or sprite_width <= 0: continue
-
-            # Calculate the actual visible height on screen AFTER clamping
-            clamped_dest_height = float(draw_end_y_clamped - draw_start_y_clamped)
-
-            # Only proceed if there's actually something to draw vertically
-            if clamped_dest_height > 0 and sprite_height > 0: # Also check original height to prevent division by zero
-
-                for stripe in range(draw_start_x_clamped, draw_end_x_clamped):
-                    # Check Z-buffer (only draw if in front of wall/object at this stripe)
-                    if 0 <= stripe < config.SCREEN_WIDTH and transform_y < self.z_buffer[stripe]:
-
-                        # --- Calculate Texture X Coordinate (Horizontal) ---
-                        # Map screen stripe coordinate (relative to sprite's screen start) -> texture X
-                        tex_el_x = stripe - draw_start_x # How many pixels into the sprite width are we?
-                        tex_x = int(tex_el_x * tex_rect_src_w / sprite_width) # Map to texture width
-
-                        # Ensure tex_x is valid (can happen with float inaccuracies)
-                        if 0 <= tex_x < tex_rect_src_w:
-
-                            # --- Adjust Source Rect Y and Height for Vertical Clamping ---
-                            # Calculate how much of the sprite was clipped from the top (in texture space)
-                            clip_top_pixels_screen = draw_start_y_clamped - draw_start_y
-                            # Convert screen pixel clipping to texture pixel clipping
-                            src_y_offset = (clip_top_pixels_screen / float(sprite_height)) * tex_rect_src_h
-
-                            # Calculate how much of the sprite height is visible (in texture space)
-                            visible_height_ratio = clamped_dest_height / float(sprite_height)
-                            src_h = visible_height_ratio * tex_rect_src_h
-
-                            # Clamp source coordinates to texture bounds
-                            src_y = max(0.0, min(src_y_offset, tex_rect_src_h))
-                            src_h = max(0.0, min(src_h, tex_rect_src_h - src_y))
-                            # --- End Source Rect Adjustment ---
-
-                            # Check if calculated source height is valid before drawing
-                            if src_h > 0:
-                                # Source rect for this single *visible portion* of the vertical texture stripe
-                                stripe_src_rect = pr.Rectangle(float(tex_x), src_y, 1.0, src_h)
-
-                                # Destination rect for this single vertical stripe *on screen*
-                                # Use clamped Y start and clamped height
-                                stripe_dest_rect = pr.Rectangle(float(stripe), float(draw_start_y_clamped), 1.0, clamped_dest_height)
-
-                                # Draw the texture segment
-                                pr.draw_texture_pro(current_texture, stripe_src_rect, stripe_dest_rect, pr.Vector2(0,0), 0.0, pr.WHITE)
+            run_src_rect = pr.Rectangle(src_x, src_y, src_w, src_h)
+            run_dest_rect = pr.Rectangle(float(run_start), float(draw_start_y_clamped), float(run_end - run_start), clamped_dest_height)
+            pr.draw_texture_pro(current_texture, run_src_rect, run_dest_rect, pr.Vector2(0,0), 0.0, pr.WHITE)
 
     def draw_ui(self, player: Player):
          """Draws User Interface elements like health, ammo, etc."""
@@ -420,4 +598,10 @@ class Renderer:
 
          pr.draw_rectangle(config.SCREEN_WIDTH-10-mana_bar_width, config.SCREEN_HEIGHT - 30, mana_bar_width, mana_bar_height, pr.GRAY)
          pr.draw_rectangle(config.SCREEN_WIDTH-10-mana_bar_width, config.SCREEN_HEIGHT - 30, mana_current_width, mana_bar_height, pr.BLUE)
-         pr.draw_text(f"Mana: {player.mana}", config.SCREEN_WIDTH-10, config.SCREEN_HEIGHT - 28, 18, pr.WHITE)
\ No newline at end of file
+         pr.draw_text(f"Mana: {player.mana}", config.SCREEN_WIDTH-10, config.SCREEN_HEIGHT - 28, 18, pr.WHITE)
+
+    def unload(self):
+        """Releases GPU resources owned by the renderer."""
+        self.wall_batch.unload()
+        if self.software:
+            self.software.unload()
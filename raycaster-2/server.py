@@ -1,11 +1,13 @@
 # server.py
+import abc
+import queue
+import socket
 import socketserver
 import threading
-import json
 import time
 import uuid # To generate unique IDs (alternative to ip:port)
 import math # <-- Added import
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, List, Set, Tuple
 
 try:
     from map import GameMap
@@ -13,40 +15,71 @@ except ImportError:
     print("Warning: map.py not found. Cannot load map data.")
     GameMap = None # Define as None if import fails
 
-# Reuse configuration from the client side for host/port
 try:
-    import config
-    SERVER_HOST = config.SERVER_IP # Use the IP specified in config
-    SERVER_PORT = config.SERVER_PORT
-    print(f"Server Configuration: Host={SERVER_HOST}, Port={SERVER_PORT}")
+    from pvs import load_or_build_pvs
+except ImportError:
+    print("Warning: pvs.py not found. Player updates will be sent to every client.")
+    load_or_build_pvs = None
+
+try:
+    import movement
+except ImportError:
+    print("Warning: movement.py not found. Player input will be ignored.")
+    movement = None
+
+try:
+    from npc import NpcSystem, spawn_positions
 except ImportError:
-    print("Warning: config.py not found. Using default server settings.")
-    SERVER_HOST = "127.0.0.1"
-    SERVER_PORT = 5555
-    # Define a minimal map if config isn't available
-    DEFAULT_MAP_GRID = [
-        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-        [1, 0, 0, 0, 2, 0, 0, 0, 0, 1],
-        [1, 0, 1, 0, 0, 0, 1, 0, 0, 1],
-        [1, 0, 2, 0, 0, 0, 3, 0, 0, 1],
-        [1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-        [1, 0, 0, 0, 3, 0, 0, 0, 0, 1],
-        [1, 0, 0, 0, 1, 0, 1, 0, 0, 1],
-        [1, 0, 2, 0, 0, 0, 2, 0, 0, 1],
-        [1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-        [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-    ]
+    print("Warning: npc.py not found. NPCs will not move.")
+    NpcSystem = None
+
+try:
+    from hitscan import HitscanSystem
+except ImportError:
+    print("Warning: hitscan.py not found. Shots will not hit anything.")
+    HitscanSystem = None
+
+from interest import InterestManager, SECTIONS
+from outbound import OutboundQueue
+from protocol import JsonCodec, MessageReader, ProtocolError, delta_state, make_codec, supported_protocols
+from state_store import StateStore
+
+# Reuse configuration from the client side for host/port
+import config
+SERVER_HOST = config.SERVER_IP # Use the IP specified in config
+SERVER_PORT = config.SERVER_PORT
+print(f"Server Configuration: Host={SERVER_HOST}, Port={SERVER_PORT}")
+# Define a minimal map in case map.py isn't available
+DEFAULT_MAP_GRID = [
+    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+    [1, 0, 0, 0, 2, 0, 0, 0, 0, 1],
+    [1, 0, 1, 0, 0, 0, 1, 0, 0, 1],
+    [1, 0, 2, 0, 0, 0, 3, 0, 0, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 0, 0, 0, 3, 0, 0, 0, 0, 1],
+    [1, 0, 0, 0, 1, 0, 1, 0, 0, 1],
+    [1, 0, 2, 0, 0, 0, 2, 0, 0, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+]
 
 
 # --- Global Server State ---
-# Thread-safe access needed if modifying complex structures concurrently.
-# For simple dict updates on player states, Python's GIL provides some safety,
-# but a lock is better practice for adding/removing clients.
+# A single writer owns the game state: the simulation thread (run_tick_loop)
+# in threaded mode, the event loop in asyncio/UDP mode. Handler threads only
+# decode messages and post() them to it, so they never wait on each other.
+# The lock is still taken around state access, but only the simulation
+# thread does so, so it is never contended.
 server_state_lock = threading.Lock()
+# Work posted by handler threads for the simulation thread: (function, args), applied in order
+inbound: "queue.SimpleQueue[Tuple[Callable[..., Any], tuple]]" = queue.SimpleQueue()
 # Maps client_id to its handler instance (for sending data)
 connected_clients: Dict[str, 'ClientHandler'] = {}
-# Maps client_id to the latest player state dictionary received
-player_states: Dict[str, Dict[str, Any]] = {}
+# Every player/sprite/entity change goes through the versioned store (see state_store.py), so each
+# client can be sent what changed since the version it has; the *_states names are read-only views
+state_store = StateStore(SECTIONS, getattr(config, "STATE_HISTORY_TICKS", 64))
+# Maps client_id to the latest player state dictionary
+player_states: Dict[str, Dict[str, Any]] = state_store.states["players"]
 # Static map data (load from config or file ideally)
 game_map_data = {"grid": []} # Default empty map
 if GameMap: # Check if import succeeded
@@ -56,18 +89,39 @@ if GameMap: # Check if import succeeded
         print("Loaded map data from map.GameMap")
     except Exception as e:
         print(f"Error loading map data from GameMap: {e}")
-elif 'DEFAULT_MAP_GRID' in locals(): # Fallback if GameMap failed but config fallback worked
+else: # Fallback if the GameMap import failed
      game_map_data = {"grid": DEFAULT_MAP_GRID}
-     print("Using default map grid due to import/config issues.")
-else:
-     print("Warning: Could not load map data.")
+     print("Using default map grid due to import issues.")
+# Collision map for simulating player movement (re-bound to each player's floor as it is stepped)
+simulation_map = GameMap() if GameMap else None
+
+# Tile visibility tables, one per floor: objects in tiles a client can't see are outside its area of interest
+map_pvs: Dict[int, Any] = {} # floor -> PotentiallyVisibleSet
+if GameMap and load_or_build_pvs and getattr(config, "PVS_ENABLED", False):
+    try:
+        pvs_map = GameMap()
+        for pvs_floor in range(pvs_map.num_floors):
+            pvs_map.set_floor(pvs_floor)
+            map_pvs[pvs_floor] = load_or_build_pvs(pvs_map)
+        print(f"Loaded visibility tables for {len(map_pvs)} floor(s) for update filtering.")
+    except Exception as e:
+        print(f"Error building visibility tables, updates on floors without one will not be filtered: {e}")
+pending_disconnects: List[str] = [] # Players that left since the last tick
+pending_corrections: Dict[str, int] = {} # client_id -> last input command processed, for players that sent input since the last tick
+pending_damage: Set[str] = set() # Players whose health changed since the last tick (told by player_state_correction)
+# Fields only the server's simulation may change; player_update can't set them
+AUTHORITATIVE_FIELDS = {"x", "y", "angle", "floor", "health", "is_dead", "t"}
+RELAYED_MOVE_FIELDS = ("x", "y", "angle", "floor", "is_running", "is_shooting")
+SERVER_TICK_RATE = getattr(config, "SERVER_TICK_RATE", 1 / 20)
+# A client with more unsent messages than this is disconnected (see outbound.py)
+MAX_QUEUED_MESSAGES = getattr(config, "SERVER_MAX_QUEUED_MESSAGES", 256)
 
 # Get player start position from config if possible, otherwise use defaults
 try:
     player_start_x = config.PLAYER_START_X
     player_start_y = config.PLAYER_START_Y
     player_start_angle = config.PLAYER_START_ANGLE # Might be useful
-except (NameError, AttributeError):
+except AttributeError:
     player_start_x = 3.5
     player_start_y = 3.5
     player_start_angle = 0.0
@@ -95,31 +149,73 @@ entity_states: Dict[str, Dict[str, Any]] = {
      # "entity_key_1": {"id": "entity_key_1", "x": 2.5, "y": 2.5, "type": "Key", "texture_name": "Key", "texture_index": 0, "is_active": True, "scale": 0.5},
      # "entity_chest_1": {"id": "entity_chest_1", "x": 8.5, "y": 1.5, "type": "Chest", "texture_name": "Chest", "texture_index": 0, "is_active": True, "scale": 0.8}
 }
+for section, initial_states in (("sprites", sprite_states), ("entities", entity_states)):
+    for object_id, object_state in initial_states.items():
+        state_store.add(section, object_id, object_state)
+
+# NPCs (npc.py): the guard chases the nearest player; NPC_SPAWN_COUNT adds more guards (e.g. for load tests)
+npc_system: Optional["NpcSystem"] = None
+if NpcSystem and simulation_map is not None and getattr(config, "NPC_ENABLED", False):
+    npc_system = NpcSystem(simulation_map, config.NPC_MOVE_SPEED, config.NPC_CHASE_RANGE,
+                           config.NPC_STOP_DISTANCE, config.NPC_FLOW_FIELD_CACHE)
+    npc_system.add("sprite_guard_npc")
+    for number, (npc_x, npc_y) in enumerate(spawn_positions(simulation_map, getattr(config, "NPC_SPAWN_COUNT", 0))):
+        npc_id = f"npc_guard_{number}"
+        state_store.add("sprites", npc_id, {"id": npc_id, "x": npc_x, "y": npc_y, "texture_name": "WinterGuard",
+                                            "texture_index": 1, "scale": 1, "health": 50})
+        npc_system.add(npc_id)
+    print(f"NPCs enabled: {len(npc_system.npcs)} chasing players.")
+state_store.commit()
+
+# Shots are resolved here, against positions rewound to when the shooter saw them (hitscan.py)
+hitscan_system: Optional["HitscanSystem"] = None
+if HitscanSystem and simulation_map is not None and getattr(config, "HITSCAN_ENABLED", False):
+    hitscan_system = HitscanSystem(simulation_map, config.HITSCAN_RADIUS, config.HITSCAN_RANGE,
+                                   config.LAG_COMPENSATION_WINDOW, SERVER_TICK_RATE)
+    hitscan_system.record_all(state_store, time.monotonic()) # The initial objects are part of every full state, not a change
+sprite_states = state_store.states["sprites"]
+entity_states = state_store.states["entities"]
+section_states: Dict[str, Dict[str, Dict[str, Any]]] = state_store.states
+
+# Area of interest: each client only hears about objects near it (see interest.py)
+interest_manager: Optional[InterestManager] = None
+if getattr(config, "AOI_ENABLED", False):
+    interest_manager = InterestManager(config.AOI_RADIUS, config.AOI_HYSTERESIS, map_pvs or None)
+    for section in ("sprites", "entities"):
+        for object_id, object_state in section_states[section].items():
+            interest_manager.track(section, object_id, object_state)
 # ---------------------------
 
 
-class ClientHandler(socketserver.BaseRequestHandler):
-    """Handles communication with a single client."""
+class ClientSession(abc.ABC):
+    """
+    Transport-independent part of a client connection: registration, the
+    handshake, message handling and cleanup. Subclasses own the socket and
+    provide `reader` (MessageReader), `codec`, send_message() and switch_send_codec().
+    """
     client_id: str = None
-    buffer: str = "" # Buffer for partial messages
+    state_version = 0 # Store version this client has (see build_tick_snapshots)
+    # True if a sent snapshot is sure to arrive (a stream), so the client has it as soon as it is sent;
+    # otherwise the transport advances state_version when the client acknowledges one
+    reliable_state = True
 
-    def setup(self):
-        """Called when a new client connects."""
+    def open_session(self):
+        """Registers the client, then sends the handshake and the full game state."""
         self.client_id = str(uuid.uuid4()) # More robust ID
+        self.reset_inputs()
         print(f"Client connected: {self.client_address}, assigned ID: {self.client_id}")
 
         with server_state_lock:
             connected_clients[self.client_id] = self
-            # Initialize player state (client will send its actual starting state)
+            self.state_version = state_store.version # A tick before our full state is sent may only send changes
+            # Initialize player state; as a new object, the next tick sends it in full to the other clients
             # Use the actual player start coordinates from config/defaults
-            player_states[self.client_id] = {
-                "x": player_start_x, "y": player_start_y, "angle": player_start_angle,
-                "health": config.PLAYER_HEALTH_START if 'config' in globals() else 100,
-                "is_shooting": False, "is_dead": False, "is_running": False
-            }
+            state_store.add("players", self.client_id, spawn_state())
+            if interest_manager:
+                interest_manager.track("players", self.client_id, player_states[self.client_id])
 
         # 1. Send handshake acknowledgment  1 with the client's new ID
-        handshake_msg = {"type": "handshake_ack", "payload": {"client_id": self.client_id}}
+        handshake_msg = {"type": "handshake_ack", "payload": {"client_id": self.client_id, "protocols": supported_protocols()}}
         self.send_message(handshake_msg)
 
         # 2. Send the initial full game state
@@ -127,54 +223,47 @@ class ClientHandler(socketserver.BaseRequestHandler):
         initial_state_msg = {"type": "game_state_full", "payload": full_state}
         self.send_message(initial_state_msg)
 
-        # 3. Notify *other* clients about the new connection
-        new_player_update = {
-             "players": {self.client_id: player_states[self.client_id]} # Send initial actual state
-        }
-        broadcast_message({"type": "game_state_update", "payload": new_player_update}, exclude_client_id=self.client_id)
-
-
-    def handle(self):
-        """Main loop to receive data from the client."""
-        try:
-            while True:
-                data = self.request.recv(4096).decode('utf-8')
-                if not data:
-                    print(f"Client {self.client_id} disconnected (no data).")
-                    break
-
-                self.buffer += data
-                while '\n' in self.buffer:
-                    message_str, self.buffer = self.buffer.split('\n', 1)
-                    if message_str:
-                        try:
-                            message = json.loads(message_str)
-                            self.process_message(message)
-                        except json.JSONDecodeError:
-                            print(f"Warning: Received invalid JSON from {self.client_id}: {message_str}")
-                        except Exception as e:
-                             print(f"Error processing message from {self.client_id}: {e}")
-
-        except ConnectionResetError:
-            print(f"Client {self.client_id} connection reset.")
-        except Exception as e:
-            print(f"Error in handler for {self.client_id}: {e}")
-        finally:
-            pass # Cleanup is handled in finish()
-
-
-    def finish(self):
-        """Called when the client disconnects or handle() exits."""
+    def reset_inputs(self):
+        """Starts the movement simulation (see apply_inputs) afresh: the client numbers its commands from 1."""
+        self.input_seq = 0 # Last input command processed
+        self.input_time = 0.0 # Simulated seconds of accepted input commands
+        self.input_clock_start = time.monotonic()
+        self.last_input_moved = False
+        self.last_shot_time = -math.inf # Input time of the last shot fired (for HITSCAN_COOLDOWN)
+
+    def respawn(self):
+        """
+        Brings a dead player back at the start position with full health. The
+        client starts over with a new Player, so its input numbering restarts
+        too; it is then sent the full game state, as on joining.
+        """
+        with server_state_lock:
+            state = player_states.get(self.client_id)
+            if state is None or not state["is_dead"]:
+                return # Only the dead respawn (it isn't a way to refill health)
+            self.reset_inputs()
+            pending_corrections.pop(self.client_id, None) # Would acknowledge a command of the old numbering
+            state_store.update("players", self.client_id, spawn_state())
+        print(f"Player {self.client_id} respawned.")
+        self.send_message({"type": "game_state_full", "payload": self.get_full_game_state()})
+
+    def close_session(self):
+        """Unregisters the client; the next tick tells the others it left."""
         if not self.client_id: return # Avoid issues if setup failed partially
         print(f"Cleaning up connection for client {self.client_id} ({self.client_address}).")
         with server_state_lock:
             if self.client_id in connected_clients:
                 del connected_clients[self.client_id]
-            if self.client_id in player_states:
-                del player_states[self.client_id]
-
-        disconnect_payload = {"client_id": self.client_id}
-        broadcast_message({"type": "player_disconnect", "payload": disconnect_payload}, exclude_client_id=self.client_id)
+            state_store.remove("players", self.client_id)
+            pending_damage.discard(self.client_id)
+            if hitscan_system:
+                hitscan_system.forget("players", self.client_id)
+            if interest_manager:
+                interest_manager.untrack("players", self.client_id)
+                interest_manager.remove_viewer(self.client_id)
+            # Sent by the tick, after any snapshot that may still carry this player's last update
+            pending_corrections.pop(self.client_id, None)
+            pending_disconnects.append(self.client_id)
 
 
     def process_message(self, message: Dict[str, Any]):
@@ -182,32 +271,25 @@ class ClientHandler(socketserver.BaseRequestHandler):
         msg_type = message.get("type")
         payload = message.get("payload")
 
-        if msg_type == "player_update" and payload:
+        if msg_type == "player_input" and payload:
+            self.apply_inputs(payload)
+
+        elif msg_type == "player_update" and payload:
+            # Movement and health are simulated here (player_input); only cosmetic fields are taken from clients
+            payload = {key: value for key, value in payload.items() if key not in AUTHORITATIVE_FIELDS}
+            if not payload:
+                return
             with server_state_lock:
-                 if self.client_id in player_states:
-                    player_states[self.client_id].update(payload)
-                 else:
-                     player_states[self.client_id] = payload # Should not happen
-
-            update_payload = { "players": {self.client_id: payload} }
-            # --- TODO: Server side logic here ---
-            # Validate movement, check shooting hits, update health, NPC AI etc.
-            # For now, just relay the state.
-            # Example: Check if player shot the debug sprite
-            # if payload.get("is_shooting"):
-            #    player_pos = (payload.get("x"), payload.get("y"))
-            #    player_angle = payload.get("angle")
-            #    with server_state_lock: # Lock needed to access sprite_states potentially
-            #         hit_sprite_id = check_shot_hit(player_pos, player_angle, sprite_states)
-            #         if hit_sprite_id == "sprite_guard_npc":
-            #             print("Player shot the debug sprite!")
-            #             # Modify sprite state (e.g., health) and include in update_payload
-            #             if "sprites" not in update_payload: update_payload["sprites"] = {}
-            #             sprite_states[hit_sprite_id]["health"] -= 10
-            #             update_payload["sprites"][hit_sprite_id] = {"health": sprite_states[hit_sprite_id]["health"]}
-
-
-            broadcast_message({"type": "game_state_update", "payload": update_payload}, exclude_client_id=self.client_id)
+                 # Relayed by the next tick; several updates within one tick merge into one
+                 state_store.update("players", self.client_id, payload)
+
+            # Shots come with player_input (KEY_SHOOT) and are resolved there, see resolve_shot
+
+        elif msg_type == "protocol_select":
+            self.select_protocol((payload or {}).get("protocol", ""))
+
+        elif msg_type == "respawn":
+            self.respawn()
 
         elif msg_type == "request_map":
              map_msg = {"type": "map_update", "payload": game_map_data}
@@ -216,47 +298,440 @@ class ClientHandler(socketserver.BaseRequestHandler):
             print(f"Warning: Received unhandled message type '{msg_type}' from {self.client_id}")
 
 
-    def send_message(self, message: Dict[str, Any]):
-        """Sends a JSON message to this specific client."""
-        if not self.request._closed: # Check if socket is still open
-            try:
-                json_message = json.dumps(message) + '\n'
-                self.request.sendall(json_message.encode('utf-8'))
-            except OSError as e:
-                print(f"Error sending message to {self.client_id}: {e}")
-            except Exception as e:
-                 print(f"Error encoding or sending message to {self.client_id}: {e}")
+    def apply_inputs(self, payload: Dict[str, Any]):
+        """
+        Simulates a batch of the client's input commands (movement.step, the
+        same code the client predicts with). Commands are numbered; ones
+        already processed are skipped. A client may not simulate more time
+        than has passed since it connected (plus INPUT_TIME_SLACK): commands
+        beyond that are acknowledged but not applied, so a sped-up client is
+        pulled back by its next correction.
+        """
+        first_seq, commands = payload.get("seq"), payload.get("commands")
+        if movement is None or not isinstance(first_seq, int) or not isinstance(commands, list):
+            return
+        if len(commands) > config.INPUT_HISTORY_SIZE:
+            # More than a client ever keeps unacknowledged: don't let one message hold up the simulation thread
+            print(f"Warning: Dropped input batch of {len(commands)} commands from {self.client_id}.")
+            return
+        time_budget = time.monotonic() - self.input_clock_start + config.INPUT_TIME_SLACK
+        with server_state_lock:
+            state = player_states.get(self.client_id)
+            if state is None:
+                return
+            before = {key: state[key] for key in RELAYED_MOVE_FIELDS}
+            x, y, angle, floor = state["x"], state["y"], state["angle"], state["floor"]
+            is_running, is_shooting = state["is_running"], False
+            shots = [] # (x, y, angle, floor, input time) of each shot fired in this batch
+            for seq, command in enumerate(commands, first_seq):
+                if seq <= self.input_seq:
+                    continue # Sent again (or out of order): already simulated
+                try:
+                    dt, keys = float(command[0]), int(command[1])
+                    if not math.isfinite(dt):
+                        raise ValueError("non-finite dt") # NaN would slip through the clamp below
+                    dt = min(max(dt, 0.0), config.MAX_INPUT_DT)
+                except (TypeError, ValueError, IndexError, OverflowError):
+                    print(f"Warning: Malformed input command from {self.client_id}: {command!r}")
+                    break
+                self.input_seq = seq
+                if state["is_dead"] or self.input_time + dt > time_budget:
+                    continue
+                self.input_time += dt
+                movement.bind_floor(simulation_map, floor)
+                x, y, angle, floor, is_running = movement.step(x, y, angle, floor, keys, dt, simulation_map)
+                is_shooting = is_shooting or bool(keys & movement.KEY_SHOOT)
+                if keys & movement.KEY_SHOOT and self.input_time - self.last_shot_time >= config.HITSCAN_COOLDOWN:
+                    self.last_shot_time = self.input_time
+                    shots.append((x, y, angle, floor, self.input_time))
+            changes = delta_state(before, {"x": x, "y": y, "angle": angle, "floor": floor,
+                                           "is_running": is_running, "is_shooting": is_shooting})
+            moved = "x" in changes or "y" in changes
+            if not moved and self.last_input_moved:
+                # Just stopped: repeat the position once so other clients interpolate to a stop
+                # instead of extrapolating past it (a silent player and a late packet look the same)
+                changes.update(x=x, y=y)
+            self.last_input_moved = moved
+            if changes:
+                changes["t"] = round(self.input_time, 3) # Simulated time: lets receivers space our updates correctly
+                state_store.update("players", self.client_id, changes)
+            pending_corrections[self.client_id] = self.input_seq
+            if hitscan_system:
+                for shot in shots:
+                    self.resolve_shot(*shot)
+
+    def resolve_shot(self, x: float, y: float, angle: float, floor: int, shot_time: float):
+        """
+        Resolves one shot fired at input time `shot_time` (server_state_lock held).
+        Targets are tested where this client saw them: INTERPOLATION_DELAY in
+        the past, plus the input it simulated after the shot (the rest of the
+        batch). Network latency isn't measured by this protocol, so it isn't
+        added; the rewind is capped at LAG_COMPENSATION_WINDOW.
+        """
+        rewind = min(config.INTERPOLATION_DELAY + self.input_time - shot_time, config.LAG_COMPENSATION_WINDOW)
+        hit = hitscan_system.trace(x, y, angle, floor, time.monotonic() - rewind, state_store, ("players", self.client_id))
+        if hit is not None:
+            (section, target_id), _distance = hit
+            apply_damage(section, target_id, config.HITSCAN_DAMAGE, self.client_id)
+
+    def select_protocol(self, name: str):
+        """
+        Switches this connection to codec `name`. The client encodes with it
+        right after protocol_select, so incoming bytes switch immediately; our
+        protocol_ack is still sent in JSON and everything after it in the new codec.
+        """
+        codec = make_codec(name)
+        if codec is None or name not in supported_protocols():
+            print(f"Warning: Client {self.client_id} selected unknown protocol '{name}'.")
+            return
+        self.reader.codec = codec
+        self.switch_send_codec(make_codec(name), {"type": "protocol_ack", "payload": {"protocol": name}})
+        print(f"Client {self.client_id} switched to protocol '{name}'.")
+
+    @abc.abstractmethod
+    def switch_send_codec(self, codec, ack: Dict[str, Any]):
+        """Sends `ack` in the current format, then encodes everything after it with `codec`."""
+
+    @abc.abstractmethod
+    def send_message(self, message: Dict[str, Any], encoded: Optional[Dict[str, bytes]] = None):
+        """Sends `message`; `encoded` (codec name -> bytes) is shared by every recipient of a broadcast."""
 
 
     def get_full_game_state(self) -> Dict[str, Any]:
-        """Constructs the complete current game state."""
+        """Constructs the complete current game state (only this client's area of interest, if enabled)."""
         with server_state_lock:
-            # Create copies to avoid potential modification during iteration/sending
-            current_player_states = {pid: pdata.copy() for pid, pdata in player_states.items()}
-            current_sprite_states = {sid: sdata.copy() for sid, sdata in sprite_states.items()}
-            current_entity_states = {eid: edata.copy() for eid, edata in entity_states.items()}
-
+            return self.full_game_state_locked()
+
+    def full_game_state_locked(self) -> Dict[str, Any]:
+        """get_full_game_state with server_state_lock already held. The client has the current version afterwards."""
+        only = None
+        if interest_manager and self.client_id in player_states:
+            only = interest_manager.add_viewer(self.client_id, player_states[self.client_id])
+            only["players"].add(self.client_id) # The client's own entry is always included
+        # Copies (only of what is sent), so nothing changes under the encoder
+        state = state_store.snapshot(only)
+        self.state_version = state_store.version
         return {
             "map": game_map_data,
-            "players": current_player_states,
-            "sprites": current_sprite_states,
-            "entities": current_entity_states,
+            "players": state["players"],
+            "sprites": state["sprites"],
+            "entities": state["entities"],
         }
 
 
-def broadcast_message(message: Dict[str, Any], exclude_client_id: Optional[str] = None):
-    """Sends a message to all connected clients, optionally excluding one."""
+class ClientHandler(ClientSession, socketserver.BaseRequestHandler):
+    """
+    Handles communication with a single client: this thread reads, a writer
+    thread sends. send_message() only queues (see outbound.py), so a client
+    that stops reading stalls its own writer, never the simulation thread;
+    its state updates coalesce, and once more than MAX_QUEUED_MESSAGES are
+    waiting it is disconnected.
+    """
+
+    def setup(self):
+        """Called when a new client connects."""
+        # A tick writes a state update and then a small correction: without this, Nagle's
+        # algorithm holds the second back until the client's (delayed) ACK of the first
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Connections start in JSON; the client may switch to a binary codec after the handshake
+        self.reader = MessageReader(JsonCodec()) # Buffer for partial messages
+        self.codec = JsonCodec() # Encoder for messages to this client
+        self.outbound = OutboundQueue()
+        # Guards outbound, codec and closing: our thread (protocol_ack), the simulation thread and the writer share them
+        self.outbound_ready = threading.Condition()
+        self.closing = False
+        self.writer = threading.Thread(target=self.write_loop, name=f"writer {self.client_address}", daemon=True)
+        self.writer.start()
+        post(self.open_session) # The simulation thread registers us and sends the handshake
+
+
+    def handle(self):
+        """Main loop to receive data from the client."""
+        try:
+            while not self.closing:
+                if not self.reader.recv_into(self.request): # Straight into the reader's buffer
+                    print(f"Client {self.client_id} disconnected (no data).")
+                    break
+
+                for message in self.reader.messages():
+                    if message.get("type") == "protocol_select":
+                        # Handled here: the bytes after it are already in the new codec
+                        self.select_protocol((message.get("payload") or {}).get("protocol", ""))
+                    else:
+                        post(self.process_message, message)
+
+        except ConnectionResetError:
+            print(f"Client {self.client_id} connection reset.")
+        except ProtocolError as e:
+            print(f"Dropping client {self.client_id}: {e}")
+        except Exception as e:
+            print(f"Error in handler for {self.client_id}: {e}")
+        finally:
+            pass # Cleanup is handled in finish()
+
+
+    def finish(self):
+        """Called when the client disconnects or handle() exits."""
+        self.close()
+        post(self.close_session) # After any of our messages still queued
+
+
+    def switch_send_codec(self, codec, ack: Dict[str, Any]):
+        with self.outbound_ready: # No broadcast may be queued between the ack and the switch
+            self.send_message(ack)
+            self.codec = codec
+
+    def send_message(self, message: Dict[str, Any], encoded: Optional[Dict[str, bytes]] = None):
+        """Queues a message for this client in its negotiated format (see OutboundQueue.put for `encoded`)."""
+        with self.outbound_ready:
+            if self.closing:
+                return
+            try:
+                self.outbound.put(message, self.codec, encoded)
+            except Exception as e:
+                print(f"Error encoding message for {self.client_id}: {e}")
+                return
+            if len(self.outbound) > MAX_QUEUED_MESSAGES:
+                print(f"Client {self.client_id} is not reading ({len(self.outbound)} messages queued), disconnecting.")
+                self.close()
+                return
+            self.outbound_ready.notify()
+
+    def close(self):
+        """Stops sending and receiving; handle() then returns and finish() cleans up."""
+        with self.outbound_ready:
+            if self.closing:
+                return
+            self.closing = True
+            self.outbound.clear()
+            self.outbound_ready.notify()
+        try:
+            self.request.shutdown(socket.SHUT_RDWR) # Wakes our reader and writer if they are blocked on the socket
+        except OSError:
+            pass # Already gone
+
+    def write_loop(self):
+        """Writer thread: drains the queue; while sendall() waits on a slow client, new state updates coalesce in it."""
+        try:
+            while True:
+                with self.outbound_ready:
+                    while not self.outbound and not self.closing:
+                        self.outbound_ready.wait()
+                    if self.closing:
+                        return
+                    data = b"".join([self.outbound.pop() for _ in range(len(self.outbound))]) # One write for the whole backlog
+                self.request.sendall(data)
+        except OSError as e:
+            if not self.closing:
+                print(f"Error sending message to {self.client_id}: {e}")
+            self.close()
+
+
+def spawn_state() -> Dict[str, Any]:
+    """A player's state on joining or respawning: at the start position, with full health."""
+    return {
+        "x": player_start_x, "y": player_start_y, "angle": player_start_angle,
+        "floor": 0, "health": config.PLAYER_HEALTH_START,
+        "is_shooting": False, "is_dead": False, "is_running": False
+    }
+
+
+def apply_damage(section: str, object_id: str, damage: int, attacker: Optional[str] = None):
+    """
+    Lowers a player's or sprite's health (server_state_lock held); at 0 it
+    is dead. Other clients see it in the next game_state_update, a player
+    hit also in its next player_state_correction.
+    """
+    state = section_states[section].get(object_id)
+    if state is None or state.get("is_dead") or "health" not in state:
+        return
+    health = max(0, state["health"] - damage)
+    state_store.update(section, object_id, {"health": health, "is_dead": health == 0})
+    if section == "players":
+        pending_damage.add(object_id)
+    if health == 0:
+        print(f"{section[:-1].capitalize()} {object_id} was killed by {attacker or 'the server'}.")
+
+
+def broadcast_message(message: Dict[str, Any], exclude_client_id: Optional[str] = None,
+                      recipient_filter: Optional[Callable[[str], bool]] = None):
+    """Sends a message to all connected clients, optionally excluding one or those `recipient_filter` rejects."""
     with server_state_lock:
         client_ids = list(connected_clients.keys()) # Copy keys for safe iteration
+    send_to_clients(message, [cid for cid in client_ids
+                              if cid != exclude_client_id and (recipient_filter is None or recipient_filter(cid))])
+
+
+def send_to_clients(message: Dict[str, Any], client_ids: List[str]):
+    """Sends one message to several clients, serializing it once per wire format in use."""
+    encoded: Dict[str, bytes] = {}
+    with server_state_lock:
+        handlers = [connected_clients.get(cid) for cid in client_ids] # Look up every handler under one lock
+    for handler in handlers:
+        if handler:
+            handler.send_message(message, encoded) # Handler method handles potential errors
+
+
+def build_tick_snapshots() -> Tuple[List[Tuple[Dict[str, Any], List[str]]], List[str]]:
+    """
+    Commits this tick's changes (a new store version) and builds the
+    game_state_update snapshots. Returns ([(message, recipient ids)], disconnected ids).
+    Each client is sent what changed since the version it has: normally one
+    tick's worth, more if its earlier snapshots weren't acknowledged (see
+    ClientSession.reliable_state). A client older than the store's change log
+    gets a game_state_full instead.
+    Without area-of-interest filtering a snapshot holds every changed field
+    (the client's own entry included; the client ignores it). With it, each
+    client gets: the full state of objects that entered its area, the changed
+    fields of objects already in it, and under "removed" the ids of objects
+    that left it. Clients whose snapshots come out identical share one message.
+    Clients whose input was simulated since the last tick also get a
+    player_state_correction with their authoritative position.
+    """
+    with server_state_lock:
+        version = state_store.commit()
+        disconnected = pending_disconnects[:]
+        pending_disconnects.clear()
+        viewers = list(connected_clients.items())
+        corrections = []
+        for cid in list(pending_corrections) + [cid for cid in pending_damage if cid not in pending_corrections]:
+            state = player_states.get(cid)
+            if state is None:
+                continue
+            payload: Dict[str, Any] = {}
+            if cid in pending_corrections:
+                payload.update(ack=pending_corrections[cid], x=state["x"], y=state["y"], angle=state["angle"],
+                               floor=state["floor"])
+            if cid in pending_damage:
+                payload.update(health=state["health"], is_dead=state["is_dead"]) # Sent as embedded JSON by binary codecs
+            corrections.append(({"type": "player_state_correction", "payload": payload}, [cid]))
+        pending_corrections.clear()
+        pending_damage.clear()
+        if hitscan_system:
+            hitscan_system.record_changes(state_store, version, time.monotonic())
+
+        if interest_manager:
+            for section, object_masks in state_store.changed_in(version).items():
+                for object_id in object_masks:
+                    interest_manager.track(section, object_id, section_states[section][object_id])
+
+        messages: List[Tuple[Dict[str, Any], List[str]]] = []
+        groups: Dict[tuple, Tuple[Dict[str, Any], List[str]]] = {}
+        for viewer, session in viewers:
+            delta = state_store.changes_since(session.state_version)
+            if delta is None:
+                print(f"Client {viewer} is too far behind for a delta, resending the full state.")
+                messages.append(({"type": "game_state_full", "payload": session.full_game_state_locked()}, [viewer]))
+                continue
+            if session.reliable_state:
+                since = session.state_version
+                session.state_version = version
+            else:
+                since = session.state_version # Advanced when the client acknowledges a snapshot
+            changes, store_removed = delta
+            # Players that leave the game are announced with player_disconnect instead
+            store_removed = {section: ids for section, ids in store_removed.items() if section != "players"}
+
+            if interest_manager is None:
+                key = (since,)
+                if key not in groups:
+                    payload = dict(changes)
+                    if store_removed:
+                        payload["removed"] = {section: sorted(ids) for section, ids in store_removed.items()}
+                    if not payload:
+                        session.state_version = version # Nothing it is missing
+                        continue
+                    groups[key] = ({"type": "game_state_update", "payload": payload}, [])
+                groups[key][1].append(viewer)
+                continue
+
+            viewer_state = player_states.get(viewer)
+            if viewer_state is None:
+                continue
+            own_changes = changes.get("players", {}).get(viewer, {})
+            moved = any(key in own_changes for key in ("x", "y", "floor"))
+            entered, left = interest_manager.update_viewer(viewer, viewer_state, moved, changes)
+            interest = interest_manager.interest_of(viewer)
+
+            payload: Dict[str, Any] = {}
+            sent = []
+            for section in SECTIONS:
+                records = {oid: section_states[section][oid].copy() for oid in entered[section]}
+                records.update((oid, fields) for oid, fields in changes.get(section, {}).items()
+                               if oid in interest[section] and oid not in records)
+                if records:
+                    payload[section] = records
+                    sent.extend((section, oid, oid in entered[section]) for oid in records)
+            removed = {section: sorted(ids | store_removed.get(section, set()))
+                       for section, ids in left.items() if ids or store_removed.get(section)}
+            if removed:
+                payload["removed"] = removed
+            if not payload:
+                session.state_version = version # Nothing it is missing (in its area)
+                continue
+            key = (since, frozenset(sent), tuple(sorted((section, tuple(ids)) for section, ids in removed.items())))
+            if key in groups:
+                groups[key][1].append(viewer)
+            else:
+                groups[key] = ({"type": "game_state_update", "payload": payload}, [viewer])
+    return messages + list(groups.values()) + corrections, disconnected
+
+
+def post(function: Callable[..., Any], *args):
+    """Runs function(*args) on the simulation thread (from a handler thread)."""
+    inbound.put((function, args))
+
+
+def apply_posted(function: Callable[..., Any], args: tuple):
+    try:
+        function(*args)
+    except Exception as e:
+        print(f"Error applying client message ({getattr(function, '__name__', function)}): {e}")
+
+
+def run_tick():
+    """One server tick: moves the NPCs, fans out this tick's snapshots, then announces players that left."""
+    if npc_system:
+        with server_state_lock:
+            npc_system.update(state_store, SERVER_TICK_RATE) # A fixed step: skipped ticks slow NPCs rather than make them jump
+    snapshots, disconnected = build_tick_snapshots()
+    for message, recipients in snapshots:
+        send_to_clients(message, recipients)
+    for client_id in disconnected:
+        broadcast_message({"type": "player_disconnect", "payload": {"client_id": client_id}})
+
+
+def run_tick_loop(stop_event: threading.Event, tick_rate: float = SERVER_TICK_RATE):
+    """
+    The simulation thread: applies posted client messages as they arrive and
+    runs run_tick every `tick_rate` seconds on a fixed schedule, until
+    `stop_event` is set.
+    """
+    next_tick = time.perf_counter()
+    while not stop_event.is_set():
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            try:
+                function, args = inbound.get(timeout=delay)
+            except queue.Empty:
+                continue
+            apply_posted(function, args)
+            continue
+        try:
+            run_tick()
+        except Exception as e:
+            print(f"Error in server tick: {e}")
+        next_tick += tick_rate
+        if next_tick < time.perf_counter() - tick_rate:
+            next_tick = time.perf_counter() # Fell more than a tick behind: skip the missed ticks instead of bursting
 
-    for cid in client_ids:
-        if cid != exclude_client_id:
-            handler = None
-            with server_state_lock:
-                 handler = connected_clients.get(cid) # Get handler safely
 
-            if handler:
-                handler.send_message(message) # Handler method handles potential errors
+def start_tick_loop(tick_rate: float = SERVER_TICK_RATE) -> Tuple[threading.Thread, threading.Event]:
+    """Starts the simulation thread (run_tick_loop) as a daemon. Set the returned event to stop it."""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_tick_loop, args=(stop_event, tick_rate), name="server-tick", daemon=True)
+    thread.start()
+    return thread, stop_event
 
 
 class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
@@ -266,15 +741,41 @@ class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
 
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Python Raycaster Test Server")
+    parser.add_argument("--mode", choices=["threaded", "asyncio", "udp"], default="threaded",
+                        help="threaded: one thread per client; asyncio: single event loop with per-client send queues; "
+                             "udp: datagrams with an unreliable state channel (clients need NETWORK_TRANSPORT = \"udp\")")
+    parser.add_argument("--host", default=SERVER_HOST, help=f"Address to listen on (default {SERVER_HOST}, from config)")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help=f"Port to listen on (default {SERVER_PORT})")
+    parser.add_argument("--loss", type=float, default=0.0, help="udp: fraction of outgoing datagrams to drop (simulated)")
+    parser.add_argument("--latency", type=float, default=0.0, help="udp: seconds to delay outgoing datagrams (simulated)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="udp: extra random delay of up to this many seconds")
+    args = parser.parse_args()
+
     print("Starting Python Raycaster Test Server...")
-    server = ThreadedTCPServer((SERVER_HOST, SERVER_PORT), ClientHandler)
-    print(f"Server listening on {SERVER_HOST}:{SERVER_PORT}")
+    if args.mode in ("asyncio", "udp"):
+        import sys
+        sys.modules.setdefault("server", sys.modules[__name__]) # async_server/udp_server share this module's state
+        if args.mode == "asyncio":
+            import async_server
+            async_server.main(args.host, args.port)
+        else:
+            import udp_server
+            from udp_transport import LinkConditions
+            udp_server.main(args.host, args.port, LinkConditions(args.loss, args.latency, args.jitter))
+        sys.exit(0)
+
+    server = ThreadedTCPServer((args.host, args.port), ClientHandler)
+    tick_thread, tick_stop = start_tick_loop()
+    print(f"Server listening on {args.host}:{args.port} ({1 / SERVER_TICK_RATE:.0f} ticks/s)")
 
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         print("\nServer shutting down by request...")
     finally:
+        tick_stop.set()
         server.shutdown()
         server.server_close()
-        print("Server shutdown complete.")
\ No newline at end of file
+        print("Server shutdown complete.")
@@ -0,0 +1,160 @@
+# software_renderer.py
+# Software rasterizer: composites walls, floor/ceiling and sprites into a
+# preallocated HxWx4 uint8 NumPy framebuffer. Cost scales with the number of
+# pixels touched instead of the number of raylib calls, and it needs no GPU
+# context unless the result is uploaded for display (see present()).
+import pyray as pr
+import numpy as np
+import config
+from typing import Optional
+from assets_manager import AssetsManager
+from raycast import RayBatch
+from zbuffer import ZBuffer
+
+SIDE_SHADE = 200 # Colour multiplier for X-side hits (same as the raylib wall path)
+
+class SoftwareRasterizer:
+    """Renders one frame into `self.framebuffer` (rows top to bottom, RGBA)."""
+    def __init__(self, assets_manager: AssetsManager, width: int = config.SCREEN_WIDTH, height: int = config.SCREEN_HEIGHT):
+        self.assets_manager = assets_manager
+        self.width = width
+        self.height = height
+        self.framebuffer = np.zeros((height, width, 4), dtype=np.uint8)
+        self._pixels32 = self.framebuffer.view(np.uint32)[..., 0] # Same memory, one uint32 per RGBA pixel
+        self._background = np.empty_like(self.framebuffer) # Floor/ceiling, built on first use
+        self._background_ready = False
+        self._rows = np.arange(height, dtype=np.float32)[:, None] + 0.5 # Pixel-centre Y of every row
+        self._columns = np.arange(width)
+
+        # Wall texture atlas: [lit textures..., shaded textures...], each TEXTURE_SIZE square,
+        # flattened to packed uint32 texels so a wall pixel is a single gather
+        self._wall_atlas: Optional[np.ndarray] = None
+        self._num_wall_textures = 0
+        self._wall_lookup: Optional[np.ndarray] = None # wall_id -> atlas index (0 = error texture)
+
+        self._texture: Optional[pr.Texture2D] = None # GPU upload target, created on first present()
+
+    def _build_wall_atlas(self):
+        """Stacks the wall textures (resized to TEXTURE_SIZE) so walls can be sampled with one gather."""
+        size = config.TEXTURE_SIZE
+        wall_ids = sorted(self.assets_manager.wall_pixels.keys())
+        images = [self.assets_manager.error_pixels] + [self.assets_manager.wall_pixels[w] for w in wall_ids]
+        lit = np.stack([self._resize_nearest(img, size, size) for img in images])
+        shaded = lit.copy()
+        shaded[..., :3] = (lit[..., :3].astype(np.uint16) * SIDE_SHADE // 255).astype(np.uint8)
+        self._num_wall_textures = len(images)
+        self._wall_atlas = np.ascontiguousarray(np.concatenate((lit, shaded))).view(np.uint32).ravel()
+
+        max_id = max(wall_ids, default=0)
+        self._wall_lookup = np.zeros(max_id + 1, dtype=np.intp)
+        self._wall_lookup[wall_ids] = np.arange(1, len(wall_ids) + 1)
+
+    @staticmethod
+    def _resize_nearest(pixels: np.ndarray, width: int, height: int) -> np.ndarray:
+        if pixels.shape[0] == height and pixels.shape[1] == width:
+            return pixels
+        ys = np.arange(height) * pixels.shape[0] // height
+        xs = np.arange(width) * pixels.shape[1] // width
+        return pixels[ys[:, None], xs[None, :]]
+
+    def draw_floor_ceiling(self):
+        """Fills the top half with the ceiling colour and the bottom half with the floor colour."""
+        if not self._background_ready:
+            half = self.height // 2
+            ceiling, floor = config.COLOR_CEILING, config.COLOR_FLOOR
+            self._background[:half] = (ceiling.r, ceiling.g, ceiling.b, ceiling.a)
+            self._background[half:] = (floor.r, floor.g, floor.b, floor.a)
+            self._background_ready = True
+        np.copyto(self.framebuffer, self._background)
+
+    def draw_walls(self, batch: RayBatch):
+        """Rasterizes every wall column of `batch` into the framebuffer."""
+        if self._wall_atlas is None:
+            self._build_wall_atlas()
+
+        hit = batch.hit
+        if not hit.any():
+            return
+
+        # Per-ray slice geometry (same as Renderer._draw_wall_columns)
+        z_dist = np.maximum(0.01, batch.dist)
+        line_height = np.where(z_dist > 0.01, (self.height / z_dist).astype(np.int64), self.height * 100)
+        line_height = np.maximum(line_height, 1)
+        draw_start = -line_height // 2 + self.height // 2
+        draw_end = draw_start + line_height
+
+        # Atlas index per ray; unknown wall IDs fall back to the error texture, X-sides use the shaded half
+        lookup = self._wall_lookup
+        known = batch.wall_id < lookup.shape[0]
+        atlas_index = np.where(known, lookup[np.where(known, batch.wall_id, 0)], 0)
+        atlas_index += np.where(batch.side == 1, self._num_wall_textures, 0)
+        texel_base = atlas_index * (config.TEXTURE_SIZE * config.TEXTURE_SIZE) + batch.tex_x
+
+        # Expand rays to screen columns (each ray covers RENDER_SCALE_FACTOR columns)
+        ray_of_column = np.minimum(self._columns // config.RENDER_SCALE_FACTOR, len(batch) - 1)
+        col_hit = hit[ray_of_column]
+        col_start = draw_start[ray_of_column]
+        col_end = draw_end[ray_of_column]
+        col_scale = (config.TEXTURE_SIZE / line_height[ray_of_column]).astype(np.float32)
+        col_base = texel_base[ray_of_column]
+
+        # Only rows that some wall slice covers need work
+        top = int(max(0, col_start[col_hit].min()))
+        bottom = int(min(self.height, col_end[col_hit].max()))
+        if bottom <= top:
+            return
+        rows = self._rows[top:bottom]
+        inside = (rows >= col_start) & (rows < col_end) & col_hit
+        ys, xs = np.nonzero(inside)
+        tex_y = ((rows[ys, 0] - col_start[xs]) * col_scale[xs]).astype(np.intp)
+        np.clip(tex_y, 0, config.TEXTURE_SIZE - 1, out=tex_y)
+        self._pixels32[top:bottom][ys, xs] = self._wall_atlas[col_base[xs] + tex_y * config.TEXTURE_SIZE]
+
+    def draw_sprite(self, pixels: np.ndarray, draw_start_x: int, draw_start_y: int,
+                    sprite_width: int, sprite_height: int, depth: float, z_buffer: ZBuffer) -> None:
+        """Alpha-blends a projected sprite, skipping columns where a wall is closer than `depth`."""
+        x0 = max(0, draw_start_x)
+        x1 = min(self.width, draw_start_x + sprite_width)
+        y0 = max(0, draw_start_y)
+        y1 = min(self.height, draw_start_y + sprite_height)
+        if x1 <= x0 or y1 <= y0 or sprite_width <= 0 or sprite_height <= 0:
+            return
+
+        columns = np.arange(x0, x1)[z_buffer.visible_mask(x0, x1, depth)] # Z-buffer check per column
+        if columns.size == 0:
+            return
+
+        tex_h, tex_w = pixels.shape[:2]
+        tex_x = np.minimum((columns - draw_start_x) * tex_w // sprite_width, tex_w - 1)
+        tex_y = np.minimum((np.arange(y0, y1) - draw_start_y) * tex_h // sprite_height, tex_h - 1)
+        src = pixels[tex_y[:, None], tex_x[None, :]]
+
+        dest = self.framebuffer[y0:y1, columns]
+        alpha = src[..., 3:4].astype(np.uint16)
+        blended = (src[..., :3] * alpha + dest[..., :3] * (255 - alpha)) // 255
+        dest[..., :3] = blended
+        self.framebuffer[y0:y1, columns] = dest
+
+    def fill_rect(self, x: int, y: int, width: int, height: int, color: pr.Color):
+        """Fills an axis-aligned rectangle (clipped to the framebuffer) with an opaque colour."""
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self.width, x + width), min(self.height, y + height)
+        if x1 > x0 and y1 > y0:
+            # pyray's named colours are plain tuples; config colours are pr.Color structs
+            rgba = tuple(color) if isinstance(color, tuple) else (color.r, color.g, color.b, color.a)
+            self.framebuffer[y0:y1, x0:x1] = rgba
+
+    def present(self):
+        """Uploads the framebuffer with a single update_texture and draws it full-screen (needs a window)."""
+        if self._texture is None:
+            image = pr.gen_image_color(self.width, self.height, pr.BLANK)
+            self._texture = pr.load_texture_from_image(image)
+            pr.unload_image(image)
+        pr.update_texture(self._texture, pr.ffi.cast("void *", pr.ffi.from_buffer(self.framebuffer)))
+        pr.draw_texture(self._texture, 0, 0, pr.WHITE)
+
+    def unload(self):
+        """Releases the upload texture."""
+        if self._texture is not None:
+            pr.unload_texture(self._texture)
+            self._texture = None
@@ -0,0 +1,129 @@
+# spatial_index.py
+# Grid-bucketed index of world objects (remote players, sprites, entities)
+# keyed on GameMap tiles, so the renderer only looks at objects near the view.
+import math
+from typing import Dict, List, Set, Tuple
+
+Cell = Tuple[int, int]
+
+OBJECT_RADIUS = 1.0 # Conservative half-width (tiles) of a drawn object, so wide sprites at the frustum edge are kept
+
+class SpatialIndex:
+    """
+    Objects are bucketed by the map tile they stand on.
+    Objects call update() whenever their position may have changed (see their
+    update_from_server); it only touches the buckets when the tile changes.
+    """
+    def __init__(self):
+        self._buckets: Dict[Cell, Set[object]] = {}
+        self._cells: Dict[int, Cell] = {} # id(obj) -> cell it is currently stored in
+
+    @staticmethod
+    def _cell_of(x: float, y: float) -> Cell:
+        return (int(math.floor(x)), int(math.floor(y)))
+
+    def update(self, obj):
+        """Inserts `obj` or moves it to the bucket of its current (x, y)."""
+        cell = self._cell_of(obj.x, obj.y)
+        old_cell = self._cells.get(id(obj))
+        if old_cell == cell:
+            return
+        if old_cell is not None:
+            self._discard(obj, old_cell)
+        self._buckets.setdefault(cell, set()).add(obj)
+        self._cells[id(obj)] = cell
+
+    def remove(self, obj):
+        """Removes `obj` from the index (no-op if it isn't indexed)."""
+        cell = self._cells.pop(id(obj), None)
+        if cell is not None:
+            self._discard(obj, cell)
+
+    def _discard(self, obj, cell: Cell):
+        bucket = self._buckets.get(cell)
+        if bucket is not None:
+            bucket.discard(obj)
+            if not bucket:
+                del self._buckets[cell] # Keep only occupied cells so bucket scans stay cheap
+
+    def clear(self):
+        self._buckets.clear()
+        self._cells.clear()
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def __contains__(self, obj) -> bool:
+        return id(obj) in self._cells
+
+    def query_radius(self, x: float, y: float, radius: float) -> List[object]:
+        """Returns the objects within `radius` tiles of (x, y)."""
+        min_cx, max_cx = int(math.floor(x - radius)), int(math.floor(x + radius))
+        min_cy, max_cy = int(math.floor(y - radius)), int(math.floor(y + radius))
+        # Walk whichever is smaller: the covered cells or the occupied buckets
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) <= len(self._buckets):
+            cells = ((cx, cy) for cx in range(min_cx, max_cx + 1) for cy in range(min_cy, max_cy + 1)
+                     if (cx, cy) in self._buckets)
+        else:
+            cells = (cell for cell in self._buckets
+                     if min_cx <= cell[0] <= max_cx and min_cy <= cell[1] <= max_cy)
+
+        radius_sq = radius * radius
+        found = []
+        for cell in cells:
+            for obj in self._buckets[cell]:
+                if (obj.x - x) ** 2 + (obj.y - y) ** 2 <= radius_sq:
+                    found.append(obj)
+        return found
+
+    def query_frustum(self, x: float, y: float,
+                      dir_x: float, dir_y: float,
+                      plane_x: float, plane_y: float,
+                      max_depth: float) -> List[object]:
+        """
+        Returns the objects in front of the camera at (x, y), inside the view
+        wedge spanned by dir +/- plane (see Player.get_plane_vector) and no
+        further than `max_depth` along the view direction.
+        """
+        plane_len = math.hypot(plane_x, plane_y)
+        if plane_len < 1e-9:
+            return []
+        # Unit vector along the camera plane, so lateral offsets are in tiles
+        side_x, side_y = plane_x / plane_len, plane_y / plane_len
+
+        # Cell test: a tile's centre may be up to half a diagonal away from an object standing in it
+        cell_margin = OBJECT_RADIUS + math.sqrt(0.5)
+        edge_slack = math.sqrt(1.0 + plane_len * plane_len) # Converts a perpendicular margin to a lateral one
+
+        def in_wedge(px: float, py: float, margin: float) -> bool:
+            rx, ry = px - x, py - y
+            depth = rx * dir_x + ry * dir_y
+            if depth < -margin or depth > max_depth + margin:
+                return False
+            lateral = rx * side_x + ry * side_y
+            return abs(lateral) <= depth * plane_len + margin * edge_slack
+
+        # Bounding box of the view wedge (camera plus the two far corners)
+        far_xs = (x + (dir_x - plane_x) * max_depth, x + (dir_x + plane_x) * max_depth)
+        far_ys = (y + (dir_y - plane_y) * max_depth, y + (dir_y + plane_y) * max_depth)
+        min_cx = int(math.floor(min(x, *far_xs) - cell_margin))
+        max_cx = int(math.floor(max(x, *far_xs) + cell_margin))
+        min_cy = int(math.floor(min(y, *far_ys) - cell_margin))
+        max_cy = int(math.floor(max(y, *far_ys) + cell_margin))
+
+        # Walk whichever is smaller: the wedge's cells or the occupied buckets
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) <= len(self._buckets):
+            cells = ((cx, cy) for cx in range(min_cx, max_cx + 1) for cy in range(min_cy, max_cy + 1)
+                     if (cx, cy) in self._buckets)
+        else:
+            cells = (cell for cell in self._buckets
+                     if min_cx <= cell[0] <= max_cx and min_cy <= cell[1] <= max_cy)
+
+        found = []
+        for cx, cy in cells:
+            if not in_wedge(cx + 0.5, cy + 0.5, cell_margin):
+                continue
+            for obj in self._buckets[(cx, cy)]:
+                if in_wedge(obj.x, obj.y, OBJECT_RADIUS):
+                    found.append(obj)
+        return found
@@ -3,12 +3,14 @@
 import math
 from typing import Optional, Tuple
 import config
+from spatial_index import SpatialIndex
 
 class Sprite:
-    def __init__(self, sprite_id: str, data: dict):
+    def __init__(self, sprite_id: str, data: dict, spatial_index: Optional[SpatialIndex] = None):
         self.id = sprite_id
         self.x: float = 0.0
         self.y: float = 0.0
+        self.floor: int = 0 # Map floor the object is on
         self.texture_name: str = "Unknown" # e.g., "EnemyTypeA", "Barrel"
         self.texture_index: int = 0 # Specific frame/variant
         self.health: Optional[int] = None # If applicable
@@ -17,12 +19,14 @@ class Sprite:
         self.scale: float = config.SPRITE_SCALE
         self.last_update_time: float = 0.0
 
+        self.spatial_index = spatial_index # Kept up to date with our position, if given
         self.update_from_server(data)
 
     def update_from_server(self, data: dict):
         """Updates sprite state from server data."""
         self.x = data.get("x", self.x)
         self.y = data.get("y", self.y)
+        self.floor = data.get("floor", self.floor)
         self.texture_name = data.get("texture_name", self.texture_name)
         self.texture_index = data.get("texture_index", self.texture_index) # Server decides animation frame etc.
         self.health = data.get("health", self.health)
@@ -30,6 +34,8 @@ class Sprite:
         self.is_dead = data.get("is_dead", self.is_dead)
         self.scale = data.get("scale", self.scale)
         # self.last_update_time = pr.get_time()
+        if self.spatial_index is not None:
+            self.spatial_index.update(self)
 
     def get_pos_tuple(self) -> Tuple[float, float]:
         return (self.x, self.y)
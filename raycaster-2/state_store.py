@@ -0,0 +1,168 @@
+# state_store.py
+# Versioned game state for the server. Every change goes through the store,
+# which marks the changed fields of the object in a dirty mask; commit() (once
+# per server tick) closes the version and logs what changed in it. Any client
+# can then be sent exactly the fields that changed since the version it has,
+# whether it is one tick behind (the usual case) or several (e.g. a UDP client
+# whose state datagrams were lost). Only a client further behind than the log
+# reaches needs a full snapshot again.
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+Records = Dict[str, Dict[str, Dict[str, Any]]] # section -> object id -> fields
+Removed = Dict[str, Set[str]] # section -> object ids
+
+class _Entry:
+    """Bookkeeping for one object: the version it last changed in and the fields changed since the last commit."""
+    __slots__ = ("version", "dirty")
+
+    def __init__(self):
+        self.version = 0
+        self.dirty = 0 # Bit mask, see StateStore.field_bit
+
+
+class StateStore:
+    """
+    Objects (plain dicts of fields) in sections, e.g. "players". `states`
+    gives read access (section -> id -> state dict); don't modify those dicts
+    directly, or the change won't be sent. Not thread-safe: the server calls
+    it with server_state_lock held.
+    """
+    def __init__(self, sections: Iterable[str], history: int = 64):
+        self.sections = tuple(sections)
+        self.states: Records = {section: {} for section in self.sections}
+        self.version = 0 # Last committed version
+        self.history = history # Versions kept in the change log
+        self._entries: Dict[str, Dict[str, _Entry]] = {section: {} for section in self.sections}
+        self._dirty: List[Tuple[str, str, _Entry]] = [] # Entries changed since the last commit
+        self._removed: Removed = {section: set() for section in self.sections} # Removed since the last commit
+        # (version, {section: {id: dirty mask}}, removed ids) per committed version, oldest first
+        self._log: Deque[Tuple[int, Dict[str, Dict[str, int]], Removed]] = deque()
+        self._field_bits: Dict[str, int] = {}
+        self._field_names: List[str] = []
+        self._mask_fields: Dict[int, Tuple[str, ...]] = {}
+        self._delta_cache: Dict[int, Tuple[Records, Removed]] = {} # since -> changes_since(since), for the current version
+
+    # --- Changes ---
+    def field_bit(self, name: str) -> int:
+        bit = self._field_bits.get(name)
+        if bit is None:
+            bit = self._field_bits[name] = 1 << len(self._field_names)
+            self._field_names.append(name)
+        return bit
+
+    def _mark(self, section: str, object_id: str, fields: Iterable[str]):
+        entry = self._entries[section][object_id]
+        if not entry.dirty:
+            self._dirty.append((section, object_id, entry))
+        for name in fields:
+            entry.dirty |= self.field_bit(name)
+
+    def add(self, section: str, object_id: str, state: Dict[str, Any]):
+        """Adds (or replaces) an object; all its fields count as changed."""
+        self.states[section][object_id] = state
+        if object_id not in self._entries[section]:
+            self._entries[section][object_id] = _Entry()
+        self._removed[section].discard(object_id)
+        self._mark(section, object_id, state)
+
+    def update(self, section: str, object_id: str, fields: Dict[str, Any]) -> bool:
+        """
+        Sets fields of an object and marks them changed, even if a value is
+        the same (so a field can be deliberately sent again). False if there
+        is no such object.
+        """
+        state = self.states[section].get(object_id)
+        if state is None:
+            return False
+        state.update(fields)
+        self._mark(section, object_id, fields)
+        return True
+
+    def remove(self, section: str, object_id: str):
+        if self.states[section].pop(object_id, None) is not None:
+            entry = self._entries[section].pop(object_id)
+            if entry.dirty:
+                self._dirty = [item for item in self._dirty if item[2] is not entry]
+            self._removed[section].add(object_id)
+
+    def commit(self) -> int:
+        """Closes the current version (call once per tick) and returns its number."""
+        self.version += 1
+        changed: Dict[str, Dict[str, int]] = {section: {} for section in self.sections}
+        for section, object_id, entry in self._dirty:
+            changed[section][object_id] = entry.dirty
+            entry.version = self.version
+            entry.dirty = 0
+        self._log.append((self.version, changed, self._removed))
+        if len(self._log) > self.history:
+            self._log.popleft()
+        self._dirty = []
+        self._removed = {section: set() for section in self.sections}
+        self._delta_cache.clear()
+        return self.version
+
+    # --- Reading ---
+    def changed_in(self, version: int) -> Dict[str, Dict[str, int]]:
+        """Ids (with dirty masks) changed in one committed version still in the log; empty if none."""
+        if self._log and self._log[0][0] <= version <= self.version:
+            return self._log[version - self._log[0][0]][1]
+        return {section: {} for section in self.sections}
+
+    def version_of(self, section: str, object_id: str) -> int:
+        """Version in which an object last changed (0 if unknown)."""
+        entry = self._entries[section].get(object_id)
+        return entry.version if entry is not None else 0
+
+    def changes_since(self, since: int) -> Optional[Tuple[Records, Removed]]:
+        """
+        What a client that has version `since` is missing, as (records, removed):
+        the current value of every field changed after `since`, and the ids
+        removed after it (and not added again). None if `since` is older than
+        the change log, i.e. the client needs a full snapshot.
+        The result is shared between callers; don't modify it.
+        """
+        cached = self._delta_cache.get(since)
+        if cached is not None:
+            return cached
+        if since < self.version and (not self._log or since < self._log[0][0] - 1):
+            return None
+        masks: Dict[str, Dict[str, int]] = {section: {} for section in self.sections}
+        removed: Removed = {section: set() for section in self.sections}
+        for version, changed, removed_ids in reversed(self._log):
+            if version <= since:
+                break
+            for section, object_masks in changed.items():
+                section_masks = masks[section]
+                for object_id, mask in object_masks.items():
+                    section_masks[object_id] = section_masks.get(object_id, 0) | mask
+            for section, object_ids in removed_ids.items():
+                removed[section].update(object_ids)
+
+        records: Records = {}
+        for section, section_masks in masks.items():
+            states = self.states[section]
+            section_records = {}
+            for object_id, mask in section_masks.items():
+                state = states.get(object_id)
+                if state is not None:
+                    section_records[object_id] = {name: state[name] for name in self._fields_of(mask) if name in state}
+            if section_records:
+                records[section] = section_records
+            removed[section].difference_update(states) # Removed and added again: sent as a record instead
+        removed = {section: object_ids for section, object_ids in removed.items() if object_ids}
+        self._delta_cache[since] = (records, removed)
+        return records, removed
+
+    def _fields_of(self, mask: int) -> Tuple[str, ...]:
+        fields = self._mask_fields.get(mask)
+        if fields is None:
+            fields = self._mask_fields[mask] = tuple(name for index, name in enumerate(self._field_names) if mask >> index & 1)
+        return fields
+
+    def snapshot(self, only: Optional[Dict[str, Set[str]]] = None) -> Records:
+        """Copies of every object's state (only the ids in `only`, per section, if given)."""
+        if only is None:
+            return {section: {oid: dict(state) for oid, state in states.items()} for section, states in self.states.items()}
+        return {section: {oid: dict(states[oid]) for oid in only.get(section, ()) if oid in states}
+                for section, states in self.states.items()}
@@ -0,0 +1,208 @@
+# udp_server.py
+# UDP variant of the game server: one socket, one thread, one datagram per
+# message (see udp_transport.py). Run with: python server.py --mode udp
+# [--loss 0.1 --latency 0.05 --jitter 0.02] to also simulate a bad network
+# on the server's outgoing datagrams.
+# Game state, the handshake, message handling and the tick are shared with
+# server.py; a client is identified by its address and opens its session
+# with a reliable "hello".
+import select
+import socket
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import config
+import server
+from interest import SECTIONS
+from protocol import JsonCodec, MessageReader
+from udp_transport import DatagramLink, LinkConditions, UNRELIABLE_MESSAGE_TYPES, UdpPeer
+
+
+class UdpClientSession(server.ClientSession):
+    """
+    A client reached over UDP. Per-tick state goes out on the unreliable
+    channel, where a lost datagram is simply superseded by the next one: each
+    holds everything changed since the last state version the client
+    acknowledged, so the next one to arrive makes up for any that were lost.
+    Objects entering or leaving the client's view are sent reliably, since
+    an object that never changes again would not be sent again; until the
+    client acknowledges an object's entry, its changes follow on the reliable
+    channel too, so they can't overtake (and be overwritten by) the entry.
+    """
+    reliable_state = False
+
+    def __init__(self, link: DatagramLink, address):
+        self.client_address = address
+        self.peer = UdpPeer(link, address)
+        # Every datagram names its own codec, so the reader only records the
+        # selected one (select_protocol sets it); sending uses `codec`
+        self.reader = MessageReader(JsonCodec())
+        self.codec = JsonCodec()
+        # Objects the client has been sent, with the reliable seq of the message that introduced them
+        self.known: Dict[str, Dict[str, int]] = {section: {} for section in SECTIONS}
+        self.sent_versions: Deque[Tuple[int, int]] = deque() # (datagram stamp, state version) of unacknowledged state datagrams
+        self.closed = False
+
+    def send_message(self, message: Dict[str, Any], encoded: Optional[Dict[str, bytes]] = None):
+        if self.closed:
+            return
+        msg_type = message.get("type")
+        payload = message.get("payload") or {}
+        try:
+            if msg_type == "game_state_update":
+                self._send_state_update(payload)
+                return
+            if msg_type == "player_disconnect":
+                self.known["players"].pop(payload.get("client_id"), None)
+            self.peer.send(message, msg_type not in UNRELIABLE_MESSAGE_TYPES, self.codec, encoded)
+            if msg_type == "game_state_full":
+                seq = self.peer.next_seq - 1
+                self.known = {section: dict.fromkeys(payload.get(section, {}), seq) for section in SECTIONS}
+        except Exception as e:
+            print(f"Error sending to {self.client_id}: {e}")
+
+    def _send_state_update(self, payload: Dict[str, Any]):
+        """Splits a tick's state update into its reliable (enter/leave) and unreliable (changes) parts."""
+        reliable: Dict[str, Any] = {}
+        unreliable: Dict[str, Any] = {}
+        introduced = []
+        unacked = self.peer.unacked
+        for section in SECTIONS:
+            known = self.known[section]
+            for object_id, fields in payload.get(section, {}).items():
+                if object_id not in known:
+                    # Entered (a full record): must arrive, even if the object never changes again
+                    reliable.setdefault(section, {})[object_id] = fields
+                    introduced.append((section, object_id))
+                elif known[object_id] in unacked:
+                    reliable.setdefault(section, {})[object_id] = fields # Entry still in flight: stay behind it
+                else:
+                    unreliable.setdefault(section, {})[object_id] = fields
+        for section, object_ids in payload.get("removed", {}).items():
+            reliable.setdefault("removed", {})[section] = object_ids
+            for object_id in object_ids:
+                self.known[section].pop(object_id, None)
+        if reliable and self.peer.send({"type": "game_state_update", "payload": reliable}, True, self.codec):
+            for section, object_id in introduced:
+                self.known[section][object_id] = self.peer.next_seq - 1
+        # Single-threaded: the tick that built this snapshot committed the store's current version
+        if not unreliable:
+            self.state_version = server.state_store.version # All of it is on the reliable channel, in order
+        elif self.peer.send({"type": "game_state_update", "payload": unreliable}, False, self.codec):
+            self.sent_versions.append((self.peer.stamp, server.state_store.version))
+
+    def acknowledge_state(self):
+        """Advances state_version to the newest snapshot the client has acknowledged receiving."""
+        acked = self.peer.acked_unreliable
+        sent_versions = self.sent_versions
+        while sent_versions and sent_versions[0][0] <= acked:
+            stamp, version = sent_versions.popleft()
+            if stamp == acked:
+                self.state_version = max(self.state_version, version)
+
+    def switch_send_codec(self, codec, ack: Dict[str, Any]):
+        # Single-threaded: nothing can be sent between the ack and the switch
+        self.send_message(ack)
+        self.codec = codec
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.close_session()
+
+
+def receive_datagrams(sock: socket.socket, link: DatagramLink, sessions: Dict[Any, UdpClientSession]):
+    """Reads every waiting datagram and handles the messages they deliver."""
+    while True:
+        try:
+            datagram, address = sock.recvfrom(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            # e.g. ICMP port unreachable from a client that went away; its session times out
+            print(f"UDP receive error: {e}")
+            continue
+        session = sessions.get(address)
+        is_new = session is None
+        if is_new:
+            session = UdpClientSession(link, address)
+        messages = session.peer.receive(datagram)
+        if not is_new:
+            session.acknowledge_state()
+        for message, _reliable, _stamp in messages:
+            msg_type = message.get("type")
+            if msg_type == "hello":
+                if is_new:
+                    sessions[address] = session
+                    session.open_session()
+                    is_new = False
+                continue
+            if is_new:
+                continue # Not connected (e.g. a late datagram after a timeout): ignore
+            if msg_type == "disconnect":
+                print(f"Client {session.client_id} disconnected.")
+                session.close()
+                del sessions[address]
+                break
+            try:
+                session.process_message(message)
+            except Exception as e:
+                print(f"Error processing message from {session.client_id}: {e}")
+
+
+def serve(host: str, port: int, tick_rate: float = server.SERVER_TICK_RATE, conditions: Optional[LinkConditions] = None):
+    """Runs the server until interrupted: datagrams, ticks, resends and timeouts on one thread."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.setblocking(False)
+    link = DatagramLink(sock, conditions)
+    sessions: Dict[Any, UdpClientSession] = {}
+    print(f"Server listening on {host}:{port} (UDP, {1 / tick_rate:.0f} ticks/s)")
+    if link.conditions is not None:
+        print(f"Simulating {link.conditions.loss:.0%} loss, {link.conditions.latency * 1000:.0f} ms latency, "
+              f"{link.conditions.jitter * 1000:.0f} ms jitter on outgoing datagrams")
+
+    next_tick = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            wake = min(next_tick, now + config.UDP_RESEND_INTERVAL)
+            due = link.next_due()
+            if due is not None:
+                wake = min(wake, due)
+            readable, _, _ = select.select([sock], [], [], max(0.0, wake - now))
+            if readable:
+                receive_datagrams(sock, link, sessions)
+
+            now = time.monotonic()
+            if now >= next_tick:
+                try:
+                    server.run_tick()
+                except Exception as e:
+                    print(f"Error in server tick: {e}")
+                next_tick += tick_rate
+                if next_tick < now - tick_rate:
+                    next_tick = now # Fell more than a tick behind: skip the missed ticks instead of bursting
+
+            for address, session in list(sessions.items()):
+                if session.peer.timed_out(now):
+                    print(f"Client {session.client_id} timed out.")
+                    session.close()
+                    del sessions[address]
+                else:
+                    session.peer.poll(now)
+            link.flush(now)
+    finally:
+        for session in sessions.values():
+            session.close()
+        sock.close()
+
+
+def main(host: str = server.SERVER_HOST, port: int = server.SERVER_PORT, conditions: Optional[LinkConditions] = None):
+    try:
+        serve(host, port, conditions=conditions)
+    except KeyboardInterrupt:
+        print("\nServer shutting down by request...")
+    print("Server shutdown complete.")
@@ -0,0 +1,214 @@
+# udp_transport.py
+# Datagram transport shared by UdpNetworkClient (network.py) and the UDP
+# server (udp_server.py). Each datagram carries one message, encoded with
+# either codec (see protocol.py), behind a small header:
+#   u8 channel, u8 codec, u32 stamp, u32 reliable seq, u32 ack, u32 state ack
+# - Unreliable channel: per-tick state. Every datagram has a higher stamp
+#   than the last; the receiver drops any that is older than one it already
+#   accepted (newest wins), so a lost or late packet never holds up newer ones.
+#   The state ack field reports the newest stamp accepted, which the server
+#   maps back to the state version that datagram brought the client to.
+# - Reliable channel: everything else (handshake, map, corrections, joins
+#   and leaves). Numbered, acknowledged cumulatively (the ack field of every
+#   datagram), resent until acknowledged and delivered in order.
+# LinkConditions/DatagramLink can drop and delay outgoing datagrams, so
+# loss and latency can be tried out on one machine.
+import random
+import socket
+import struct
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+from protocol import BinaryCodec, JsonCodec, ProtocolError, make_codec
+
+_HEADER = struct.Struct("!BBIIII")
+
+CHANNEL_UNRELIABLE = 0
+CHANNEL_RELIABLE = 1
+CHANNEL_ACK = 2 # Header only: acknowledgement / keepalive
+
+CODEC_NAMES = (JsonCodec.name, BinaryCodec.name) # Index sent in every header: a datagram always says how to decode it
+_DECODERS = [make_codec(name) for name in CODEC_NAMES]
+
+# Sent unreliably (newest wins); every other message type is reliable
+UNRELIABLE_MESSAGE_TYPES = {"player_update", "player_input", "game_state_update"}
+
+MAX_OUT_OF_ORDER = 1024 # Reliable messages held while an earlier one is missing
+
+class LinkConditions:
+    """Simulated network conditions for outgoing datagrams (all zero: a perfect link)."""
+    def __init__(self, loss: float = 0.0, latency: float = 0.0, jitter: float = 0.0, seed: Optional[int] = None):
+        self.loss = loss       # Probability that a datagram is dropped
+        self.latency = latency # Seconds every datagram is delayed
+        self.jitter = jitter   # Extra random delay, up to this many seconds (may reorder datagrams)
+        self.rng = random.Random(seed)
+
+    def is_perfect(self) -> bool:
+        return not (self.loss or self.latency or self.jitter)
+
+    @classmethod
+    def from_config(cls) -> "LinkConditions":
+        return cls(getattr(config, "UDP_SIM_LOSS", 0.0), getattr(config, "UDP_SIM_LATENCY", 0.0),
+                   getattr(config, "UDP_SIM_JITTER", 0.0))
+
+
+class DatagramLink:
+    """Sends datagrams on `sock`, through `conditions` if given (call flush() regularly to release delayed ones)."""
+    def __init__(self, sock: socket.socket, conditions: Optional[LinkConditions] = None):
+        self.sock = sock
+        self.conditions = conditions if conditions is not None and not conditions.is_perfect() else None
+        self.delayed: List[Tuple[float, int, bytes, Any]] = [] # (due time, order, datagram, address), kept sorted
+        self.order = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def send(self, datagram: bytes, address):
+        conditions = self.conditions
+        if conditions is None:
+            self._send_now(datagram, address)
+            return
+        if conditions.rng.random() < conditions.loss:
+            self.dropped += 1
+            return
+        due = time.monotonic() + conditions.latency + conditions.rng.uniform(0.0, conditions.jitter)
+        self.order += 1
+        self.delayed.append((due, self.order, datagram, address))
+        self.delayed.sort()
+
+    def flush(self, now: Optional[float] = None):
+        """Sends the delayed datagrams that are due."""
+        if not self.delayed:
+            return
+        now = time.monotonic() if now is None else now
+        due = 0
+        while due < len(self.delayed) and self.delayed[due][0] <= now:
+            self._send_now(self.delayed[due][2], self.delayed[due][3])
+            due += 1
+        del self.delayed[:due]
+
+    def next_due(self) -> Optional[float]:
+        return self.delayed[0][0] if self.delayed else None
+
+    def _send_now(self, datagram: bytes, address):
+        try:
+            self.sock.sendto(datagram, address)
+            self.sent += 1
+        except OSError as e:
+            print(f"UDP send error to {address}: {e}")
+
+
+class UdpPeer:
+    """
+    Both channels to one remote address. send() frames and sends a message,
+    receive() turns a datagram into the messages it delivers, and poll()
+    must be called regularly to resend unacknowledged reliable messages and
+    to send acknowledgements and keepalives.
+    """
+    def __init__(self, link: DatagramLink, address):
+        self.link = link
+        self.address = address
+        now = time.monotonic()
+        self.stamp = 0 # Datagrams sent so far (the stamp of the last one)
+        self.next_seq = 1
+        self.unacked: Dict[int, List[Any]] = {} # seq -> [codec index, stamp, body, last sent]
+        self.received_seq = 0 # Every reliable message up to this one has been delivered
+        self.out_of_order: Dict[int, Tuple[int, int, bytes]] = {} # seq -> (codec index, stamp, body)
+        self.newest_unreliable = 0 # Stamp of the newest unreliable datagram accepted
+        self.acked_unreliable = 0 # Stamp of the newest of ours the other side has accepted
+        self.ack_due = False
+        self.last_send = now
+        self.last_receive = now
+        self.resent = 0
+        self.stale = 0 # Unreliable datagrams dropped for arriving after a newer one
+
+    def send(self, message: Dict[str, Any], reliable: bool, codec, encoded: Optional[Dict[str, bytes]] = None) -> bool:
+        """Sends one message with `codec`; `encoded` is a per-codec cache shared by recipients (see ClientHandler)."""
+        body = encoded.get(codec.name) if encoded is not None else None
+        if body is None:
+            body = codec.encode(message)
+            if encoded is not None:
+                encoded[codec.name] = body
+        if len(body) + _HEADER.size > config.UDP_MAX_DATAGRAM:
+            print(f"Warning: {message.get('type')} message of {len(body)} bytes is too large for a datagram, dropped.")
+            return False
+        codec_index = CODEC_NAMES.index(codec.name)
+        self.stamp += 1
+        if reliable:
+            seq = self.next_seq
+            self.next_seq += 1
+            self.unacked[seq] = [codec_index, self.stamp, body, time.monotonic()]
+            self._send(CHANNEL_RELIABLE, codec_index, self.stamp, seq, body)
+        else:
+            self._send(CHANNEL_UNRELIABLE, codec_index, self.stamp, 0, body)
+        return True
+
+    def _send(self, channel: int, codec_index: int, stamp: int, seq: int, body: bytes):
+        self.link.send(_HEADER.pack(channel, codec_index, stamp, seq, self.received_seq, self.newest_unreliable) + body,
+                       self.address)
+        self.ack_due = False # Every datagram carries our ack
+        self.last_send = time.monotonic()
+
+    def receive(self, datagram: bytes) -> List[Tuple[Dict[str, Any], bool, int]]:
+        """Returns the (message, reliable, stamp) delivered by one datagram (possibly several, or none)."""
+        if len(datagram) < _HEADER.size:
+            return []
+        channel, codec_index, stamp, seq, ack, unreliable_ack = _HEADER.unpack_from(datagram)
+        self.last_receive = time.monotonic()
+        self.acked_unreliable = max(self.acked_unreliable, unreliable_ack)
+        for acked in [s for s in self.unacked if s <= ack]:
+            del self.unacked[acked]
+        body = datagram[_HEADER.size:]
+
+        if channel == CHANNEL_UNRELIABLE:
+            if stamp <= self.newest_unreliable:
+                self.stale += 1
+                return [] # Older than state we already have
+            self.newest_unreliable = stamp
+            message = self._decode(codec_index, body)
+            return [(message, False, stamp)] if message is not None else []
+
+        if channel != CHANNEL_RELIABLE:
+            return []
+        self.ack_due = True # Acknowledge even duplicates: our previous ack may have been lost
+        if seq <= self.received_seq:
+            return []
+        if seq > self.received_seq + 1:
+            if seq - self.received_seq <= MAX_OUT_OF_ORDER:
+                self.out_of_order[seq] = (codec_index, stamp, body)
+            return []
+        delivered = []
+        pending: Optional[Tuple[int, int, bytes]] = (codec_index, stamp, body)
+        while pending is not None:
+            self.received_seq += 1
+            message = self._decode(pending[0], pending[2])
+            if message is not None:
+                delivered.append((message, True, pending[1]))
+            pending = self.out_of_order.pop(self.received_seq + 1, None)
+        return delivered
+
+    def _decode(self, codec_index: int, body: bytes) -> Optional[Dict[str, Any]]:
+        if codec_index >= len(CODEC_NAMES):
+            print(f"Warning: Datagram from {self.address} uses unknown codec {codec_index}.")
+            return None
+        try:
+            message, _ = _DECODERS[codec_index].decode(body, 0, len(body))
+        except ProtocolError as e:
+            print(f"Warning: Bad datagram from {self.address}: {e}")
+            return None
+        return message
+
+    def poll(self, now: Optional[float] = None):
+        """Resends overdue reliable messages, then acknowledges or keeps the link alive if nothing else went out."""
+        now = time.monotonic() if now is None else now
+        for seq, entry in self.unacked.items():
+            if now - entry[3] >= config.UDP_RESEND_INTERVAL:
+                entry[3] = now
+                self.resent += 1
+                self._send(CHANNEL_RELIABLE, entry[0], entry[1], seq, entry[2])
+        if self.ack_due or now - self.last_send >= config.UDP_KEEPALIVE_INTERVAL:
+            self._send(CHANNEL_ACK, 0, 0, 0, b"")
+
+    def timed_out(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        return now - self.last_receive > config.UDP_TIMEOUT
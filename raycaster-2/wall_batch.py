@@ -0,0 +1,144 @@
+# wall_batch.py
+# Batched wall-slice submission: all column quads of a frame go into
+# preallocated vertex buffers (one dynamic mesh per wall texture) and are
+# drawn with a handful of raylib calls instead of one draw_texture_pro per ray.
+import pyray as pr
+import numpy as np
+import config
+from typing import Dict, Optional
+from raycast import RayBatch
+
+# Vertex buffer slots used by raylib's UploadMesh/UpdateMeshBuffer
+_BUFFER_POSITION = pr.RL_DEFAULT_SHADER_ATTRIB_LOCATION_POSITION
+_BUFFER_TEXCOORD = pr.RL_DEFAULT_SHADER_ATTRIB_LOCATION_TEXCOORD
+_BUFFER_COLOR = pr.RL_DEFAULT_SHADER_ATTRIB_LOCATION_COLOR
+
+SIDE_SHADE = 200 # Colour multiplier for X-side hits (same as the per-column path)
+
+class _TextureMesh:
+    """CPU buffers plus the uploaded GPU mesh for the columns of one wall texture."""
+    def __init__(self, max_columns: int):
+        self.max_columns = max_columns
+        # 4 vertices per column quad; buffers are owned by NumPy and shared with the mesh
+        self.vertices = np.zeros((max_columns, 4, 3), dtype=np.float32)
+        self.texcoords = np.zeros((max_columns, 4, 2), dtype=np.float32)
+        self.colors = np.full((max_columns, 4, 4), 255, dtype=np.uint8)
+        quad = np.array([0, 1, 2, 0, 2, 3], dtype=np.uint16)
+        self.indices = (np.arange(max_columns, dtype=np.uint16)[:, None] * 4 + quad).ravel()
+
+        self.mesh = pr.Mesh()
+        self.mesh.vertexCount = max_columns * 4
+        self.mesh.triangleCount = max_columns * 2
+        self.mesh.vertices = pr.ffi.cast("float *", pr.ffi.from_buffer(self.vertices))
+        self.mesh.texcoords = pr.ffi.cast("float *", pr.ffi.from_buffer(self.texcoords))
+        self.mesh.colors = pr.ffi.cast("unsigned char *", pr.ffi.from_buffer(self.colors))
+        self.mesh.indices = pr.ffi.cast("unsigned short *", pr.ffi.from_buffer(self.indices))
+        pr.upload_mesh(self.mesh, True) # Dynamic: vertex data is rewritten every frame
+
+    def update(self, count: int):
+        """Uploads the first `count` quads and limits drawing to them."""
+        self._update_buffer(_BUFFER_POSITION, self.vertices, count)
+        self._update_buffer(_BUFFER_TEXCOORD, self.texcoords, count)
+        self._update_buffer(_BUFFER_COLOR, self.colors, count)
+        self.mesh.triangleCount = count * 2
+
+    def _update_buffer(self, index: int, data: np.ndarray, count: int):
+        size = count * data[0].nbytes
+        pr.update_mesh_buffer(self.mesh, index, pr.ffi.cast("void *", pr.ffi.from_buffer(data)), size, 0)
+
+    def unload(self):
+        # The CPU-side arrays belong to NumPy, so detach them before raylib frees the mesh
+        self.mesh.vertices = pr.ffi.NULL
+        self.mesh.texcoords = pr.ffi.NULL
+        self.mesh.colors = pr.ffi.NULL
+        self.mesh.indices = pr.ffi.NULL
+        pr.unload_mesh(self.mesh)
+
+
+class WallBatch:
+    """Builds and submits every wall column of a frame, grouped per wall texture."""
+    def __init__(self, max_columns: int = config.NUM_RAYS):
+        self.max_columns = max_columns
+        self._meshes: Dict[int, _TextureMesh] = {} # Created lazily per wall ID
+        self._material: Optional[pr.Material] = None
+        self._default_texture: Optional[pr.Texture2D] = None
+        self._transform = pr.matrix_identity()
+
+    def _get_mesh(self, wall_id: int) -> _TextureMesh:
+        texture_mesh = self._meshes.get(wall_id)
+        if texture_mesh is None:
+            texture_mesh = _TextureMesh(self.max_columns)
+            self._meshes[wall_id] = texture_mesh
+        return texture_mesh
+
+    def _get_material(self) -> pr.Material:
+        if self._material is None:
+            self._material = pr.load_material_default()
+            default = self._material.maps[pr.MATERIAL_MAP_ALBEDO].texture # Copy it; the map slot gets overwritten per draw
+            self._default_texture = pr.Texture(default.id, default.width, default.height, default.mipmaps, default.format)
+        return self._material
+
+    def draw(self, batch: RayBatch, assets_manager):
+        """Draws all wall slices in `batch` with one mesh draw per wall texture."""
+        columns = np.flatnonzero(batch.hit)
+        if columns.size == 0:
+            return
+
+        # Same slice geometry as the per-column path in Renderer.draw_walls
+        z_dist = np.maximum(0.01, batch.dist[columns])
+        line_height = np.where(z_dist > 0.01, (config.SCREEN_HEIGHT / z_dist).astype(np.int64), config.SCREEN_HEIGHT * 100)
+        x0 = (columns * config.RENDER_SCALE_FACTOR).astype(np.float32)
+        x1 = x0 + config.RENDER_SCALE_FACTOR
+        y0 = (-line_height // 2 + config.SCREEN_HEIGHT // 2).astype(np.float32)
+        y1 = y0 + line_height
+        tex_x = batch.tex_x[columns].astype(np.float32)
+        shade = np.where(batch.side[columns] == 1, SIDE_SHADE, 255).astype(np.uint8)
+
+        # Group columns by wall texture
+        wall_ids = batch.wall_id[columns]
+        order = np.argsort(wall_ids, kind="stable")
+        unique_ids, group_starts, group_counts = np.unique(wall_ids[order], return_index=True, return_counts=True)
+
+        material = self._get_material()
+        pr.rl_draw_render_batch_active() # Flush pending 2D draws (floor/ceiling) so walls land on top
+        pr.rl_disable_backface_culling() # Screen-space quads; winding flips with the Y-down projection
+
+        for wall_id, start, count in zip(unique_ids.tolist(), group_starts.tolist(), group_counts.tolist()):
+            texture = assets_manager.get_wall_texture(wall_id)
+            sel = order[start:start + count]
+            texture_mesh = self._get_mesh(wall_id)
+
+            # Quad corners: top-left, bottom-left, bottom-right, top-right
+            vertices = texture_mesh.vertices
+            vertices[:count, 0, 0] = x0[sel]; vertices[:count, 0, 1] = y0[sel]
+            vertices[:count, 1, 0] = x0[sel]; vertices[:count, 1, 1] = y1[sel]
+            vertices[:count, 2, 0] = x1[sel]; vertices[:count, 2, 1] = y1[sel]
+            vertices[:count, 3, 0] = x1[sel]; vertices[:count, 3, 1] = y0[sel]
+
+            # One-texel-wide source column, full texture height
+            u0 = tex_x[sel] / texture.width
+            u1 = (tex_x[sel] + 1.0) / texture.width
+            texcoords = texture_mesh.texcoords
+            texcoords[:count, 0, 0] = u0; texcoords[:count, 0, 1] = 0.0
+            texcoords[:count, 1, 0] = u0; texcoords[:count, 1, 1] = 1.0
+            texcoords[:count, 2, 0] = u1; texcoords[:count, 2, 1] = 1.0
+            texcoords[:count, 3, 0] = u1; texcoords[:count, 3, 1] = 0.0
+
+            texture_mesh.colors[:count, :, :3] = shade[sel][:, None, None]
+
+            texture_mesh.update(count)
+            material.maps[pr.MATERIAL_MAP_ALBEDO].texture = texture
+            pr.draw_mesh(texture_mesh.mesh, material, self._transform)
+
+        pr.rl_enable_backface_culling()
+
+    def unload(self):
+        """Releases the GPU meshes and material."""
+        for texture_mesh in self._meshes.values():
+            texture_mesh.unload()
+        self._meshes.clear()
+        if self._material is not None:
+            # Hand the material its default texture back so the wall texture isn't unloaded with it
+            self._material.maps[pr.MATERIAL_MAP_ALBEDO].texture = self._default_texture
+            pr.unload_material(self._material)
+            self._material = None
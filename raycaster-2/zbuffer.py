@@ -0,0 +1,57 @@
+# zbuffer.py
+# Per-screen-column wall depth used to occlude sprites
+import numpy as np
+import config
+from typing import List, Tuple
+from raycast import RayBatch
+
+class ZBuffer:
+    """
+    Preallocated float32 depth per screen column.
+    Written once per frame from the ray-cast results and queried per sprite
+    with vectorized comparisons instead of per-stripe lookups.
+    """
+    def __init__(self, width: int = config.SCREEN_WIDTH, max_depth: float = config.MAX_RENDER_DEPTH,
+                 scale: int = config.RENDER_SCALE_FACTOR):
+        self.width = width
+        self.max_depth = max_depth
+        self.scale = scale # Screen columns covered by each ray
+        self.depth = np.full(width, max_depth, dtype=np.float32)
+
+    def reset(self):
+        """Clears every column to the maximum depth."""
+        self.depth.fill(self.max_depth)
+
+    def fill(self, batch: RayBatch):
+        """Writes the wall distance of every ray into the columns it covers (misses stay at max depth)."""
+        num_columns = min(self.width, len(batch) * self.scale)
+        ray_depth = np.where(batch.hit, np.maximum(0.01, batch.dist), self.max_depth) # Clamp distance to prevent issues
+        # View the first columns as (rays, scale) so each ray's depth is broadcast over its columns in one write
+        full_rays = num_columns // self.scale
+        self.depth[:full_rays * self.scale].reshape(full_rays, self.scale)[:] = ray_depth[:full_rays, None]
+        if num_columns > full_rays * self.scale: # Partial last ray
+            self.depth[full_rays * self.scale:num_columns] = ray_depth[full_rays]
+        self.depth[num_columns:] = self.max_depth
+
+    def visible_mask(self, x_start: int, x_end: int, depth: float) -> np.ndarray:
+        """Boolean mask over columns x_start..x_end (clamped to the screen) where `depth` is in front of the walls."""
+        x_start, x_end = max(0, x_start), min(self.width, x_end)
+        if x_end <= x_start:
+            return np.zeros(0, dtype=bool)
+        return depth < self.depth[x_start:x_end]
+
+    def visible_spans(self, x_start: int, x_end: int, depth: float) -> List[Tuple[int, int]]:
+        """Returns the [start, end) column runs within x_start..x_end where `depth` is in front of the walls."""
+        x_start = max(0, x_start)
+        visible = self.visible_mask(x_start, x_end, depth)
+        if visible.size == 0:
+            return []
+        # Run boundaries are where visibility flips; pad with False so every run has both edges
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], visible, [False])).astype(np.int8)))
+        return [(x_start + a, x_start + b) for a, b in zip(edges[0::2].tolist(), edges[1::2].tolist())]
+
+    def __getitem__(self, index):
+        return self.depth[index]
+
+    def __len__(self) -> int:
+        return self.width